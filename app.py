@@ -91,6 +91,14 @@ def parse_story_and_choices(response_text):
     is_the_end = "the end" in story_part.lower() and not choices
     return story_part, choices, is_the_end
 
+def add_assistant_message(content):
+    """
+    Appends the AI's response to the history and parses it once.
+    Reruns render from the parsed segments instead of re-parsing the whole story.
+    """
+    st.session_state.messages.append({"role": "assistant", "content": content})
+    st.session_state.segments.append(parse_story_and_choices(content))
+
 # --- STREAMLIT UI ---
 
 st.set_page_config(page_title=f"{child_info.get('name', 'My')}'s Story Weaver", layout="centered")
@@ -103,14 +111,14 @@ if 'story_started' not in st.session_state:
     st.session_state.story_started = False
 if 'game_over' not in st.session_state:
     st.session_state.game_over = False
+if 'segments' not in st.session_state:
+    st.session_state.segments = []
 
 # This loop now handles ALL story text rendering.
 # It iterates through the history and builds the storybook chronologically.
 if st.session_state.story_started:
-    for message in st.session_state.messages:
-        if message["role"] == "assistant":
-            story_part, _, _ = parse_story_and_choices(message["content"])
-            st.markdown(story_part)
+    for story_part, _, _ in st.session_state.segments:
+        st.markdown(story_part)
 
 # Main application logic
 if not st.session_state.game_over:
@@ -121,15 +129,14 @@ if not st.session_state.game_over:
         
         with st.spinner("Thinking of a magical adventure..."):
             initial_response = get_ai_response(st.session_state.messages)
-            st.session_state.messages.append({"role": "assistant", "content": initial_response})
+            add_assistant_message(initial_response)
         
         st.session_state.story_started = True
         st.rerun()
 
     else:
-        # Get the latest response to parse for choices
-        last_response = st.session_state.messages[-1]["content"]
-        _, choices, is_the_end = parse_story_and_choices(last_response)
+        # The latest response was parsed when it arrived
+        _, choices, is_the_end = st.session_state.segments[-1]
         
         # --- BUG FIX ---
         # The redundant st.markdown(story_part) call that was here has been REMOVED.
@@ -148,7 +155,7 @@ if not st.session_state.game_over:
                     st.session_state.messages.append({"role": "user", "content": choice})
                     with st.spinner("Turning the page..."):
                         new_story_part = get_ai_response(st.session_state.messages)
-                        st.session_state.messages.append({"role": "assistant", "content": new_story_part})
+                        add_assistant_message(new_story_part)
                     st.rerun()
 
 # Offer a way to restart the story
@@ -156,6 +163,7 @@ if st.session_state.game_over:
     if st.button("Start a New Adventure?"):
         # Reset the session state
         st.session_state.messages = []
+        st.session_state.segments = []
         st.session_state.story_started = False
         st.session_state.game_over = False
         st.rerun()
\ No newline at end of file
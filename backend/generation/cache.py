@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+from .config import CacheConfig, config as gen_config
+
+def cache_key(*parts) -> str:
+    """Builds a content address from the inputs that fully determine a media blob."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+def reference_digest(reference_image) -> str:
+    """
+    Returns a stable digest of a reference image.
+    The digest is memoized on the image object so a job hashes its photo only once.
+    """
+    if reference_image is None:
+        return ""
+    if hasattr(reference_image, "as_part"):
+        return reference_image.digest
+    digest = getattr(reference_image, "_story_digest", None)
+    if digest is None:
+        if isinstance(reference_image, Image.Image):
+            hasher = hashlib.sha256(f"{reference_image.mode}:{reference_image.size}".encode())
+            hasher.update(reference_image.tobytes())
+            digest = hasher.hexdigest()
+        else:
+            digest = hashlib.sha256(repr(reference_image).encode()).hexdigest()
+        try:
+            reference_image._story_digest = digest
+        except AttributeError:
+            pass
+    return digest
+
+class MediaCache:
+    """
+    A two-tier, content-addressed cache for generated media.
+    An in-memory LRU sits over a directory of blob files; both tiers are bounded
+    by total size and evict their least recently used entries first. Blob files
+    are read and written outside the lock, and the async `aget`/`aput` used on
+    the event loop do that file I/O in a thread.
+    """
+    def __init__(self, directory: str | None, memory_max_bytes: int, disk_max_bytes: int):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.evictions = {"memory": 0, "disk": 0}
+        if directory:
+            self._load_disk_index()
+
+    @classmethod
+    def from_config(cls, cache_config: CacheConfig) -> "MediaCache":
+        return cls(
+            cache_config.directory if cache_config.enabled else None,
+            cache_config.memory_max_mb * 1024 * 1024 if cache_config.enabled else 0,
+            cache_config.disk_max_mb * 1024 * 1024
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_disk_index(self):
+        """Rebuilds the disk LRU order from file modification times after a restart."""
+        entries = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions["memory"] += 1
+
+    def _memory_hit(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+            return data
+
+    def get(self, key: str) -> bytes | None:
+        data = self._memory_hit(key)
+        if data is not None:
+            return data
+        with self._lock:
+            on_disk = key in self._disk
+        # Another process sharing the directory may have cached it since the index was loaded
+        if self.directory and (on_disk or os.path.exists(self._path(key))):
+            try:
+                with open(self._path(key), "rb") as file:
+                    data = file.read()
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                data = None
+        with self._lock:
+            if data is None:
+                if key in self._disk:
+                    self._disk_bytes -= self._disk.pop(key)
+                self.misses += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            else:
+                self._disk[key] = len(data)
+                self._disk_bytes += len(data)
+            self._remember(key, data)
+            self.hits["disk"] += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        if not data:
+            return
+        with self._lock:
+            self._remember(key, data)
+            if not self.directory or key in self._disk or len(data) > self.disk_max_bytes:
+                return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Worker processes share the directory, and thread idents repeat across processes
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if key in self._disk:
+                return
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.disk_max_bytes:
+                evicted_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self.evictions["disk"] += 1
+                try:
+                    os.remove(self._path(evicted_key))
+                except FileNotFoundError:
+                    pass
+
+    async def aget(self, key: str) -> bytes | None:
+        """`get` for the event loop: a memory hit is returned at once, the disk tier is checked in a thread."""
+        data = self._memory_hit(key)
+        if data is not None or not self.directory:
+            if data is None:
+                with self._lock:
+                    self.misses += 1
+            return data
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, data: bytes):
+        """`put` for the event loop; the blob file is written in a thread."""
+        if not self.directory:
+            self.put(key, data)
+            return
+        await asyncio.to_thread(self.put, key, data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "evictions": dict(self.evictions),
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes
+            }
+
+media_cache = MediaCache.from_config(gen_config.cache)
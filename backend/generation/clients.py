@@ -0,0 +1,46 @@
+import importlib.util
+from functools import lru_cache
+
+import httpx
+from openai import AsyncOpenAI
+import google.generativeai as genai
+
+from .config import HttpPoolConfig, config as gen_config
+
+def is_async_client(client) -> bool:
+    """True for native async clients, whose calls are awaited instead of run in a thread."""
+    return isinstance(client, AsyncOpenAI) or getattr(client, "is_async", False)
+
+def build_http_client(pool: HttpPoolConfig) -> httpx.AsyncClient:
+    """
+    Builds the shared HTTP connection pool used by the async provider clients.
+    Connections are kept alive between calls, and HTTP/2 is used when the
+    optional `h2` package is installed.
+    """
+    return httpx.AsyncClient(
+        http2=pool.http2 and importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=pool.max_connections,
+            max_keepalive_connections=pool.max_keepalive_connections,
+            keepalive_expiry=pool.keepalive_expiry_seconds
+        ),
+        timeout=httpx.Timeout(pool.timeout_seconds, connect=pool.connect_timeout_seconds)
+    )
+
+def create_openai_client(api_key: str | None, base_url: str | None = None) -> AsyncOpenAI:
+    """
+    Creates the process-wide AsyncOpenAI client on top of the shared connection pool.
+    The SDK's own retries are turned off while the resilience layer retries calls,
+    so every retry is counted against its budget and seen by its circuit breakers.
+    """
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=build_http_client(gen_config.http),
+        max_retries=0 if gen_config.resilience.enabled else gen_config.http.max_retries
+    )
+
+@lru_cache(maxsize=None)
+def get_image_model(model_name: str) -> genai.GenerativeModel:
+    """Returns the image model object, built once per model name instead of per call."""
+    return genai.GenerativeModel(model_name)
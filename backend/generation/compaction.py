@@ -0,0 +1,82 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from openai import OpenAI, AsyncOpenAI
+
+from .config import config as gen_config
+from .generators import call_provider, estimate_tokens
+from .resilience import callers
+
+SUMMARY_PREFIX = "Story so far: "
+
+# Summaries are shared by every branch that grew out of the same older segments
+_summaries = OrderedDict()
+_MAX_SUMMARIES = 512
+
+def history_tokens(history: list) -> int:
+    return sum(len(str(message.get("content", ""))) for message in history) // 4
+
+def _split(history: list, keep_recent: int):
+    """Splits a history into the system prompt(s), the part to summarize and the recent turns."""
+    head = []
+    for message in history:
+        if message["role"] != "system" or message["content"].startswith(SUMMARY_PREFIX):
+            break
+        head.append(message)
+    body = history[len(head):]
+    cut = max(0, len(body) - keep_recent)
+    # Never separate a choice from the segment that answers it
+    while 0 < cut < len(body) and body[cut]["role"] == "assistant":
+        cut -= 1
+    return head, body[:cut], body[cut:]
+
+async def summarize(client: OpenAI | AsyncOpenAI, messages: list) -> str:
+    key = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+    if key in _summaries:
+        _summaries.move_to_end(key)
+        return _summaries[key]
+
+    transcript = "\n".join(
+        f"{'Storyteller' if message['role'] == 'assistant' else 'Child' if message['role'] == 'user' else 'Notes'}: {message['content']}"
+        for message in messages
+    )
+    request = [
+        {"role": "system", "content": gen_config.compaction.summary_prompt},
+        {"role": "user", "content": transcript},
+    ]
+    response = await callers["openai_text"].call(
+        lambda: call_provider(
+            client,
+            client.chat.completions.create,
+            model=gen_config.providers.openai.text_model,
+            messages=request,
+            temperature=0.2
+        ),
+        tokens=estimate_tokens(request)
+    )
+    summary = response.choices[0].message.content.strip()
+    _summaries[key] = summary
+    while len(_summaries) > _MAX_SUMMARIES:
+        _summaries.popitem(last=False)
+    return summary
+
+async def compact_history(client: OpenAI | AsyncOpenAI, history: list) -> list:
+    """
+    Keeps a story's prompt roughly flat in size. Once the history is over the
+    token budget, every turn except the system prompt and the most recent
+    exchanges is replaced by a short summary. On failure the history is
+    returned unchanged, so compaction can never break a story.
+    """
+    settings = gen_config.compaction
+    if not settings.enabled or history_tokens(history) <= settings.threshold_tokens:
+        return history
+    head, older, recent = _split(history, settings.keep_recent_messages)
+    if not older:
+        return history
+    try:
+        summary = await summarize(client, older)
+    except Exception as e:
+        print(f"WARNING: History compaction failed, sending the full history: {e}")
+        return history
+    return head + [{"role": "system", "content": SUMMARY_PREFIX + summary}] + recent
@@ -1,6 +1,11 @@
+import os
+
 import yaml
 from pydantic import BaseModel
 
+CONFIG_FILE = "generator_config.yaml"
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 class OpenAIConfig(BaseModel):
     text_model: str
     tts_model: str
@@ -12,12 +17,183 @@ class ProvidersConfig(BaseModel):
     openai: OpenAIConfig
     google: GoogleConfig
 
+class CacheConfig(BaseModel):
+    enabled: bool = True
+    directory: str = ".cache/media"
+    memory_max_mb: int = 64
+    disk_max_mb: int = 1024
+
+class StorageConfig(BaseModel):
+    media_directory: str = ".cache/blobs"
+
+class JobsConfig(BaseModel):
+    directory: str = ".cache/jobs"
+    max_memory_mb: int = 128
+    spill_threshold_kb: int = 256
+    pending_ttl_seconds: int = 900
+    finished_ttl_seconds: int = 6 * 3600
+    prune_interval_seconds: int = 60
+    coalesce_window_seconds: int = 120
+
+class ProviderLimitConfig(BaseModel):
+    max_concurrency: int = 8
+    min_concurrency: int = 1
+    initial_concurrency: int | None = None
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    latency_target_seconds: float = 30.0
+
+class LimitsConfig(BaseModel):
+    thread_pool_size: int = 64
+    openai_text: ProviderLimitConfig = ProviderLimitConfig()
+    openai_tts: ProviderLimitConfig = ProviderLimitConfig()
+    gemini_image: ProviderLimitConfig = ProviderLimitConfig(max_concurrency=4)
+
+class HttpPoolConfig(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry_seconds: float = 30.0
+    timeout_seconds: float = 120.0
+    connect_timeout_seconds: float = 10.0
+    http2: bool = True
+    # SDK-level retries, used only when resilience is disabled
+    max_retries: int = 2
+
+class ReferenceImageConfig(BaseModel):
+    size: int = 768
+    format: str = "JPEG"
+    quality: int = 90
+
+class SessionsConfig(BaseModel):
+    ttl_seconds: int = 21600
+    max_sessions: int = 10000
+
+class CompactionConfig(BaseModel):
+    enabled: bool = True
+    threshold_tokens: int = 3000
+    keep_recent_messages: int = 4
+    summary_prompt: str = (
+        "Summarize this bedtime story so far in a short paragraph for the storyteller who continues it. "
+        "Keep the names of the characters, the places visited, important objects and any open story threads."
+    )
+
+class TtsConfig(BaseModel):
+    sentence_chunks: bool = True
+    min_chunk_chars: int = 60
+
+class RenditionsConfig(BaseModel):
+    enabled: bool = True
+    format: str = "WEBP"
+    quality: int = 80
+    # Longest side in pixels per asset slot
+    sizes: dict[str, int] = {"main_illustration": 700, "choice_image": 250}
+    process_workers: int = 2
+
+class StreamingConfig(BaseModel):
+    # Start each asset's media as soon as the streamed text settles it
+    early_media: bool = True
+
+class PrerenderConfig(BaseModel):
+    output_directory: str = "prerendered"
+    depth: int = 3
+    max_nodes: int = 40
+    max_provider_calls: int = 400
+    concurrency: int = 4
+
+class ReplayConfig(BaseModel):
+    # A story pack to serve instead of generating; no provider is called in replay mode
+    pack_path: str | None = None
+
+class QueueConfig(BaseModel):
+    # Off: jobs run inside the API process. On: the API enqueues them and `worker.py` processes run them
+    enabled: bool = False
+    path: str = ".cache/queue.sqlite3"
+    lease_seconds: float = 15.0
+    heartbeat_seconds: float = 1.0
+    max_attempts: int = 3
+    poll_interval_seconds: float = 0.1
+    # Streamed tokens are written to the shared file in one transaction per this interval
+    token_flush_seconds: float = 0.1
+    worker_concurrency: int = 8
+    # worker.py processes sharing the providers; each takes this share of every provider limit
+    workers: int = 1
+
+class ProfilesConfig(BaseModel):
+    # The default child profile, plus one <profile id>.yaml per child in the directory
+    default_path: str = "../frontend/config.yaml"
+    directory: str = "../frontend/profiles"
+    # How often config files are checked for changes; edits apply without a restart
+    reload_interval_seconds: float = 2.0
+
+class ResilienceConfig(BaseModel):
+    enabled: bool = True
+    # Send a duplicate call once the first has run longer than this quantile of recent calls
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    latency_window: int = 200
+    max_attempts: int = 3
+    backoff_base_seconds: float = 0.5
+    backoff_max_seconds: float = 8.0
+    # Retries and hedges together, as a share of first attempts across all providers
+    retry_budget_ratio: float = 0.1
+    retry_budget_burst: float = 10.0
+    breaker_failure_threshold: int = 5
+    breaker_open_seconds: float = 30.0
+
+class DeadlinesConfig(BaseModel):
+    # A page completes once every asset is ready or past its deadline; late images get placeholder
+    # art, and late assets are swapped into the stored result when they finish
+    enabled: bool = True
+    # Seconds from the start of a job, per asset class; a class left out is waited for
+    seconds: dict[str, float] = {
+        "narration": 60.0, "narration_chunk": 60.0, "main_illustration": 40.0, "choice_audio": 60.0, "choice_image": 30.0,
+    }
+
+class IconsConfig(BaseModel):
+    # Draw all of a page's choice icons in one image call and slice the sheet; off: one call per icon
+    sheet: bool = True
+    # Pages with more choices than this draw their icons one by one
+    max_panels: int = 4
+
 class GenerationConfig(BaseModel):
     providers: ProvidersConfig
     story_prompt: str
+    cache: CacheConfig = CacheConfig()
+    storage: StorageConfig = StorageConfig()
+    jobs: JobsConfig = JobsConfig()
+    limits: LimitsConfig = LimitsConfig()
+    http: HttpPoolConfig = HttpPoolConfig()
+    reference_image: ReferenceImageConfig = ReferenceImageConfig()
+    sessions: SessionsConfig = SessionsConfig()
+    compaction: CompactionConfig = CompactionConfig()
+    tts: TtsConfig = TtsConfig()
+    renditions: RenditionsConfig = RenditionsConfig()
+    streaming: StreamingConfig = StreamingConfig()
+    prerender: PrerenderConfig = PrerenderConfig()
+    replay: ReplayConfig = ReplayConfig()
+    queue: QueueConfig = QueueConfig()
+    profiles: ProfilesConfig = ProfilesConfig()
+    resilience: ResilienceConfig = ResilienceConfig()
+    deadlines: DeadlinesConfig = DeadlinesConfig()
+    icons: IconsConfig = IconsConfig()
 
-def load_config(path: str = "generator_config.yaml") -> GenerationConfig:
+def config_path(path: str = CONFIG_FILE) -> str:
+    """
+    Finds the config file: $STORY_GENERATOR_CONFIG if set, else the working
+    directory as before, else next to the backend package, so scripts and
+    workers started from another directory still find it.
+    """
+    override = os.getenv("STORY_GENERATOR_CONFIG")
+    if override:
+        return override
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    return os.path.join(BACKEND_DIR, path)
+
+def load_config(path: str | None = None) -> GenerationConfig:
     """Loads the generation configuration from a YAML file."""
+    path = path or config_path()
     try:
         with open(path, 'r') as file:
             data = yaml.safe_load(file)
@@ -27,5 +203,34 @@ def load_config(path: str = "generator_config.yaml") -> GenerationConfig:
     except Exception as e:
         raise Exception(f"Error parsing configuration file: {e}")
 
+def _file_version(path: str) -> tuple | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
 # Load the config once on startup
-config = load_config()
\ No newline at end of file
+config = load_config()
+_loaded = {"path": config_path(), "version": _file_version(config_path())}
+
+def refresh_config() -> bool:
+    """
+    Re-reads the config file if it changed since it was loaded. The shared
+    `config` object is updated in place, so every module that imported it sees
+    the new values; settings only read at startup (pools, limits) keep theirs.
+    A file that fails to parse is reported and the running config is kept.
+    """
+    version = _file_version(_loaded["path"])
+    if version is None or version == _loaded["version"]:
+        return False
+    _loaded["version"] = version
+    try:
+        fresh = load_config(_loaded["path"])
+    except Exception as e:
+        print(f"WARNING: Keeping the running config: {e}")
+        return False
+    for name in GenerationConfig.model_fields:
+        setattr(config, name, getattr(fresh, name))
+    print(f"Reloaded {_loaded['path']}.")
+    return True
\ No newline at end of file
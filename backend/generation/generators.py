@@ -1,9 +1,24 @@
 import asyncio
 import re
-from openai import OpenAI
-import google.generativeai as genai
+import threading
+from contextlib import aclosing
+from functools import lru_cache
+from openai import OpenAI, AsyncOpenAI
 from PIL import Image
 from .config import GenerationConfig, config as gen_config
+from .cache import cache_key, media_cache, reference_digest
+from .clients import get_image_model, is_async_client
+from .reference import ReferenceImage
+from . import metrics
+from .resilience import EmptyResponse, callers
+from .scheduler import schedulers
+
+# Rough allowance for the completion when estimating a text call's token cost
+_EXPECTED_COMPLETION_TOKENS = 400
+
+def estimate_tokens(history: list) -> int:
+    """Cheap token estimate (about 4 characters per token) used for TPM limiting."""
+    return sum(len(str(message.get("content", ""))) for message in history) // 4 + _EXPECTED_COMPLETION_TOKENS
 
 # --- Text Generation ---
 def parse_story_and_choices(response_text: str):
@@ -33,60 +48,247 @@ def parse_story_and_choices(response_text: str):
     cleaned_choices = [choice.strip() for choice in choices]
     return narrative_part, cleaned_choices
 
+_BRACKETED_CHOICE = re.compile(r'\[(.*?)\]')
+_NUMBERED_CHOICE = re.compile(r'^\s*\d+[\.\)]\s*(.*)', re.MULTILINE)
+
+class StoryStreamParser:
+    """
+    Incremental version of `parse_story_and_choices` for a streamed response.
+    `feed` returns events as soon as they are certain: ("narrative", text) once
+    the narrative section has closed, and ("choice", index, text) for every
+    completed [bracketed] choice or finished numbered line. `finish` returns
+    the authoritative (narrative, choices) from the full text, so callers can
+    reconcile anything that was emitted early.
+    """
+    def __init__(self):
+        self.text = ""
+        self.narrative = None
+        self.choices = []
+        self._bracket_cursor = 0
+        self._line_cursor = 0
+
+    def feed(self, delta: str) -> list[tuple]:
+        self.text += delta
+        events = []
+        if "[" in self.text:
+            # Bracketed format: the narrative is everything before the first bracket.
+            # A match in the partial text is final: an earlier bracket that has not
+            # matched yet can never match once a later one has.
+            if self.narrative is None:
+                events.append(self._narrative(self.text.split("[", 1)[0]))
+            for match in _BRACKETED_CHOICE.finditer(self.text, self._bracket_cursor):
+                self._bracket_cursor = match.end()
+                events.append(self._choice(match.group(1)))
+        else:
+            # Numbered format, judged on complete lines only
+            complete = self.text[:self.text.rfind("\n") + 1]
+            for match in _NUMBERED_CHOICE.finditer(complete, self._line_cursor):
+                if match.end() >= len(complete):
+                    break
+                if self.narrative is None:
+                    events.append(self._narrative(complete[:match.start()]))
+                self._line_cursor = match.end()
+                events.append(self._choice(match.group(1)))
+        return events
+
+    def finish(self) -> tuple[str, list[str], list[tuple]]:
+        """Parses the full text and returns (narrative, choices, events not emitted yet)."""
+        narrative, choices = parse_story_and_choices(self.text)
+        events = []
+        if self.narrative != narrative:
+            events.append(self._narrative(narrative))
+        for i, choice in enumerate(choices):
+            if i >= len(self.choices) or self.choices[i] != choice:
+                events.append(("choice", i, choice))
+        return narrative, choices, events
+
+    def _narrative(self, text: str) -> tuple:
+        self.narrative = text.strip()
+        return ("narrative", self.narrative)
+
+    def _choice(self, text: str) -> tuple:
+        self.choices.append(text.strip())
+        return ("choice", len(self.choices) - 1, self.choices[-1])
+
+@lru_cache(maxsize=256)
+def _format_story_prompt(template: str, age, name: str, details: str) -> str:
+    return template.format(age=age, name=name, details=details)
+
 def get_story_prompt(app_config: dict) -> str:
-    """Builds the system prompt from the configuration."""
+    """
+    Builds the system prompt from the configuration. The formatted prompt is
+    memoized per template and child, so a reloaded template takes effect at once.
+    """
     child_info = app_config.get("child_info", {})
     personalization = app_config.get("personalization", {})
     details = ", ".join(
         f"{key.replace('_', ' ')} is {value}" for key, value in personalization.items() if value
     )
-    return gen_config.story_prompt.format(
-        age=child_info.get('age', 5),
-        name=child_info.get('name', 'Friend'),
-        details=details
-    )
+    return _format_story_prompt(gen_config.story_prompt, child_info.get('age', 5), child_info.get('name', 'Friend'), details)
+
+async def call_provider(client, method, **kwargs):
+    """
+    Calls an SDK method: awaited directly on native async clients, or run in a
+    worker thread for the synchronous clients the test scripts still use.
+    """
+    if is_async_client(client):
+        return await method(**kwargs)
+    return await asyncio.to_thread(method, **kwargs)
 
-async def generate_story_text(client: OpenAI, history: list):
+async def generate_story_text(client: OpenAI | AsyncOpenAI, history: list):
     """Generates the next story segment using the configured text model."""
-    response = await asyncio.to_thread(
-        client.chat.completions.create,
-        model=gen_config.providers.openai.text_model,
-        messages=history,
-        temperature=0.8
+    response = await callers["openai_text"].call(
+        lambda: call_provider(
+            client,
+            client.chat.completions.create,
+            model=gen_config.providers.openai.text_model,
+            messages=history,
+            temperature=0.8
+        ),
+        tokens=estimate_tokens(history)
     )
     return response.choices[0].message.content
 
+_STREAM_END = object()
+
+async def generate_story_text_stream(client: OpenAI | AsyncOpenAI, history: list):
+    """
+    Streams the next story segment, yielding text deltas as the model emits them.
+    A stream that fails before its first token is retried.
+    """
+    async with aclosing(callers["openai_text"].stream(lambda: _stream_story_text(client, history))) as deltas:
+        async for delta in deltas:
+            yield delta
+
+async def _stream_story_text(client: OpenAI | AsyncOpenAI, history: list):
+    """
+    Async clients are iterated directly; a synchronous SDK stream is consumed in
+    a worker thread and handed over to the event loop through a queue. If the
+    consumer stops early (e.g. the job is cancelled) the HTTP stream is closed
+    so no more tokens are billed.
+    """
+    if is_async_client(client):
+        async with schedulers["openai_text"].slot(tokens=estimate_tokens(history)):
+            stream = await client.chat.completions.create(
+                model=gen_config.providers.openai.text_model,
+                messages=history,
+                temperature=0.8,
+                stream=True
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def consume_stream():
+        try:
+            stream = client.chat.completions.create(
+                model=gen_config.providers.openai.text_model,
+                messages=history,
+                temperature=0.8,
+                stream=True
+            )
+            for chunk in stream:
+                if stop.is_set():
+                    if hasattr(stream, "close"):
+                        stream.close()
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.choices[0].delta.content)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+    async with schedulers["openai_text"].slot(tokens=estimate_tokens(history)):
+        producer = asyncio.create_task(asyncio.to_thread(consume_stream))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+        await producer
+
 # --- Audio Generation ---
 
-async def generate_audio_bytes(client: OpenAI, text: str, voice: str) -> bytes:
+async def generate_audio_bytes(client: OpenAI | AsyncOpenAI, text: str, voice: str) -> bytes:
     """Generates audio from text using the configured TTS model."""
-    response = await asyncio.to_thread(
-        client.audio.speech.create,
-        model=gen_config.providers.openai.tts_model,
-        voice=voice,
-        input=text
+    model = gen_config.providers.openai.tts_model
+    key = cache_key("tts", model, voice, text)
+    cached = await media_cache.aget(key)
+    if cached is not None:
+        return cached
+
+    response = await callers["openai_tts"].call(
+        lambda: call_provider(
+            client,
+            client.audio.speech.create,
+            model=model,
+            voice=voice,
+            input=text
+        ),
+        tokens=len(text)
     )
+    metrics.provider_bytes_total.inc(len(response.content), provider="openai_tts")
+    await media_cache.aput(key, response.content)
     return response.content
 
 # --- Image Generation ---
 
-async def generate_image_bytes(prompt: str, reference_image: Image, high_quality: bool = False) -> bytes:
-    """Generates an image from a prompt using the configured image model."""
-    model = genai.GenerativeModel(gen_config.providers.google.image_model)
+# Asks the image model to keep the child recognizable in every picture
+LIKENESS_PROMPT = "The main character should look like the person in the provided image especially the face, the eyes, the nose, the chin should be recognizable."
 
-    full_prompt = f"{prompt}. The main character should look like the person in the provided image especially the face, the eyes, the nose, the chin should be recognizable."
+async def generate_image_bytes(prompt: str, reference_image: ReferenceImage | Image.Image, high_quality: bool = False) -> bytes:
+    """
+    Generates an image from a prompt using the configured image model.
+    A prepared ReferenceImage is uploaded as-is; a PIL image is encoded by the SDK.
+    """
+    full_prompt = f"{prompt}. {LIKENESS_PROMPT}"
     if high_quality:
         full_prompt += " A beautiful, high-quality, square (1:1) storybook illustration in a whimsical, gentle art style."
     else:
         full_prompt += " A small, square (1:1), simple, clear, cute icon on a plain white background."
+    return await request_image(full_prompt, reference_image, ("image", high_quality, prompt))
+
+async def request_image(full_prompt: str, reference_image: ReferenceImage | Image.Image, key_parts: tuple) -> bytes:
+    """
+    Makes one image call with the reference photo. The result is cached under
+    `key_parts` (what the prompt was built from), the model and the photo.
+    """
+    model_name = gen_config.providers.google.image_model
+    key = cache_key(key_parts[0], model_name, *key_parts[1:], reference_digest(reference_image))
+    cached = await media_cache.aget(key)
+    if cached is not None:
+        return cached
 
-    response = await asyncio.to_thread(model.generate_content, [full_prompt, reference_image])
+    model = get_image_model(model_name)
+    reference_part = reference_image.as_part() if isinstance(reference_image, ReferenceImage) else reference_image
 
-    if response.candidates:
-        for candidate in response.candidates:
+    async def request() -> bytes:
+        response = await model.generate_content_async([full_prompt, reference_part])
+        for candidate in response.candidates or []:
             if candidate.content and candidate.content.parts:
                 for part in candidate.content.parts:
                     if part.inline_data:
                         return part.inline_data.data
+        # Checked inside the call, so an empty answer is retried or beaten by a hedge
+        raise EmptyResponse("No image data found in the API response.")
 
-    raise ValueError("No image data found in the API response.")
\ No newline at end of file
+    data = await callers["gemini_image"].call(request)
+    metrics.provider_bytes_total.inc(len(data), provider="gemini_image")
+    await media_cache.aput(key, data)
+    return data
@@ -0,0 +1,113 @@
+import asyncio
+import math
+from io import BytesIO
+
+from PIL import Image
+
+from .generators import LIKENESS_PROMPT, request_image
+from .reference import ReferenceImage
+
+# Grey level above which a pixel counts as the white background
+_BACKGROUND_LEVEL = 235
+# How far from the even split a gutter is looked for, as a share of a panel
+_GUTTER_SEARCH = 0.2
+# Share of drawn pixels allowed along a cut between panels
+_MAX_GUTTER_INK = 0.06
+# A panel with less drawn on it is blank; an unused cell with more is an extra icon
+_MIN_PANEL_INK = 0.02
+_MAX_UNUSED_INK = 0.1
+_MIN_PANEL_PIXELS = 64
+# Trimmed off each side of a panel, so a grid line drawn along the gutter is left out
+_PANEL_INSET = 0.03
+
+class MalformedSheet(ValueError):
+    """The model's icon sheet does not split into the panels that were asked for."""
+
+def sheet_grid(count: int) -> int:
+    """Panels per side of the square grid that holds `count` icons."""
+    return max(1, math.ceil(math.sqrt(count)))
+
+def icon_sheet_prompt(choices: list[str]) -> str:
+    side = sheet_grid(len(choices))
+    panels = "; ".join(f"panel {i + 1}: {choice}" for i, choice in enumerate(choices))
+    unused = side * side - len(choices)
+    prompt = (
+        f"A square image divided into a {side} by {side} grid of equal square panels, with wide plain white "
+        f"gutters between them and no borders, lines, numbers or text. Reading left to right, top to bottom, "
+        f"each panel holds one small, simple, clear, cute icon on a plain white background: {panels}."
+    )
+    if unused:
+        prompt += f" Leave the last {unused} panel{'s' if unused > 1 else ''} completely white."
+    return f"{prompt} {LIKENESS_PROMPT}"
+
+def _ink(mask: Image.Image, box: tuple) -> float:
+    """Share of drawn pixels in a box of the mask."""
+    region = mask.crop(box)
+    return region.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0)) / 255
+
+def _profile(mask: Image.Image, size: tuple) -> list[float]:
+    """Share of drawn pixels per column (size (width, 1)) or per row (size (1, height))."""
+    return [value / 255 for value in mask.resize(size, Image.Resampling.BOX).getdata()]
+
+def _cuts(profile: list[float], side: int) -> list[int]:
+    """
+    Finds the gutters of a sheet along one axis: near each even split, the
+    line with the least drawn on it, which must be close to empty.
+    """
+    panel = len(profile) / side
+    cuts = [0]
+    for k in range(1, side):
+        expected = round(k * panel)
+        reach = max(1, int(panel * _GUTTER_SEARCH))
+        window = range(max(cuts[-1] + 1, expected - reach), min(len(profile) - 1, expected + reach) + 1)
+        best = min(window, key=lambda i: (profile[i], abs(i - expected)))
+        if profile[best] > _MAX_GUTTER_INK:
+            raise MalformedSheet(f"no gutter near {expected}px; the icons run into each other")
+        cuts.append(best)
+    return cuts + [len(profile)]
+
+def slice_icon_sheet(data: bytes, count: int) -> list[bytes]:
+    """
+    Cuts an icon sheet into `count` PNG icons in reading order. The gutters are
+    located from where nothing is drawn rather than assumed, and the sheet is
+    rejected if a cut crosses a drawing, a panel is blank or an unused cell is not.
+    """
+    side = sheet_grid(count)
+    try:
+        with Image.open(BytesIO(data)) as opened:
+            sheet = opened.convert("RGB")
+    except OSError as e:
+        raise MalformedSheet(f"the sheet is not an image: {e}")
+    width, height = sheet.size
+    if min(width, height) < side * _MIN_PANEL_PIXELS:
+        raise MalformedSheet(f"a {width}x{height} sheet is too small for {side}x{side} panels")
+    mask = sheet.convert("L").point(lambda level: 255 if level < _BACKGROUND_LEVEL else 0)
+    columns = _cuts(_profile(mask, (width, 1)), side)
+    rows = _cuts(_profile(mask, (1, height)), side)
+
+    icons = []
+    for cell in range(side * side):
+        left, right = columns[cell % side], columns[cell % side + 1]
+        top, bottom = rows[cell // side], rows[cell // side + 1]
+        inset_x, inset_y = int((right - left) * _PANEL_INSET), int((bottom - top) * _PANEL_INSET)
+        box = (left + inset_x, top + inset_y, right - inset_x, bottom - inset_y)
+        ink = _ink(mask, box)
+        if cell >= count:
+            if ink > _MAX_UNUSED_INK:
+                raise MalformedSheet(f"cell {cell + 1} should be empty; the sheet has more icons than choices")
+            continue
+        if ink < _MIN_PANEL_INK:
+            raise MalformedSheet(f"panel {cell + 1} is blank")
+        buffer = BytesIO()
+        sheet.crop(box).save(buffer, format="PNG")
+        icons.append(buffer.getvalue())
+    return icons
+
+async def generate_icon_sheet(choices: list[str], reference_image: ReferenceImage | Image.Image) -> list[bytes]:
+    """
+    Draws every choice icon of a page in one image call and slices the sheet,
+    so the reference photo is uploaded once instead of once per choice.
+    Raises MalformedSheet if the sheet cannot be sliced; callers fall back to one call per icon.
+    """
+    data = await request_image(icon_sheet_prompt(choices), reference_image, ("icon_sheet", tuple(choices)))
+    return await asyncio.to_thread(slice_icon_sheet, data, len(choices))
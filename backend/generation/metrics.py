@@ -0,0 +1,113 @@
+import math
+from collections import defaultdict
+
+# Latency buckets in seconds, from cache-speed lookups up to slow image calls
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: tuple, values: tuple, extra: dict | None = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in (extra or {}).items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        super().__init__(name, help_text, labels)
+        self.values = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.values[self._key(labels)] += amount
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+                break
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, {'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(round(series['sum'], 6))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series['count']}")
+        return lines
+
+# --- Story Pipeline Metrics ---
+
+story_stage_seconds = Histogram("story_stage_seconds", "Duration of each stage of a story job.", ("stage",))
+story_asset_seconds = Histogram("story_asset_seconds", "Time from the start of the media stage until an asset is stored.", ("asset", "outcome"))
+story_jobs_total = Counter("story_jobs_total", "Story jobs by final status.", ("status",))
+
+provider_queue_seconds = Histogram("provider_queue_seconds", "Time a provider call waited for a scheduler slot and rate-limit tokens.", ("provider",))
+provider_call_seconds = Histogram("provider_call_seconds", "Provider call latency while holding a slot.", ("provider", "outcome"))
+provider_calls_total = Counter("provider_calls_total", "Provider calls by outcome.", ("provider", "outcome"))
+provider_bytes_total = Counter("provider_bytes_total", "Bytes of media received from providers.", ("provider",))
+provider_resilience_total = Counter("provider_resilience_total", "Hedged calls, hedges that won, retries and calls refused by an open breaker.", ("provider", "action"))
+icon_sheets_total = Counter("icon_sheets_total", "Pages whose choice icons were sliced from one sheet, or drawn one by one after a bad sheet.", ("outcome",))
+circuit_breaker_open = Gauge("circuit_breaker_open", "1 while a provider's circuit breaker is open or probing.", ("provider",))
+
+scheduler_limit = Gauge("scheduler_concurrency_limit", "Current adaptive concurrency limit per provider.", ("provider",))
+scheduler_in_flight = Gauge("scheduler_in_flight", "Provider calls holding a slot.", ("provider",))
+scheduler_queued = Gauge("scheduler_queued", "Provider calls waiting for a slot.", ("provider",))
+media_cache_bytes = Gauge("media_cache_bytes", "Bytes held by the media cache.", ("tier",))
+
+REGISTRY = [
+    story_stage_seconds, story_asset_seconds, story_jobs_total,
+    provider_queue_seconds, provider_call_seconds, provider_calls_total, provider_bytes_total,
+    provider_resilience_total, circuit_breaker_open, icon_sheets_total,
+    scheduler_limit, scheduler_in_flight, scheduler_queued, media_cache_bytes,
+]
+
+def render_prometheus() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
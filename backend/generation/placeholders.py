@@ -0,0 +1,45 @@
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageColor, ImageDraw
+
+DEFAULT_THEME = "midnightblue"
+# Pixel size of the placeholder per image slot; audio has no placeholder
+SIZES = {"main_illustration": 512, "choice_image": 256}
+# The sky the theme colour is mixed into
+_NIGHT = (24, 28, 64)
+# Where the stars sit, as fractions of the side
+_STARS = ((0.18, 0.2), (0.8, 0.16), (0.84, 0.74), (0.16, 0.8), (0.68, 0.86))
+
+def theme_colour(app_config: dict) -> str:
+    """The child's favourite colour if PIL knows its name, else a night-sky blue."""
+    colour = str((app_config.get("personalization") or {}).get("favourite_colour") or "").strip().lower()
+    try:
+        ImageColor.getrgb(colour)
+    except ValueError:
+        return DEFAULT_THEME
+    return colour
+
+@lru_cache(maxsize=64)
+def render_placeholder(asset: str, theme: str = DEFAULT_THEME) -> bytes | None:
+    """
+    A generic picture for an image that missed its deadline: a crescent moon
+    and stars on a night sky tinted with the theme colour. Rendered once per slot and theme.
+    """
+    size = SIZES.get(asset)
+    if size is None:
+        return None
+    red, green, blue = ImageColor.getrgb(theme)[:3]
+    background = tuple(int(channel * 0.35 + night * 0.65) for channel, night in zip((red, green, blue), _NIGHT))
+    image = Image.new("RGB", (size, size), background)
+    draw = ImageDraw.Draw(image)
+    moon = (255, 243, 196)
+    radius, centre, shift = size * 0.26, size * 0.5, size * 0.11
+    draw.ellipse([centre - radius, centre - radius, centre + radius, centre + radius], fill=moon)
+    draw.ellipse([centre - radius + shift, centre - radius - shift, centre + radius + shift, centre + radius - shift], fill=background)
+    star = size * 0.025
+    for x, y in _STARS:
+        draw.ellipse([x * size - star, y * size - star, x * size + star, y * size + star], fill=moon)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
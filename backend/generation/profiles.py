@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import time
+
+import yaml
+
+from .config import config as gen_config
+from .generators import get_story_prompt
+
+DEFAULT_PROFILE = "default"
+
+class ChildProfile:
+    """
+    One child's frontend config, parsed once, with an ETag over its contents
+    and the system prompt built from it, rebuilt only when the template changes.
+    """
+    def __init__(self, profile_id: str, config: dict):
+        self.profile_id = profile_id
+        self.config = config
+        self.etag = '"' + hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:32] + '"'
+        self._prompt = None
+        self._prompt_template = None
+
+    @property
+    def system_prompt(self) -> str:
+        if self._prompt_template is not gen_config.story_prompt:
+            self._prompt = get_story_prompt(self.config)
+            self._prompt_template = gen_config.story_prompt
+        return self._prompt
+
+class ProfileRegistry:
+    """
+    The child profiles a backend serves: the default `config.yaml` plus one
+    `<profile id>.yaml` per child in the profiles directory. Files are parsed
+    when they change (by mtime and size), never on a lookup, so serving a
+    profile or its prompt costs a dict lookup.
+    """
+    def __init__(self, default_path: str, directory: str | None = None):
+        self.default_path = default_path
+        self.directory = directory
+        self._profiles = {}
+        self._versions = {}
+        self.errors = {}
+        self.checked_at = None
+        self.refresh()
+
+    def _files(self) -> dict:
+        files = {DEFAULT_PROFILE: self.default_path}
+        if self.directory and os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                stem, extension = os.path.splitext(name)
+                if extension in (".yaml", ".yml") and stem != DEFAULT_PROFILE:
+                    files[stem] = os.path.join(self.directory, name)
+        return files
+
+    def refresh(self) -> list[str]:
+        """Re-reads new and changed profile files and drops deleted ones. Returns the ids that changed."""
+        self.checked_at = time.time()
+        changed = []
+        files = self._files()
+        for profile_id in [profile_id for profile_id in self._profiles if profile_id not in files]:
+            del self._profiles[profile_id]
+            self._versions.pop(profile_id, None)
+            changed.append(profile_id)
+        for profile_id, path in files.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if self._profiles.pop(profile_id, None) is not None:
+                    changed.append(profile_id)
+                self._versions.pop(profile_id, None)
+                continue
+            version = (stat.st_mtime_ns, stat.st_size)
+            if self._versions.get(profile_id) == version:
+                continue
+            self._versions[profile_id] = version
+            try:
+                with open(path, "r") as file:
+                    config = yaml.safe_load(file) or {}
+            except Exception as e:
+                # A half-saved edit keeps the previous version of the profile
+                self.errors[profile_id] = str(e)
+                print(f"WARNING: Could not load profile {profile_id} from {path}: {e}")
+                continue
+            self.errors.pop(profile_id, None)
+            self._profiles[profile_id] = ChildProfile(profile_id, config)
+            changed.append(profile_id)
+        return changed
+
+    def get(self, profile_id: str = DEFAULT_PROFILE) -> ChildProfile | None:
+        return self._profiles.get(profile_id)
+
+    def etags(self) -> dict:
+        return {profile_id: profile.etag for profile_id, profile in self._profiles.items()}
+
+    @classmethod
+    def from_config(cls, profiles_config) -> "ProfileRegistry":
+        return cls(profiles_config.default_path, profiles_config.directory)
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from .config import ReferenceImageConfig, config as gen_config
+
+class ReferenceImage:
+    """
+    A child's reference photo, decoded once and prepared for upload:
+    EXIF-rotated, center-cropped to a square, downscaled to the size the
+    image model works at and encoded. Every image call shares these bytes.
+    """
+    def __init__(self, path: str, data: bytes, mime_type: str, size: tuple[int, int]):
+        self.path = path
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.digest = hashlib.sha256(data).hexdigest()
+
+    def as_part(self) -> dict:
+        """The inline-data form the Gemini SDK uploads without re-encoding."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+def prepare_reference_image(path: str, settings: ReferenceImageConfig) -> ReferenceImage:
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    # Crop to a square and downscale, but never upscale a small photo
+    side = min(settings.size, *image.size)
+    image = ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    if settings.format.upper() == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+        mime_type = "image/png"
+    else:
+        image.save(buffer, format="JPEG", quality=settings.quality)
+        mime_type = "image/jpeg"
+    return ReferenceImage(path, buffer.getvalue(), mime_type, image.size)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_MAX_CACHED_PHOTOS = 32
+
+def load_reference_image(path: str, settings: ReferenceImageConfig | None = None) -> ReferenceImage:
+    """
+    Returns the prepared reference image for a photo, keyed by path and mtime,
+    so a photo is only decoded again after the file changes.
+    """
+    settings = settings or gen_config.reference_image
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, settings.size, settings.format, settings.quality)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    prepared = prepare_reference_image(path, settings)
+    with _cache_lock:
+        _cache[key] = prepared
+        while len(_cache) > _MAX_CACHED_PHOTOS:
+            _cache.popitem(last=False)
+    return prepared
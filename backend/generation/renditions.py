@@ -0,0 +1,59 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from .config import RenditionsConfig, config as gen_config
+
+def make_rendition(data: bytes, size: int, image_format: str, quality: int) -> bytes:
+    """
+    Downscales an image to fit in a `size` square and re-encodes it for display.
+    Runs in a worker process, so it only takes and returns bytes.
+    """
+    with Image.open(BytesIO(data)) as original:
+        image = original.copy()
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if image_format.upper() == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format=image_format.upper(), quality=quality)
+    return buffer.getvalue()
+
+class RenditionPool:
+    """
+    Produces display renditions of generated images in a process pool, so the
+    CPU-heavy decode/resize/encode never runs on the event loop.
+    The pool is started on first use.
+    """
+    def __init__(self, settings: RenditionsConfig):
+        self.settings = settings
+        self._executor = None
+
+    @property
+    def extension(self) -> str:
+        return "jpg" if self.settings.format.upper() == "JPEG" else self.settings.format.lower()
+
+    def size_for(self, asset: str) -> int | None:
+        """The rendition size for an asset slot, or None if it is served as generated."""
+        if not self.settings.enabled:
+            return None
+        return self.settings.sizes.get(asset)
+
+    async def render(self, data: bytes, size: int) -> bytes:
+        if self._executor is None:
+            # Spawned, not forked: a fork of this threaded process can inherit a held lock and hang
+            self._executor = ProcessPoolExecutor(max_workers=self.settings.process_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, make_rendition, data, size, self.settings.format, self.settings.quality
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+renditions = RenditionPool(gen_config.renditions)
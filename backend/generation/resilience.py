@@ -0,0 +1,286 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import aclosing
+
+from . import metrics
+from .config import config as gen_config
+from .scheduler import is_rate_limited, schedulers
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+class EmptyResponse(ValueError):
+    """A provider answered without the media that was asked for; worth another try."""
+
+_TRANSIENT_ERRORS = (
+    "APITimeoutError", "APIConnectionError", "InternalServerError", "ServiceUnavailable",
+    "DeadlineExceeded", "RateLimitError", "ResourceExhausted", "TooManyRequests",
+)
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, dropped connections, 429s, 5xx and empty answers; not bad requests or auth errors."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (EmptyResponse, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "code", None)
+    if isinstance(status, int) and status >= 400:
+        return status in (408, 409, 429) or status >= 500
+    return type(error).__name__ in _TRANSIENT_ERRORS
+
+class LatencyWindow:
+    """The latencies of a provider's recent calls, for hedging at a high quantile of them."""
+    def __init__(self, size: int):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> float | None:
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class RetryBudget:
+    """
+    Extra calls, retries and hedges alike, allowed as a share of first
+    attempts. Every first attempt earns `ratio` of a call, up to `burst`
+    saved, so a failing provider can never multiply the load sent to it.
+    """
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` transient failures in a row and fails calls
+    fast for `open_seconds`. Then one probe call is let through: its success
+    closes the breaker, its failure opens it again.
+    """
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+class ResilientCaller:
+    """
+    Wraps one provider's calls in its scheduler slot with tail-latency and
+    failure handling: a duplicate call is hedged once the first has run past
+    the provider's recent p95, transient errors are retried with jittered
+    exponential backoff, and both draw on the shared retry budget. Settings
+    are read on every call, so they follow a reloaded config.
+    """
+    def __init__(self, name: str, budget: RetryBudget):
+        self.name = name
+        self.budget = budget
+        settings = gen_config.resilience
+        self.latencies = LatencyWindow(settings.latency_window)
+        self.breaker = CircuitBreaker(settings.breaker_failure_threshold, settings.breaker_open_seconds)
+        self.stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "retries": 0, "failures": 0,
+                      "short_circuited": 0, "budget_denied": 0}
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            metrics.provider_resilience_total.inc(provider=self.name, action="short_circuited")
+            raise CircuitOpenError(f"{self.name} is failing; not calling it for now")
+
+    async def _recover(self, error: Exception, attempt: int, settings):
+        """Books a failed attempt, then re-raises the error or waits out the backoff before a retry."""
+        retryable = is_retryable(error)
+        # Throttling is the scheduler's to handle and says nothing about the provider's health
+        if retryable and not is_rate_limited(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.probing = False
+        if not retryable or attempt + 1 >= settings.max_attempts:
+            self.stats["failures"] += 1
+            raise error
+        if not self.budget.withdraw():
+            self.stats["budget_denied"] += 1
+            self.stats["failures"] += 1
+            raise error
+        self.stats["retries"] += 1
+        metrics.provider_resilience_total.inc(provider=self.name, action="retry")
+        print(f"WARNING: {self.name} call failed ({error}); retrying (attempt {attempt + 2}).")
+        cap = min(settings.backoff_max_seconds, settings.backoff_base_seconds * 2 ** attempt)
+        await asyncio.sleep(random.uniform(0, cap))
+
+    async def call(self, make, tokens: float = 0):
+        """Runs `make()`, a coroutine factory for the provider call, and returns the first good result."""
+        settings = gen_config.resilience
+        if not settings.enabled:
+            return await self._attempt(make, tokens)
+        self.stats["calls"] += 1
+        self.budget.deposit()
+        for attempt in range(max(1, settings.max_attempts)):
+            self._admit()
+            try:
+                result = await self._hedged(make, tokens, settings)
+            except asyncio.CancelledError:
+                # A cancelled probe proves nothing either way
+                self.breaker.probing = False
+                raise
+            except Exception as e:
+                await self._recover(e, attempt, settings)
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def stream(self, open_stream):
+        """
+        Yields from `open_stream()`, an async generator factory. A stream that
+        fails before its first item is retried like a call; after that an error
+        is final. Streams are never hedged, which would pay for every token twice.
+        """
+        settings = gen_config.resilience
+        if not settings.enabled:
+            async with aclosing(open_stream()) as items:
+                async for item in items:
+                    yield item
+            return
+        self.stats["calls"] += 1
+        self.budget.deposit()
+        for attempt in range(max(1, settings.max_attempts)):
+            self._admit()
+            started = False
+            try:
+                async with aclosing(open_stream()) as items:
+                    async for item in items:
+                        started = True
+                        yield item
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.probing = False
+                raise
+            except Exception as e:
+                # Text already passed on cannot be taken back, so only a stream that never started is retried
+                await self._recover(e, settings.max_attempts - 1 if started else attempt, settings)
+            else:
+                self.breaker.record_success()
+                return
+
+    async def _attempt(self, make, tokens: float, started: asyncio.Event | None = None, race: dict | None = None):
+        """
+        One provider call in a scheduler slot. Its latency is recorded unless it
+        failed or was cancelled, except when it was cancelled for losing a hedge race.
+        """
+        async with schedulers[self.name].slot(tokens=tokens):
+            if started is not None:
+                started.set()
+            began = time.monotonic()
+            try:
+                result = await make()
+            except asyncio.CancelledError:
+                # A call that lost a hedge race was at least this slow; one cut off
+                # because its job was cancelled says nothing about the provider
+                if race is not None and race["decided"]:
+                    self.latencies.add(time.monotonic() - began)
+                raise
+        self.latencies.add(time.monotonic() - began)
+        return result
+
+    async def _hedged(self, make, tokens: float, settings):
+        started = asyncio.Event()
+        race = {"decided": False}
+        primary = asyncio.ensure_future(self._attempt(make, tokens, started, race))
+        tasks = [primary]
+        try:
+            delay = self.latencies.quantile(settings.hedge_quantile, settings.hedge_min_samples) if settings.hedge else None
+            if delay is None:
+                return await primary
+            # The clock starts once the call holds its slot; time spent queued is not the provider's
+            waiter = asyncio.ensure_future(started.wait())
+            tasks.append(waiter)
+            await asyncio.wait([primary, waiter], return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                await asyncio.wait([primary], timeout=delay)
+            if primary.done():
+                return primary.result()
+            if not self.budget.withdraw():
+                self.stats["budget_denied"] += 1
+                return await primary
+            self.stats["hedges"] += 1
+            metrics.provider_resilience_total.inc(provider=self.name, action="hedge")
+            hedge = asyncio.ensure_future(self._attempt(make, tokens, race=race))
+            tasks.append(hedge)
+            result = await self._first_success(primary, hedge)
+            race["decided"] = True
+            return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _first_success(self, primary, hedge):
+        """The result of whichever call succeeds first; an error only if both fail."""
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        self.stats["hedge_wins"] += 1
+                        metrics.provider_resilience_total.inc(provider=self.name, action="hedge_won")
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    def snapshot(self) -> dict:
+        calls = max(1, self.stats["calls"])
+        return {
+            **self.stats,
+            "hedge_rate": round(self.stats["hedges"] / calls, 4),
+            "retry_rate": round(self.stats["retries"] / calls, 4),
+            "hedge_after_seconds": self.latencies.quantile(gen_config.resilience.hedge_quantile, gen_config.resilience.hedge_min_samples),
+            "breaker": self.breaker.state,
+        }
+
+retry_budget = RetryBudget(gen_config.resilience.retry_budget_ratio, gen_config.resilience.retry_budget_burst)
+
+callers = {name: ResilientCaller(name, retry_budget) for name in schedulers}
+
+def resilience_stats() -> dict:
+    return {
+        "providers": {name: caller.snapshot() for name, caller in callers.items()},
+        "retry_budget": round(retry_budget.tokens, 2),
+    }
@@ -0,0 +1,204 @@
+import asyncio
+import contextvars
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+
+from . import metrics
+from .config import ProviderLimitConfig, config as gen_config
+
+INTERACTIVE = 0
+SPECULATIVE = 1
+
+class PriorityRef:
+    """
+    A job's scheduling priority. It is shared by reference so a speculative job
+    can be promoted to interactive while its calls are already queued.
+    """
+    def __init__(self, value: int = INTERACTIVE):
+        self.value = value
+
+# The priority of the job on whose behalf provider calls are being made
+current_priority = contextvars.ContextVar("current_priority", default=PriorityRef(INTERACTIVE))
+
+def is_rate_limited(error: Exception) -> bool:
+    """Recognizes 429 / quota errors from the OpenAI and Gemini SDKs."""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+class TokenBucket:
+    """A per-minute token bucket; a rate of 0 means unlimited."""
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def wait_time(self, amount: float = 1) -> float:
+        """Seconds until `amount` tokens are available; 0 if they are now."""
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float = 1):
+        if self.rate > 0 and amount > 0:
+            self.tokens -= min(amount, self.capacity)
+
+    async def acquire(self, amount: float = 1):
+        async with self._lock:
+            while (delay := self.wait_time(amount)) > 0:
+                await asyncio.sleep(delay)
+            self.take(amount)
+
+class ProviderScheduler:
+    """
+    Admission control for one provider.
+
+    Calls wait in a priority queue (interactive before speculative, then FIFO)
+    for a concurrency slot and for RPM/TPM tokens together: the call at the head
+    of the queue is admitted once both are free, so a call never holds a slot
+    while it waits for tokens and a speculative call cannot take tokens an
+    interactive one is waiting for. The concurrency limit adapts
+    AIMD-style: it grows by about one slot per window of fast successful calls
+    and is cut multiplicatively on 429s or when latency exceeds the target.
+    """
+    def __init__(self, name: str, limits: ProviderLimitConfig):
+        self.name = name
+        self.limits = limits
+        self.limit = float(limits.initial_concurrency or limits.max_concurrency)
+        self.in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self.requests = TokenBucket(limits.requests_per_minute)
+        self.tokens = TokenBucket(limits.tokens_per_minute)
+        self._refill_timer = None
+        self.stats = {"calls": 0, "throttled": 0, "errors": 0, "queue_wait_seconds": 0.0, "busy_seconds": 0.0}
+
+    def set_limits(self, limits: ProviderLimitConfig):
+        self.limits = limits
+        self.limit = min(max(self.limit, limits.min_concurrency), limits.max_concurrency)
+        self.requests = TokenBucket(limits.requests_per_minute)
+        self.tokens = TokenBucket(limits.tokens_per_minute)
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    def _token_wait(self, tokens: float) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _admit(self, tokens: float):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+
+    def _wake_next(self):
+        if self._refill_timer is not None:
+            self._refill_timer.cancel()
+            self._refill_timer = None
+        while self._waiters and self._has_capacity():
+            waiter = min(self._waiters, key=lambda entry: (entry[0].value, entry[1]))
+            if waiter[2].done():
+                self._waiters.remove(waiter)
+                continue
+            delay = self._token_wait(waiter[3])
+            if delay > 0:
+                # The head of the queue waits for the buckets to refill; nothing behind it jumps ahead
+                self._refill_timer = asyncio.get_running_loop().call_later(delay, self._wake_next)
+                return
+            self._waiters.remove(waiter)
+            self._admit(waiter[3])
+            waiter[2].set_result(None)
+
+    async def _acquire(self, tokens: float):
+        if self._has_capacity() and not self._waiters and self._token_wait(tokens) == 0:
+            self._admit(tokens)
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (current_priority.get(), next(self._sequence), future, tokens)
+        self._waiters.append(entry)
+        self._wake_next()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            elif future.done() and not future.cancelled():
+                self.in_flight -= 1
+            self._wake_next()
+            raise
+
+    def _release(self, latency: float, throttled: bool):
+        self.in_flight -= 1
+        if throttled:
+            self.limit = max(self.limits.min_concurrency, self.limit * 0.5)
+        elif latency > self.limits.latency_target_seconds:
+            self.limit = max(self.limits.min_concurrency, self.limit * 0.9)
+        else:
+            self.limit = min(self.limits.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, tokens: float = 0):
+        """Holds one concurrency slot (and rate-limit tokens) for a provider call."""
+        queued_at = time.monotonic()
+        await self._acquire(tokens)
+        started_at = time.monotonic()
+        throttled = False
+        outcome = "cancelled"
+        try:
+            self.stats["queue_wait_seconds"] += started_at - queued_at
+            metrics.provider_queue_seconds.observe(started_at - queued_at, provider=self.name)
+            yield
+            outcome = "ok"
+        except Exception as e:
+            throttled = is_rate_limited(e)
+            self.stats["throttled" if throttled else "errors"] += 1
+            outcome = "throttled" if throttled else "error"
+            raise
+        finally:
+            latency = time.monotonic() - started_at
+            self.stats["calls"] += 1
+            self.stats["busy_seconds"] += latency
+            metrics.provider_call_seconds.observe(latency, provider=self.name, outcome=outcome)
+            metrics.provider_calls_total.inc(provider=self.name, outcome=outcome)
+            self._release(latency, throttled)
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()}
+        }
+
+schedulers = {
+    name: ProviderScheduler(name, getattr(gen_config.limits, name))
+    for name in ("openai_text", "openai_tts", "gemini_image")
+}
+
+def share_limits(parts: int):
+    """
+    Gives this process 1/`parts` of every provider's limits, for when `parts`
+    worker processes call the same providers, each with its own scheduler.
+    """
+    if parts <= 1:
+        return
+    for name, scheduler in schedulers.items():
+        limits = getattr(gen_config.limits, name)
+        scheduler.set_limits(limits.model_copy(update={
+            "max_concurrency": max(1, math.ceil(limits.max_concurrency / parts)),
+            "min_concurrency": max(1, math.ceil(limits.min_concurrency / parts)),
+            "initial_concurrency": math.ceil(limits.initial_concurrency / parts) if limits.initial_concurrency else None,
+            "requests_per_minute": math.ceil(limits.requests_per_minute / parts),
+            "tokens_per_minute": math.ceil(limits.tokens_per_minute / parts),
+        }))
+
+def scheduler_stats() -> dict:
+    return {name: scheduler.snapshot() for name, scheduler in schedulers.items()}
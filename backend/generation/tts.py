@@ -0,0 +1,87 @@
+import asyncio
+import re
+
+# --- Sentence Chunking ---
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])["\'”’)]*\s+')
+
+def split_sentences(text: str, min_chars: int = 60) -> list[str]:
+    """
+    Splits narration into sentence chunks for parallel TTS. Sentences shorter
+    than `min_chars` are merged with the next one so tiny fragments do not each
+    cost a request (and an audible seam).
+    """
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        current = f"{current} {sentence}".strip() if current else sentence.strip()
+        if len(current) >= min_chars:
+            chunks.append(current)
+            current = ""
+    if current:
+        if chunks and len(current) < min_chars:
+            chunks[-1] = f"{chunks[-1]} {current}"
+        else:
+            chunks.append(current)
+    return chunks
+
+# --- MP3 Concatenation ---
+
+_BITRATES_KBPS = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def _frame_length(header: bytes) -> int | None:
+    """Length of an MPEG Layer III frame from its 4-byte header, or None if it is not one."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _BITRATES_KBPS[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x01
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+def strip_id3(data: bytes) -> bytes:
+    """Removes a leading ID3v2 tag and a trailing ID3v1 tag."""
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+def _strip_info_frame(data: bytes) -> bytes:
+    """
+    Drops a leading Xing/Info/VBRI frame. It only holds the length of its own
+    clip, which would make players cut a joined stream short.
+    """
+    length = _frame_length(data[:4])
+    if length and any(tag in data[4:64] for tag in (b"Xing", b"Info", b"VBRI")):
+        return data[length:]
+    return data
+
+def concat_mp3(clips: list[bytes]) -> bytes:
+    """
+    Joins MP3 clips into one stream. Clips from the same TTS model and voice
+    share an encoding, so their frames can simply follow each other once the
+    per-file tags are removed. Data that is not MP3 is joined as-is.
+    """
+    return b"".join(_strip_info_frame(strip_id3(clip)) for clip in clips)
+
+async def concat_audio(required: list, optional: list | None = None) -> bytes:
+    """
+    Awaits audio clips (coroutines or tasks) and joins them in order.
+    A failed optional clip (a choice read out after the story) is skipped
+    rather than failing the whole narration.
+    """
+    clips = await asyncio.gather(*required)
+    extra = await asyncio.gather(*(optional or []), return_exceptions=True)
+    return concat_mp3(list(clips) + [clip for clip in extra if isinstance(clip, bytes)])
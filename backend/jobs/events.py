@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+# Per-event overhead of the tuple, the dict and their references
+_EVENT_OVERHEAD_BYTES = 200
+
+class JobEvents:
+    """
+    An append-only event log for a single job.
+    Subscribers can replay it from any position and then follow new events
+    as they are published, which is what the SSE endpoint needs.
+    """
+    def __init__(self):
+        self._events = []
+        # Rough bytes held by the log, so the job store can count it against its memory cap
+        self.size_bytes = 0
+        self._closed = False
+        self._condition = asyncio.Condition()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def publish(self, event: str, data: dict | None = None):
+        """Appends an event and wakes up every waiting subscriber."""
+        async with self._condition:
+            if self._closed:
+                return
+            self._events.append((event, data or {}))
+            self.size_bytes += _EVENT_OVERHEAD_BYTES + len(event) + len(json.dumps(data or {}))
+            self._condition.notify_all()
+
+    async def close(self):
+        """Marks the log as finished; subscribers stop after the last event."""
+        async with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    async def wait_for(self, predicate, timeout: float) -> bool:
+        """
+        Waits until `predicate()` is true or the log is closed, without polling.
+        Returns the predicate's final value; a timeout is not an error.
+        """
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: predicate() or self._closed), timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+            return predicate()
+
+    async def subscribe(self, start: int = 0):
+        """Yields (index, event, data) tuples from `start` until the log is closed."""
+        index = start
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: index < len(self._events) or self._closed)
+                pending = self._events[index:]
+                finished = self._closed
+            for event, data in pending:
+                yield index, event, data
+                index += 1
+            if finished and index >= len(self._events):
+                return
+
+def format_sse(index: int, event: str, data: dict) -> str:
+    """Formats one event as a Server-Sent Events frame."""
+    return f"id: {index}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
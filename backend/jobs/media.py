@@ -0,0 +1,105 @@
+import hashlib
+import os
+import re
+
+from fastapi import Request, Response
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+    "bin": "application/octet-stream",
+}
+
+_MEDIA_ID = re.compile(r"^[0-9a-f]{32}\.[a-z0-9]+$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def sniff_extension(data: bytes, default: str = "bin") -> str:
+    """Guesses a file extension from the magic bytes of a media blob."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data.startswith(b"ID3") or data[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "mp3"
+    return default
+
+class MediaStore:
+    """
+    A content-addressed store for generated media blobs.
+    Each blob is written once to disk under an id derived from its sha256 and
+    its file type, so identical media is stored once and the id doubles as an ETag.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, media_id: str) -> str:
+        return os.path.join(self.directory, media_id[:2], media_id)
+
+    def put(self, data: bytes, default_extension: str = "bin") -> str | None:
+        """Stores a blob and returns its media id, or None for empty media."""
+        if not data:
+            return None
+        extension = sniff_extension(data, default_extension)
+        media_id = f"{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+        path = self._path(media_id)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        return media_id
+
+    def get(self, media_id: str) -> bytes | None:
+        if not _MEDIA_ID.match(media_id):
+            return None
+        try:
+            with open(self._path(media_id), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+def media_url(media_id: str | None) -> str | None:
+    return f"/media/{media_id}" if media_id else None
+
+def content_type_for(media_id: str) -> str:
+    return CONTENT_TYPES.get(media_id.rsplit(".", 1)[-1], CONTENT_TYPES["bin"])
+
+def media_response(request: Request, data, media_id: str) -> Response:
+    """
+    Builds a cacheable response for a media blob.
+    Honors If-None-Match (the id is immutable, so it is a strong ETag) and
+    single byte-range requests so browsers can seek and start audio early.
+    """
+    etag = f'"{media_id.split(".")[0]}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    total = len(data)
+    range_header = request.headers.get("range")
+    match = _RANGE.match(range_header.strip()) if range_header else None
+    if match and (match.group(1) or match.group(2)):
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), total - 1) if match.group(2) else total - 1
+        else:
+            start = max(total - int(match.group(2)), 0)
+            end = total - 1
+        if start >= total or start > end:
+            headers["Content-Range"] = f"bytes */{total}"
+            return Response(status_code=416, headers=headers)
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+        return Response(data[start:end + 1], status_code=206, media_type=content_type_for(media_id), headers=headers)
+
+    # Bytes or a memoryview (a story pack's mmap) are sent as they are, without a copy
+    return Response(data, media_type=content_type_for(media_id), headers=headers)
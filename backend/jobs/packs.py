@@ -0,0 +1,156 @@
+import json
+import mmap
+import os
+import struct
+
+from .media import media_url
+
+PACK_MAGIC = b"STORYPK\x00"
+PACK_VERSION = 1
+# Magic, format version, then where the index sits and how long it is
+HEADER = struct.Struct("<8sIQQ")
+
+class PackWriter:
+    """
+    Writes a story pack: a fixed header, the raw media blobs and one JSON
+    record per story page, concatenated, and finally a JSON index of where
+    each page and blob starts. Media shared by several pages is stored once.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._temp_path = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._temp_path, "wb")
+        self._file.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, 0))
+        self._nodes = {}
+        self._media = {}
+        self.root = None
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def _append(self, data: bytes) -> list[int]:
+        offset = self._file.tell()
+        self._file.write(data)
+        return [offset, len(data)]
+
+    def add_media(self, media_id: str, data: bytes):
+        if media_id not in self._media:
+            self._media[media_id] = self._append(data)
+
+    def add_node(self, node_id: str, record: dict):
+        """
+        Adds a page: `story_text`, the `narration` and `main_illustration` media
+        ids, and `choices` as [{text, audio, image, next}] where `next` is the
+        node the choice leads to (None past the rendered depth).
+        """
+        if self.root is None:
+            self.root = node_id
+        self._nodes[node_id] = self._append(json.dumps(record).encode())
+
+    def close(self):
+        index = json.dumps({"root": self.root, "nodes": self._nodes, "media": self._media}).encode()
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, index_offset, len(index)))
+        self._file.close()
+        # Readers never see a pack without its index
+        os.replace(self._temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._temp_path)
+
+class StoryPack:
+    """
+    A read-only story pack opened with mmap. Opening reads only the header and
+    the index; page records are decoded when asked for and media is returned
+    as memoryview slices of the mapping, so nothing is copied until it is sent.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is not a story pack")
+        self._view = memoryview(self._map)
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a story pack")
+        magic, version, index_offset, index_length = HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION or index_offset + index_length > len(self._map):
+            self.close()
+            raise ValueError(f"{path} is not a version {PACK_VERSION} story pack")
+        index = json.loads(self._view[index_offset:index_offset + index_length].tobytes())
+        self.root = index["root"]
+        self._nodes = index["nodes"]
+        self._media = index["media"]
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._nodes
+
+    def node(self, node_id: str) -> dict | None:
+        entry = self._nodes.get(node_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        return json.loads(self._view[offset:offset + length].tobytes())
+
+    def media(self, media_id: str) -> memoryview | None:
+        entry = self._media.get(media_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._view[offset:offset + length]
+
+    def child(self, node_id: str, choice: str) -> str | None:
+        """The page a choice leads to, if it was rendered."""
+        node = self.node(node_id)
+        if node is None:
+            return None
+        return next((option.get("next") for option in node["choices"] if option["text"] == choice), None)
+
+    def segment(self, node_id: str) -> dict | None:
+        """A page in the shape of a /generate/result story segment, with every asset ready."""
+        node = self.node(node_id)
+        if node is None:
+            return None
+        assets = {"narration": "ready", "main_illustration": "ready"}
+        for i, _ in enumerate(node["choices"]):
+            assets[f"choice_audio:{i}"] = assets[f"choice_image:{i}"] = "ready"
+        return {
+            "story_text": node["story_text"],
+            "narration_audio_url": media_url(node["narration"]),
+            "narration_chunks": [],
+            "main_illustration_url": media_url(node["main_illustration"]),
+            "choices": [
+                {"text": option["text"], "audio_url": media_url(option["audio"]), "image_url": media_url(option["image"])}
+                for option in node["choices"]
+            ],
+            "assets": assets,
+        }
+
+    def close(self):
+        """
+        Unmaps the pack. Media views that are still being sent keep the mapping
+        alive, and it is unmapped once the last of them is released.
+        """
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Only the views refer to the mapping now; it goes with them
+            pass
+        self._map = None
+        self._file.close()
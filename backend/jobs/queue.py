@@ -0,0 +1,249 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .store import FINISHED_STATUSES
+
+# Columns holding JSON, decoded when a row is read
+_JSON_COLUMNS = ("payload", "segment", "assets", "timings", "result")
+
+def connect(path: str) -> sqlite3.Connection:
+    """Opens the shared SQLite file in WAL mode, so API and worker processes can read while one writes."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.row_factory = sqlite3.Row
+    return db
+
+class JobQueue:
+    """
+    A job queue shared by every API and worker process through one SQLite file.
+
+    The API enqueues a job; a worker claims it with a lease, renews the lease
+    with heartbeats and writes the job's events and progress as it runs. A job
+    whose worker stops heartbeating is claimed again by another worker, up to
+    `max_attempts` times. Any API process can answer for any job from here.
+    """
+    def __init__(self, path: str, lease_seconds: float = 15.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            " job_id TEXT PRIMARY KEY, state TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL,"
+            " priority INTEGER NOT NULL, group_id TEXT, worker_id TEXT, lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " segment TEXT, assets TEXT, timings TEXT, result TEXT, next_seq INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS queue_claim ON queue (state, priority, created_at);"
+            "CREATE TABLE IF NOT EXISTS queue_events ("
+            " job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, seq));"
+            "CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, stats TEXT NOT NULL, updated_at REAL NOT NULL);"
+        )
+
+    def _transaction(self, work):
+        """Runs `work(db)` in one write transaction, taking the write lock up front."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return value
+
+    @staticmethod
+    def _append_event(db, job_id: str, event: str, data: dict):
+        seq = db.execute("SELECT next_seq FROM queue WHERE job_id = ?", (job_id,)).fetchone()[0]
+        db.execute("INSERT INTO queue_events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+                   (job_id, seq, event, json.dumps(data)))
+        db.execute("UPDATE queue SET next_seq = ?, updated_at = ? WHERE job_id = ?", (seq + 1, time.time(), job_id))
+
+    # --- API side ---
+
+    def enqueue(self, job_id: str, payload: dict, priority: int, group: str | None = None):
+        now = time.time()
+        self._transaction(lambda db: db.execute(
+            "INSERT INTO queue (job_id, state, status, payload, priority, group_id, created_at, updated_at)"
+            " VALUES (?, 'queued', 'pending', ?, ?, ?, ?, ?)",
+            (job_id, json.dumps(payload), priority, group, now, now)
+        ))
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for column in _JSON_COLUMNS:
+            job[column] = json.loads(job[column]) if job[column] is not None else None
+        return job
+
+    def events_after(self, job_id: str, seq: int, limit: int = 500) -> list[tuple]:
+        """Returns (seq, event, data) for the job's events from `seq` on."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, event, data FROM queue_events WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (job_id, seq, limit)
+            ).fetchall()
+        return [(row["seq"], row["event"], json.loads(row["data"])) for row in rows]
+
+    def has_streamed(self, job_id: str) -> bool:
+        """Whether an earlier attempt at the job already wrote streamed tokens to its log."""
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM queue_events WHERE job_id = ? AND event = 'token' LIMIT 1", (job_id,)).fetchone()
+        return row is not None
+
+    def set_priority(self, job_id: str, priority: int):
+        self._transaction(lambda db: db.execute("UPDATE queue SET priority = ? WHERE job_id = ?", (priority, job_id)))
+
+    def request_cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job that has not been claimed yet outright; a running job is
+        flagged and its worker stops it at the next heartbeat.
+        """
+        def work(db):
+            row = db.execute("SELECT state FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or row["state"] == "finished":
+                return False
+            if row["state"] == "queued":
+                db.execute("UPDATE queue SET state = 'finished', status = 'cancelled', updated_at = ? WHERE job_id = ?",
+                           (time.time(), job_id))
+                self._append_event(db, job_id, "status", {"status": "cancelled"})
+            else:
+                db.execute("UPDATE queue SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+            return True
+        return self._transaction(work)
+
+    def siblings(self, group: str, job_id: str) -> list[str]:
+        """Unfinished jobs of the same group, started through any API process."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id FROM queue WHERE group_id = ? AND job_id != ? AND state != 'finished'", (group, job_id)
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    # --- Worker side ---
+
+    def claim(self, worker_id: str) -> dict | None:
+        """
+        Leases the most urgent queued job (interactive before speculative, then
+        oldest first), or a running job whose worker's lease ran out.
+        """
+        def work(db):
+            now = time.time()
+            # Jobs whose workers keep dying are given up on rather than retried forever
+            for row in db.execute(
+                "SELECT job_id FROM queue WHERE state = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts)
+            ).fetchall():
+                db.execute("UPDATE queue SET state = 'finished', status = 'failed', updated_at = ? WHERE job_id = ?",
+                           (now, row["job_id"]))
+                self._append_event(db, row["job_id"], "status", {"status": "failed"})
+            row = db.execute(
+                "SELECT job_id FROM queue WHERE state = 'queued' OR (state = 'running' AND lease_expires < ?)"
+                " ORDER BY priority, created_at LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE queue SET state = 'running', worker_id = ?, lease_expires = ?, attempts = attempts + 1,"
+                " updated_at = ? WHERE job_id = ?", (worker_id, now + self.lease_seconds, now, row["job_id"])
+            )
+            return row["job_id"]
+        job_id = self._transaction(work)
+        return self.get(job_id) if job_id is not None else None
+
+    def heartbeat(self, job_id: str, worker_id: str) -> dict | None:
+        """
+        Renews a worker's lease. Returns the job's `cancel_requested` flag and
+        current `priority`, or None if the lease now belongs to someone else.
+        """
+        def work(db):
+            updated = db.execute(
+                "UPDATE queue SET lease_expires = ? WHERE job_id = ? AND worker_id = ? AND state = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker_id)
+            ).rowcount
+            if not updated:
+                return None
+            row = db.execute("SELECT cancel_requested, priority FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+            return {"cancel_requested": bool(row["cancel_requested"]), "priority": row["priority"]}
+        return self._transaction(work)
+
+    def publish(self, job_id: str, worker_id: str, event: str, data: dict, progress: dict | None = None) -> bool:
+        """
+        Appends an event and, with `progress`, updates the job's status, partial
+        segment, assets, timings and result. Only the lease holder may write. A
+        job that completed at its deadline stays leased while it is `backfilling`.
+        """
+        return self.publish_many(job_id, worker_id, [(event, data)], progress)
+
+    def publish_many(self, job_id: str, worker_id: str, events: list[tuple], progress: dict | None = None) -> bool:
+        """Like `publish` for several (event, data) pairs, written in one transaction."""
+        def work(db):
+            row = db.execute("SELECT worker_id, state FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or row["worker_id"] != worker_id or row["state"] != "running":
+                return False
+            for event, data in events:
+                self._append_event(db, job_id, event, data)
+            if progress:
+                backfilling = progress.get("backfilling")
+                columns = {key: json.dumps(value) if key in _JSON_COLUMNS else value
+                           for key, value in progress.items() if key != "backfilling"}
+                if progress.get("status") in FINISHED_STATUSES and not backfilling:
+                    columns["state"] = "finished"
+                assignments = ", ".join(f"{column} = ?" for column in columns)
+                db.execute(f"UPDATE queue SET {assignments} WHERE job_id = ?", (*columns.values(), job_id))
+            return True
+        return self._transaction(work)
+
+    def report_worker(self, worker_id: str, stats: dict):
+        """Stores a worker's provider, resilience and cache stats, which only it can see."""
+        self._transaction(lambda db: db.execute(
+            "INSERT OR REPLACE INTO workers (worker_id, stats, updated_at) VALUES (?, ?, ?)",
+            (worker_id, json.dumps(stats), time.time())
+        ))
+
+    def worker_stats(self, max_age: float) -> dict:
+        """The last stats of every worker that reported within `max_age` seconds."""
+        with self._lock:
+            rows = self._db.execute("SELECT worker_id, stats FROM workers WHERE updated_at >= ?",
+                                    (time.time() - max_age,)).fetchall()
+        return {row["worker_id"]: json.loads(row["stats"]) for row in rows}
+
+    # --- Housekeeping ---
+
+    def prune(self, pending_ttl: float, finished_ttl: float) -> int:
+        """Drops finished jobs after `finished_ttl` and gives up on jobs queued for longer than `pending_ttl`."""
+        def work(db):
+            now = time.time()
+            for row in db.execute("SELECT job_id FROM queue WHERE state = 'queued' AND created_at < ?",
+                                  (now - pending_ttl,)).fetchall():
+                db.execute("UPDATE queue SET state = 'finished', status = 'failed', updated_at = ? WHERE job_id = ?",
+                           (now, row["job_id"]))
+                self._append_event(db, row["job_id"], "status", {"status": "failed"})
+            expired = db.execute("SELECT job_id FROM queue WHERE state = 'finished' AND updated_at < ?",
+                                 (now - finished_ttl,)).fetchall()
+            for row in expired:
+                db.execute("DELETE FROM queue_events WHERE job_id = ?", (row["job_id"],))
+                db.execute("DELETE FROM queue WHERE job_id = ?", (row["job_id"],))
+            db.execute("DELETE FROM workers WHERE updated_at < ?", (now - finished_ttl,))
+            return len(expired)
+        return self._transaction(work)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) AS jobs FROM queue GROUP BY state").fetchall()
+            workers = self._db.execute(
+                "SELECT COUNT(DISTINCT worker_id) FROM queue WHERE state = 'running' AND lease_expires >= ?", (time.time(),)
+            ).fetchone()[0]
+        counts = {"queued": 0, "running": 0, "finished": 0}
+        counts.update({row["state"]: row["jobs"] for row in rows})
+        return {**counts, "active_workers": workers}
@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .queue import connect
+
+class StorySession:
+    """One child's story: the frontend config plus the history behind every generated segment."""
+    def __init__(self, config: dict, profile_id: str | None = None):
+        self.config = config
+        # The child profile the config came from, if any
+        self.profile_id = profile_id
+        self.segments = {}
+        self.touched_at = time.time()
+
+class SessionStore:
+    """
+    Server-side story sessions, so clients send a session id and a choice
+    instead of the whole conversation history on every turn.
+    Sessions are kept in LRU order and expire after `ttl` seconds of inactivity.
+    """
+    def __init__(self, ttl: float, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def create(self, config: dict, profile_id: str | None = None) -> str:
+        self.prune()
+        session_id = str(uuid.uuid4())
+        self._sessions[session_id] = StorySession(config, profile_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str) -> StorySession | None:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.touched_at = time.time()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def add_segment(self, session_id: str, segment_id: str, history: list):
+        """Remembers the conversation that produced a segment so the story can branch from it."""
+        session = self.get(session_id)
+        if session is not None:
+            session.segments[segment_id] = history
+
+    def history_for(self, session_id: str, segment_id: str) -> list | None:
+        session = self.get(session_id)
+        if session is None:
+            return None
+        history = session.segments.get(segment_id)
+        return list(history) if history is not None else None
+
+    def prune(self):
+        cutoff = time.time() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.touched_at < cutoff:
+                del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "segments": sum(len(session.segments) for session in self._sessions.values())
+        }
+
+class SharedSessionStore:
+    """
+    The same sessions kept in the shared SQLite file, for when API and worker
+    processes are separate: a session made through one API process can be
+    continued through any other, and workers record the segments they generate.
+    """
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, config TEXT NOT NULL, touched_at REAL NOT NULL, profile_id TEXT);"
+            "CREATE TABLE IF NOT EXISTS session_segments ("
+            " session_id TEXT NOT NULL, segment_id TEXT NOT NULL, history TEXT NOT NULL, PRIMARY KEY (session_id, segment_id));"
+        )
+        # Files made before sessions remembered their profile
+        if "profile_id" not in [row["name"] for row in self._db.execute("PRAGMA table_info(sessions)")]:
+            self._db.execute("ALTER TABLE sessions ADD COLUMN profile_id TEXT")
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def create(self, config: dict, profile_id: str | None = None) -> str:
+        session_id = str(uuid.uuid4())
+        self._execute("INSERT INTO sessions (session_id, config, touched_at, profile_id) VALUES (?, ?, ?, ?)",
+                      (session_id, json.dumps(config), time.time(), profile_id))
+        return session_id
+
+    def get(self, session_id: str) -> StorySession | None:
+        rows = self._execute("SELECT config, profile_id FROM sessions WHERE session_id = ?", (session_id,))
+        if not rows:
+            return None
+        self._execute("UPDATE sessions SET touched_at = ? WHERE session_id = ?", (time.time(), session_id))
+        return StorySession(json.loads(rows[0]["config"]), rows[0]["profile_id"])
+
+    def add_segment(self, session_id: str, segment_id: str, history: list):
+        self._execute(
+            "INSERT OR REPLACE INTO session_segments (session_id, segment_id, history)"
+            " SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE session_id = ?)",
+            (session_id, segment_id, json.dumps(history), session_id)
+        )
+
+    def history_for(self, session_id: str, segment_id: str) -> list | None:
+        if self.get(session_id) is None:
+            return None
+        rows = self._execute("SELECT history FROM session_segments WHERE session_id = ? AND segment_id = ?",
+                             (session_id, segment_id))
+        return json.loads(rows[0]["history"]) if rows else None
+
+    def prune(self):
+        cutoff = time.time() - self.ttl
+        self._execute("DELETE FROM session_segments WHERE session_id IN (SELECT session_id FROM sessions WHERE touched_at < ?)", (cutoff,))
+        self._execute("DELETE FROM sessions WHERE touched_at < ?", (cutoff,))
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self._execute("SELECT COUNT(*) FROM sessions")[0][0],
+            "segments": self._execute("SELECT COUNT(*) FROM session_segments")[0][0]
+        }
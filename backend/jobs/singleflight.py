@@ -0,0 +1,65 @@
+import hashlib
+import json
+import time
+
+# Parts of the frontend config that change what a job generates
+FINGERPRINT_CONFIG_KEYS = ("voice", "child_photo_path", "child_info", "personalization")
+
+def request_fingerprint(history: list | None, choice: str | None, app_config: dict, scope: str | None = None) -> str:
+    """
+    Canonical hash of everything that determines a generation job's output.
+    `scope` keeps jobs whose results belong to one story session from being shared with another.
+    """
+    relevant_config = {key: app_config.get(key) for key in FINGERPRINT_CONFIG_KEYS}
+    canonical = json.dumps(
+        {"history": history or [], "choice": choice, "config": relevant_config, "scope": scope},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    """
+    Coalesces identical generation requests onto one job.
+    While a job is running, duplicates attach to it; once it has completed,
+    its result is reused for `reuse_window` seconds. Failed or cancelled jobs
+    are never reused.
+    """
+    def __init__(self, reuse_window: float):
+        self.reuse_window = reuse_window
+        self._jobs = {}
+        self.stats = {"started": 0, "coalesced": 0, "reused": 0}
+
+    def lookup(self, fingerprint: str, status_of) -> tuple[str, str] | None:
+        """
+        Returns (job_id, "coalesced" | "reused") for a job that can serve this
+        request, or None if a new job has to be started.
+        """
+        entry = self._jobs.get(fingerprint)
+        if entry is None:
+            return None
+        job_id, registered_at = entry
+        status = status_of(job_id)
+        if status == "complete" and time.time() - registered_at <= self.reuse_window:
+            self.stats["reused"] += 1
+            return job_id, "reused"
+        if status in ("pending", "generating_text", "generating_media"):
+            self.stats["coalesced"] += 1
+            return job_id, "coalesced"
+        del self._jobs[fingerprint]
+        return None
+
+    def register(self, fingerprint: str, job_id: str):
+        self._jobs[fingerprint] = (job_id, time.time())
+        self.stats["started"] += 1
+
+    def completed(self, fingerprint: str, job_id: str):
+        """Restarts the reuse window from the moment the job finished."""
+        if self._jobs.get(fingerprint, (None,))[0] == job_id:
+            self._jobs[fingerprint] = (job_id, time.time())
+
+    def prune(self, status_of):
+        """Forgets finished jobs whose reuse window has passed; running jobs are kept."""
+        cutoff = time.time() - self.reuse_window
+        for fingerprint, (job_id, registered_at) in list(self._jobs.items()):
+            if registered_at < cutoff and status_of(job_id) not in ("pending", "generating_text", "generating_media"):
+                del self._jobs[fingerprint]
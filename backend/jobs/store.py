@@ -0,0 +1,213 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+FINISHED_STATUSES = ("complete", "failed", "cancelled")
+
+# Rough per-record overhead for the status dict, event log and bookkeeping
+_RECORD_OVERHEAD_BYTES = 1024
+
+class JobStore:
+    """
+    A bounded store for generation jobs.
+
+    Running jobs live in memory. Finished jobs stay in an in-memory LRU until
+    the memory cap is reached (or their result is large), at which point the
+    result is spilled to a SQLite index plus one JSON blob file per job rather
+    than being dropped. Pending and finished jobs both expire after a TTL.
+    """
+    def __init__(self, directory: str, max_memory_bytes: int, spill_threshold_bytes: int,
+                 pending_ttl: float, finished_ttl: float):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_threshold_bytes = spill_threshold_bytes
+        self.pending_ttl = pending_ttl
+        self.finished_ttl = finished_ttl
+        self._jobs = OrderedDict()
+        self._sizes = {}
+        self.memory_bytes = 0
+        self.evictions = {"spilled": 0, "expired": 0}
+
+        os.makedirs(os.path.join(directory, "results"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "jobs.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, finished_at REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    @classmethod
+    def from_config(cls, jobs_config) -> "JobStore":
+        return cls(
+            jobs_config.directory,
+            jobs_config.max_memory_mb * 1024 * 1024,
+            jobs_config.spill_threshold_kb * 1024,
+            jobs_config.pending_ttl_seconds,
+            jobs_config.finished_ttl_seconds
+        )
+
+    # --- Dict-style access to in-memory records ---
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._jobs
+
+    def __getitem__(self, job_id: str) -> dict:
+        return self._jobs[job_id]
+
+    def items(self):
+        """Returns (job_id, record) pairs for the jobs held in memory."""
+        return list(self._jobs.items())
+
+    def get(self, job_id: str, default=None):
+        """Returns the in-memory record of a job, marking it as recently used."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return default
+        self._jobs.move_to_end(job_id)
+        return job
+
+    def create(self, job_id: str, record: dict):
+        self.prune()
+        record.setdefault("created_at", time.time())
+        self._jobs[job_id] = record
+        self._account(job_id, _RECORD_OVERHEAD_BYTES)
+
+    def finish(self, job_id: str, status: str, result: dict | None = None):
+        """Stores a job's final status and result, spilling it to disk if needed."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job["status"] = status
+        job["finished_at"] = time.time()
+        if result is not None:
+            job["result"] = result
+        self._settle(job_id)
+
+    def update_result(self, job_id: str, result: dict) -> bool:
+        """Replaces the result of a finished job held in memory, e.g. with assets that arrived late."""
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] not in FINISHED_STATUSES:
+            return False
+        job["result"] = result
+        self._settle(job_id)
+        return True
+
+    def _settle(self, job_id: str):
+        job = self._jobs[job_id]
+        result = job.get("result")
+        size = _RECORD_OVERHEAD_BYTES + (len(json.dumps(result)) if result is not None else 0)
+        # The event log stays with the record for stream replays, every token included
+        size += getattr(job.get("events"), "size_bytes", 0)
+        self._account(job_id, size)
+        if size > self.spill_threshold_bytes and self._spillable(job):
+            self._spill(job_id)
+        self._enforce_memory_cap()
+
+    # --- Lookups that also see spilled jobs ---
+
+    def status(self, job_id: str) -> str | None:
+        job = self.get(job_id)
+        if job is not None:
+            return job["status"]
+        row = self._db.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def result(self, job_id: str) -> dict | None:
+        job = self.get(job_id)
+        if job is not None:
+            return job.get("result")
+        row = self._db.execute("SELECT finished_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self._result_path(job_id), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    # --- Eviction ---
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, "results", f"{job_id}.json")
+
+    @staticmethod
+    def _spillable(job: dict) -> bool:
+        # A job still back-filling late assets keeps its record in memory until it is done
+        return job["status"] in FINISHED_STATUSES and not job.get("backfilling")
+
+    def _account(self, job_id: str, size: int):
+        self.memory_bytes += size - self._sizes.get(job_id, 0)
+        self._sizes[job_id] = size
+
+    @staticmethod
+    def _cancel_work(job: dict):
+        """Stops the tasks of an evicted job, which would otherwise keep calling providers for a job nobody can find."""
+        job["cancel_requested"] = True
+        for key in ("task", "follower"):
+            task = job.get(key)
+            if task is not None and not task.done():
+                task.cancel()
+
+    def _forget(self, job_id: str):
+        self._jobs.pop(job_id, None)
+        self.memory_bytes -= self._sizes.pop(job_id, 0)
+
+    def _spill(self, job_id: str):
+        job = self._jobs[job_id]
+        with open(self._result_path(job_id), "w") as file:
+            json.dump(job.get("result"), file)
+        self._db.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, finished_at, size) VALUES (?, ?, ?, ?)",
+            (job_id, job["status"], job["finished_at"], self._sizes[job_id])
+        )
+        self._db.commit()
+        self._forget(job_id)
+        self.evictions["spilled"] += 1
+
+    def _enforce_memory_cap(self):
+        """Spills least recently used finished jobs until memory use is under the cap."""
+        if self.memory_bytes <= self.max_memory_bytes:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if self._spillable(job)]:
+            self._spill(job_id)
+            if self.memory_bytes <= self.max_memory_bytes:
+                return
+
+    def prune(self):
+        """Drops jobs whose pending or finished TTL has run out, in memory and on disk."""
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] in FINISHED_STATUSES:
+                expired = now - job["finished_at"] > self.finished_ttl
+            else:
+                expired = now - job["created_at"] > self.pending_ttl
+            if expired:
+                self._cancel_work(job)
+                self._forget(job_id)
+                self.evictions["expired"] += 1
+
+        expired_rows = self._db.execute(
+            "SELECT job_id FROM jobs WHERE finished_at < ?", (now - self.finished_ttl,)
+        ).fetchall()
+        for (job_id,) in expired_rows:
+            try:
+                os.remove(self._result_path(job_id))
+            except FileNotFoundError:
+                pass
+            self.evictions["expired"] += 1
+        if expired_rows:
+            self._db.executemany("DELETE FROM jobs WHERE job_id = ?", expired_rows)
+            self._db.commit()
+
+    def stats(self) -> dict:
+        on_disk, disk_bytes = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM jobs").fetchone()
+        return {
+            "jobs_in_memory": len(self._jobs),
+            "memory_bytes": self.memory_bytes,
+            "max_memory_bytes": self.max_memory_bytes,
+            "jobs_on_disk": on_disk,
+            "disk_bytes": disk_bytes,
+            "evictions": dict(self.evictions)
+        }
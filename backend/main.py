@@ -1,34 +1,94 @@
 import os
 import uuid
+import json
+import hashlib
 import base64
 import re
-import yaml
 import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from io import BytesIO
 
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from openai import OpenAI
 from dotenv import load_dotenv
 import google.generativeai as genai
-from PIL import Image
 
 # Import from our new refactored modules
-from generation.config import config as gen_config
+from generation.config import config as gen_config, refresh_config
 from generation.generators import (
     get_story_prompt, 
-    generate_story_text, 
+    generate_story_text_stream,
     generate_audio_bytes, 
     generate_image_bytes,
-    parse_story_and_choices
+    StoryStreamParser
 )
+from generation import metrics
+from generation.cache import media_cache
+from generation.compaction import compact_history
+from generation.icons import generate_icon_sheet
+from generation.placeholders import render_placeholder, theme_colour
+from generation.profiles import DEFAULT_PROFILE, ProfileRegistry
+from generation.clients import create_openai_client, get_image_model
+from generation.reference import load_reference_image
+from generation.renditions import renditions
+from generation.tts import concat_audio, split_sentences
+from generation.resilience import resilience_stats
+from generation.scheduler import INTERACTIVE, SPECULATIVE, PriorityRef, current_priority, scheduler_stats
+from jobs.events import JobEvents, format_sse
+from jobs.media import MediaStore, media_response, media_url
+from jobs.packs import StoryPack
+from jobs.store import FINISHED_STATUSES, JobStore
+from jobs.singleflight import SingleFlight, request_fingerprint
+from jobs.queue import JobQueue
+from jobs.sessions import SessionStore, SharedSessionStore
 
 # Load environment variables from the root .env file
 load_dotenv("../.env")
 
 # --- Initialization ---
-app = FastAPI()
+async def prune_jobs_periodically():
+    """Expires old pending and finished jobs in the background."""
+    while True:
+        await asyncio.sleep(gen_config.jobs.prune_interval_seconds)
+        app.state.jobs.prune()
+        app.state.singleflight.prune(app.state.jobs.status)
+        await sessions_call("prune")
+        if app.state.queue is not None:
+            await asyncio.to_thread(app.state.queue.prune, gen_config.jobs.pending_ttl_seconds, gen_config.jobs.finished_ttl_seconds)
+
+async def watch_config_files():
+    """Applies edits to the generation config and the child profiles without a restart."""
+    while True:
+        await asyncio.sleep(gen_config.profiles.reload_interval_seconds)
+        await asyncio.to_thread(refresh_config)
+        changed = await asyncio.to_thread(app.state.profiles.refresh)
+        if changed:
+            print(f"Reloaded profiles: {', '.join(changed)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # OpenAI calls are async now; the pool only serves the remaining sync work
+    # (Gemini image calls, PIL decoding and file I/O)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=gen_config.limits.thread_pool_size, thread_name_prefix="provider")
+    )
+    # Build the image model once at startup rather than on every call
+    get_image_model(gen_config.providers.google.image_model)
+    pruner = asyncio.create_task(prune_jobs_periodically())
+    watcher = asyncio.create_task(watch_config_files())
+    yield
+    pruner.cancel()
+    watcher.cancel()
+    renditions.shutdown()
+    if app.state.pack is not None:
+        app.state.pack.close()
+    await client.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow requests from the HTML frontend
 app.add_middleware(
@@ -39,136 +99,980 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Native async clients share one keep-alive connection pool; no thread per request
+client = create_openai_client(os.getenv("OPENAI_API_KEY"))
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-# In-memory job storage
-app.state.jobs = {}
+# Bounded job storage: running jobs in memory, finished results spill to disk
+app.state.jobs = JobStore.from_config(gen_config.jobs)
+# Duplicate /generate/start requests attach to the job already producing that segment
+app.state.singleflight = SingleFlight(gen_config.jobs.coalesce_window_seconds)
+# With the queue on, worker processes run the jobs and any API process can answer for any job
+app.state.queue = JobQueue(gen_config.queue.path, gen_config.queue.lease_seconds, gen_config.queue.max_attempts) if gen_config.queue.enabled else None
+# Story sessions hold the config and history server-side; clients send only ids and choices
+if app.state.queue is not None:
+    app.state.sessions = SharedSessionStore(gen_config.queue.path, gen_config.sessions.ttl_seconds)
+else:
+    app.state.sessions = SessionStore(gen_config.sessions.ttl_seconds, gen_config.sessions.max_sessions)
+
+async def sessions_call(method: str, *args):
+    """Calls the session store, the shared SQLite one in a thread so waiting on its write lock never blocks the loop."""
+    function = getattr(app.state.sessions, method)
+    if isinstance(app.state.sessions, SharedSessionStore):
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
+
+# Child profiles are parsed once and re-read only when their files change
+app.state.profiles = ProfileRegistry.from_config(gen_config.profiles)
+# Generated audio and images are served by id from /media instead of inlined in results
+media_store = MediaStore(gen_config.storage.media_directory)
+# Replay mode serves a pre-rendered story pack instead of calling providers
+app.state.pack = StoryPack(gen_config.replay.pack_path) if gen_config.replay.pack_path else None
+
+# Work saved by cancelling speculative jobs, reported in /jobs/stats
+cancellation_stats = {"jobs": 0, "during_text": 0, "during_media": 0, "backfills": 0, "media_tasks": 0}
 
 # --- API Endpoints ---
 
+def profile_response(request: Request, profile_id: str) -> Response | None:
+    """A profile's config as JSON with its ETag; 304 if the client already has this version."""
+    profile = app.state.profiles.get(profile_id)
+    if profile is None:
+        return None
+    headers = {"ETag": profile.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == profile.etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(profile.config, headers=headers)
+
 @app.get("/config")
-async def get_frontend_config():
+async def get_frontend_config(request: Request):
     """
-    Reads the frontend's config.yaml file and returns it as JSON.
+    Returns the default child profile (the frontend's config.yaml) as JSON.
     """
-    try:
-        with open("../frontend/config.yaml", 'r') as file:
-            config_data = yaml.safe_load(file)
-        return config_data
-    except FileNotFoundError:
-        return {"error": "frontend/config.yaml not found"}
-    except Exception as e:
-        return {"error": str(e)}
+    response = profile_response(request, DEFAULT_PROFILE)
+    if response is None:
+        error = app.state.profiles.errors.get(DEFAULT_PROFILE, "frontend/config.yaml not found")
+        return {"error": error}
+    return response
+
+@app.get("/profiles")
+async def list_profiles():
+    """Lists the child profiles this backend serves, with their current ETags."""
+    return {"profiles": app.state.profiles.etags()}
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    response = profile_response(request, profile_id)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return response
+
+def intro_video_path() -> str | None:
+    """Resolves the intro video from the frontend config, refusing paths outside the frontend folder."""
+    profile = app.state.profiles.get(DEFAULT_PROFILE)
+    video = profile.config.get("intro_video_path") if profile is not None else None
+    if not video:
+        return None
+    frontend_dir = os.path.realpath("../frontend")
+    path = os.path.realpath(os.path.join(frontend_dir, video))
+    if not path.startswith(frontend_dir + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+@app.get("/intro/video")
+async def get_intro_video():
+    """
+    Streams the intro video from disk with Range support, so players can
+    start and seek without the whole file being loaded into memory.
+    """
+    path = await asyncio.to_thread(intro_video_path)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Intro video not found")
+    return FileResponse(path, media_type="video/mp4", headers={"Cache-Control": "public, max-age=3600"})
+
+async def with_worker_stats(local: dict, section: str) -> dict:
+    """
+    Adds each worker's own figures for `section` under "workers". In queue mode
+    the provider calls, and so the interesting numbers, are in the worker processes.
+    """
+    if app.state.queue is None:
+        return local
+    reports = await asyncio.to_thread(app.state.queue.worker_stats, max(10.0, 5 * gen_config.queue.heartbeat_seconds))
+    return {**local, "workers": {worker_id: report.get(section) for worker_id, report in reports.items()}}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Reports hit/miss/eviction counters and sizes of the media cache."""
+    return await with_worker_stats(media_cache.stats(), "cache")
+
+@app.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Reports per-provider concurrency limits, in-flight and queued calls, and throttling."""
+    return await with_worker_stats(scheduler_stats(), "scheduler")
+
+@app.get("/resilience/stats")
+async def get_resilience_stats():
+    """Reports per-provider hedge and retry rates, circuit breaker states and the retry budget left."""
+    return await with_worker_stats(resilience_stats(), "resilience")
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Per-stage and per-provider latency histograms and counters in the Prometheus
+    text format, for this process. In queue mode, scrape each worker's figures
+    through the stats endpoints, which include them under "workers".
+    """
+    for name, snapshot in scheduler_stats().items():
+        metrics.scheduler_limit.set(snapshot["limit"], provider=name)
+        metrics.scheduler_in_flight.set(snapshot["in_flight"], provider=name)
+        metrics.scheduler_queued.set(snapshot["queued"], provider=name)
+    for name, snapshot in resilience_stats()["providers"].items():
+        metrics.circuit_breaker_open.set(0 if snapshot["breaker"] == "closed" else 1, provider=name)
+    cache = media_cache.stats()
+    for tier in ("memory", "disk"):
+        metrics.media_cache_bytes.set(cache.get(f"{tier}_bytes", 0), tier=tier)
+    return Response(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs/stats")
+async def get_job_stats():
+    """Reports job store memory usage, disk usage, eviction counts and cancellation savings."""
+    return {
+        **app.state.jobs.stats(),
+        "cancelled": dict(cancellation_stats),
+        "singleflight": dict(app.state.singleflight.stats),
+        "sessions": await sessions_call("stats"),
+        "queue": await asyncio.to_thread(app.state.queue.stats) if app.state.queue is not None else None
+    }
+
+def load_media(media_id: str):
+    """A blob from the story pack in replay mode (a zero-copy view), else from the media store."""
+    data = app.state.pack.media(media_id) if app.state.pack is not None else None
+    return data if data is not None else media_store.get(media_id)
+
+@app.get("/media/{media_id}")
+async def get_media(media_id: str, request: Request):
+    """Serves a generated audio or image blob with ETag and Range support."""
+    data = await asyncio.to_thread(load_media, media_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return media_response(request, data, media_id)
 
 # --- Pydantic Models ---
 class StoryChoice(BaseModel):
     text: str
-    audio_b64: str
-    image_b64: str
+    audio_url: str | None
+    image_url: str | None
 
 class StorySegment(BaseModel):
     story_text: str
-    narration_audio_b64: str
-    main_illustration_b64: str
+    narration_audio_url: str | None
+    main_illustration_url: str | None
     choices: list[StoryChoice]
-    conversation_history: list[dict]
+    # Only returned for requests without a session
+    conversation_history: list[dict] | None = None
+    session_id: str | None = None
+    segment_id: str | None = None
+
+class SessionRequest(BaseModel):
+    # A registered child profile, or a full config; neither means the default profile
+    profile_id: str | None = None
+    config: dict | None = None
+
+class SessionResponse(BaseModel):
+    session_id: str
 
 class GenerationRequest(BaseModel):
+    # Session clients send `session_id` plus the `segment_id` of the page the choice was made on;
+    # older clients send the full `conversation_history` and `config` instead
+    session_id: str | None = None
+    segment_id: str | None = None
     conversation_history: list[dict] | None = None
     choice: str | None = None
-    config: dict
+    config: dict | None = None
+    # "interactive" when someone is waiting on the result; pre-generated choices
+    # default to "speculative" and are scheduled behind interactive work
+    priority: str | None = None
 
 class JobResponse(BaseModel):
     job_id: str
+    reused: bool = False
+
+class BatchStatusRequest(BaseModel):
+    job_ids: list[str]
 
 class StatusResponse(BaseModel):
     job_id: str
     status: str
+    # True once the story text and the first narration clip exist, even while the rest is pending
+    readable: bool = False
+    assets: dict[str, str] | None = None
+    # Seconds per stage (and per asset) of the job so far
+    timings: dict | None = None
 
 # --- Background Processing ---
-async def process_story_in_background(job_id: str, history: list, app_config: dict):
+async def set_job_status(job_id: str, status: str, result: dict | None = None):
+    """
+    Updates a job's status and publishes the change to its event stream.
+    Final statuses go through the job store so the result can be accounted and spilled.
+    """
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        return
+    if status in FINISHED_STATUSES:
+        # The partial segment is superseded by the result
+        job.pop('segment', None)
+        app.state.jobs.finish(job_id, status, result)
+    else:
+        job['status'] = status
+    await job['events'].publish("status", {"status": status})
+
+# Where each kind of asset lands in a story segment: (list in the segment, field of its items)
+ASSET_FIELDS = {
+    "narration": (None, "narration_audio_url"),
+    "narration_chunk": ("narration_chunks", None),
+    "main_illustration": (None, "main_illustration_url"),
+    "choice_audio": ("choices", "audio_url"),
+    "choice_image": ("choices", "image_url"),
+}
+
+def place_asset(segment: dict, asset: str, index: int | None, url: str | None):
+    collection, field = ASSET_FIELDS[asset]
+    if collection is None:
+        segment[field] = url
+    elif field is None:
+        segment[collection][index] = url
+    else:
+        segment[collection][index][field] = url
+
+def job_segment(job: dict) -> dict:
+    """The partial segment, or the stored result once the page has completed at its deadline."""
+    return job['segment'] if job.get('segment') is not None else job['result']
+
+def settle_asset(job: dict, key: str, state: str):
+    job['assets'][key] = state
+    if job.get('segment') is None:
+        # Back-filled after the page completed; the stored result is updated in place
+        job['result']['assets'][key] = state
+
+def asset_key(asset: str, index: int | None = None) -> str:
+    return asset if index is None else f"{asset}:{index}"
+
+def is_readable(job: dict) -> bool:
+    """
+    A page can be shown once its text is parsed and its narration can start:
+    the first sentence clip has settled, or the joined narration has.
+    """
+    assets = job.get('assets') or {}
+    if job.get('segment') is None:
+        return False
+    return assets.get("narration", "pending") != "pending" or assets.get(asset_key("narration_chunk", 0), "pending") != "pending"
+
+async def store_when_done(job: dict, coro, asset: str, extension: str, index: int | None = None):
+    """
+    Awaits a media task, writes the bytes to the media store, fills the URL into
+    the job's partial segment and announces on the event stream that the asset
+    is ready. A failed asset is marked as such and the error re-raised.
+    """
+    key = asset_key(asset, index)
+    extra = {} if index is None else {"index": index}
     try:
-        app.state.jobs[job_id]['status'] = 'generating_text'
-        llm_response_text = await generate_story_text(client, history)
-        history.append({"role": "assistant", "content": llm_response_text})
-        story_text, choices_list_text = parse_story_and_choices(llm_response_text)
-        
-        app.state.jobs[job_id]['status'] = 'generating_media'
-        voice = app_config.get("voice", "alloy")
-        child_photo_path = os.path.join("../frontend", app_config['child_photo_path'])
-        reference_image = Image.open(child_photo_path)
-
-        tasks = []
-        narration_text = story_text + " " + " ".join(choices_list_text)
-        tasks.append(generate_audio_bytes(client, narration_text, voice))
-        tasks.append(generate_image_bytes(story_text, reference_image, high_quality=True))
-        
-        for choice_text in choices_list_text:
-            tasks.append(generate_audio_bytes(client, choice_text, voice))
-            tasks.append(generate_image_bytes(choice_text, reference_image))
+        data = await coro
+        media_id = await asyncio.to_thread(media_store.put, data, extension)
+        # Image slots link to a display-sized rendition; the original stays available
+        size = renditions.size_for(asset)
+        rendition_id = await store_rendition(data, size) if size and media_id else None
+        if rendition_id:
+            extra["original_url"] = media_url(media_id)
+            media_id = rendition_id
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        settle_asset(job, key, "failed")
+        record_asset_timing(job, key, asset, "failed")
+        await job['events'].publish("media", {"asset": asset, "url": None, "failed": True, **extra})
+        raise
+    url = media_url(media_id)
+    place_asset(job_segment(job), asset, index, url)
+    settle_asset(job, key, "ready" if media_id else "failed")
+    record_asset_timing(job, key, asset, "ready" if media_id else "failed")
+    await job['events'].publish("media", {"asset": asset, "url": url, **extra})
+    return media_id
 
-        print(f"Starting {len(tasks)} media generation tasks in parallel for job {job_id}...")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        print(f"All media generation tasks finished for job {job_id}.")
-        
-        def get_result_or_default(result, task_name, default_value):
-            if isinstance(result, Exception):
-                print(f"ERROR: Task '{task_name}' failed for job {job_id}: {result}")
-                return default_value
-            return result
+async def place_placeholder(job: dict, key: str, theme: str, task: asyncio.Future) -> bool:
+    """
+    Stands in for an asset past its deadline: generic art for an image, no URL yet for audio.
+    Returns False if the asset arrived while its placeholder was being made.
+    """
+    asset, _, index = key.partition(":")
+    index = int(index) if index else None
+    data = await asyncio.to_thread(render_placeholder, asset, theme)
+    media_id = await asyncio.to_thread(media_store.put, data, "png") if data else None
+    if task.done() or job['assets'].get(key) != "pending":
+        return False
+    url = media_url(media_id)
+    place_asset(job['segment'], asset, index, url)
+    job['assets'][key] = "placeholder"
+    record_asset_timing(job, key, asset, "placeholder")
+    extra = {} if index is None else {"index": index}
+    await job['events'].publish("media", {"asset": asset, "url": url, "placeholder": True, **extra})
+    return True
+
+def asset_deadlines(started_at: float, keys) -> dict:
+    """When each asset is due, by its asset class, measured from the start of the job."""
+    settings = gen_config.deadlines
+    if not settings.enabled:
+        return {}
+    due = {key: settings.seconds.get(key.split(":")[0]) for key in keys}
+    return {key: started_at + seconds for key, seconds in due.items() if seconds is not None}
+
+async def wait_for_media(job_id: str, job: dict, running: dict, deadlines: dict, theme: str) -> dict:
+    """
+    Awaits a job's media tasks (task: asset key) until each has finished or
+    passed its deadline, giving late assets a placeholder. Returns the tasks
+    still running, which go on to back-fill the stored result.
+    """
+    running = dict(running)
+    late = set()
+    while any(key not in late for key in running.values()):
+        upcoming = [deadlines[key] for key in running.values() if key not in late and key in deadlines]
+        timeout = max(0.0, min(upcoming) - time.monotonic()) if upcoming else None
+        done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            running.pop(task)
+            try:
+                task.result()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Media task failed for job {job_id}: {e}")
+        now = time.monotonic()
+        for task, key in list(running.items()):
+            # Checked per asset, as one may finish while an earlier placeholder is made
+            if key in late or task.done() or deadlines.get(key, now + 1) > now:
+                continue
+            late.add(key)
+            await place_placeholder(job, key, theme, task)
+    return running
+
+async def store_rendition(data: bytes, size: int) -> str | None:
+    """Renders and stores a display rendition; on failure the original is served instead."""
+    try:
+        rendition = await renditions.render(data, size)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"WARNING: Could not render a {size}px rendition, serving the original: {e}")
+        return None
+    return await asyncio.to_thread(media_store.put, rendition, renditions.extension)
+
+@contextmanager
+def timed_stage(job: dict, stage: str):
+    """Records how long a stage of a job took, in the job's timing breakdown and the stage histogram."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        job['timings'][stage] = round(elapsed, 3)
+        metrics.story_stage_seconds.observe(elapsed, stage=stage)
+
+def record_asset_timing(job: dict, key: str, asset: str, outcome: str):
+    elapsed = time.monotonic() - job['media_started_at']
+    job['timings'].setdefault("assets", {})[key] = round(elapsed, 3)
+    metrics.story_asset_seconds.observe(elapsed, asset=asset, outcome=outcome)
+
+def check_cancelled(job_id: str):
+    """Cancellation checkpoint between stages of a job."""
+    job = app.state.jobs.get(job_id)
+    if job is None or job.get('cancel_requested'):
+        raise asyncio.CancelledError()
+
+async def process_story_in_background(job_id: str, history: list, app_config: dict, session_id: str | None = None):
+    job = app.state.jobs[job_id]
+    events = job['events']
+    fingerprint = job.get('fingerprint')
+    current_priority.set(job['priority'])
+    job['timings'] = {}
+    job_started_at = time.monotonic()
+    tasks = []
+    synth_tasks = []
+    voice = app_config.get("voice", "alloy")
+    child_photo_path = os.path.join("../frontend", app_config['child_photo_path'])
+
+    async def load_reference():
+        # Decoded, cropped and encoded once per photo version, shared by every image call
+        with timed_stage(job, "reference_image"):
+            return await asyncio.to_thread(load_reference_image, child_photo_path)
+
+    async def illustrate(prompt: str, high_quality: bool = False) -> bytes:
+        return await generate_image_bytes(prompt, await reference_task, high_quality=high_quality)
+
+    # Media tasks keyed by (kind, text), started while the text is still streaming
+    prefetched = {}
+
+    def prefetch(kind: str, text: str) -> asyncio.Future:
+        if (kind, text) not in prefetched:
+            if kind == "audio":
+                coro = generate_audio_bytes(client, text, voice)
+            else:
+                coro = illustrate(text, high_quality=kind == "illustration")
+            prefetched[(kind, text)] = asyncio.ensure_future(coro)
+            synth_tasks.append(prefetched[(kind, text)])
+        return prefetched[(kind, text)]
 
-        narration_audio_bytes = get_result_or_default(results[0], "Main Narration", b"")
-        main_illustration_bytes = get_result_or_default(results[1], "Main Illustration", b"")
+    def narration_chunks(story_text: str) -> list[str]:
+        return split_sentences(story_text, gen_config.tts.min_chunk_chars) if gen_config.tts.sentence_chunks else [story_text]
 
-        choices_with_media = []
-        choice_results = results[2:] 
+    def start_media(event: tuple):
+        if event[0] == "narrative":
+            prefetch("illustration", event[1])
+            for chunk in narration_chunks(event[1]):
+                prefetch("audio", chunk)
+        else:
+            prefetch("audio", event[2])
+            # With icon sheets, the icons wait for the full list of choices
+            if not gen_config.icons.sheet:
+                prefetch("image", event[2])
+
+    async def draw_icon_sheet(choices: list[str]) -> list[bytes] | None:
+        try:
+            icons = await generate_icon_sheet(choices, await reference_task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"WARNING: Icon sheet failed for job {job_id}; drawing the icons one by one: {e}")
+            metrics.icon_sheets_total.inc(outcome="fallback")
+            return None
+        metrics.icon_sheets_total.inc(outcome="sliced")
+        return icons
+
+    async def sheet_icon(sheet: asyncio.Future, index: int, choice_text: str) -> bytes:
+        # Shielded, so one cancelled icon does not cancel the sheet the others share
+        icons = await asyncio.shield(sheet)
+        return icons[index] if icons is not None else await illustrate(choice_text)
+
+    def choice_icons(choices: list[str]) -> list[asyncio.Future]:
+        """One image call for all of a page's choice icons, sliced from a sheet, or one call per icon."""
+        if not (gen_config.icons.sheet and 1 < len(choices) <= gen_config.icons.max_panels):
+            return [prefetch("image", choice_text) for choice_text in choices]
+        sheet = asyncio.ensure_future(draw_icon_sheet(choices))
+        icons = [asyncio.ensure_future(sheet_icon(sheet, i, choice_text)) for i, choice_text in enumerate(choices)]
+        synth_tasks.extend([sheet, *icons])
+        return icons
+
+    reference_task = None
+    try:
+        check_cancelled(job_id)
+        reference_task = asyncio.ensure_future(load_reference())
+        await set_job_status(job_id, 'generating_text')
+        # Long stories keep a summary of older pages instead of every turn
+        with timed_stage(job, "compaction"):
+            history = await compact_history(client, history)
+        tokens = []
+        parser = StoryStreamParser()
+        with timed_stage(job, "text"):
+            text_started_at = time.monotonic()
+            async for token in generate_story_text_stream(client, history):
+                if not tokens:
+                    job['timings']["first_token"] = round(time.monotonic() - text_started_at, 3)
+                    metrics.story_stage_seconds.observe(time.monotonic() - text_started_at, stage="first_token")
+                tokens.append(token)
+                await events.publish("token", {"text": token})
+                # The illustration, narration and each choice's clip and icon start
+                # as soon as the parser is sure of their text
+                for event in parser.feed(token):
+                    if gen_config.streaming.early_media:
+                        start_media(event)
+        llm_response_text = "".join(tokens)
+        metrics.provider_bytes_total.inc(len(llm_response_text.encode()), provider="openai_text")
+        history.append({"role": "assistant", "content": llm_response_text})
+        # The full parse is authoritative; media started for text it disagrees with is dropped below
+        story_text, choices_list_text, _ = parser.finish()
+        await events.publish("story", {"story_text": story_text, "choices": choices_list_text})
         for i, choice_text in enumerate(choices_list_text):
-            audio_result_index = i * 2
-            image_result_index = i * 2 + 1
-            choice_audio_bytes = get_result_or_default(choice_results[audio_result_index], f"Choice Audio '{choice_text}'", b"")
-            choice_image_bytes = get_result_or_default(choice_results[image_result_index], f"Choice Image '{choice_text}'", b"")
-            choices_with_media.append({
-                "text": choice_text,
-                "audio_b64": base64.b64encode(choice_audio_bytes).decode('utf-8'),
-                "image_b64": base64.b64encode(choice_image_bytes).decode('utf-8')
-            })
-
-        final_result = {
+            await events.publish("choice", {"index": i, "text": choice_text})
+        if session_id is not None:
+            # Choices can be pre-generated from this page while its media is still being made
+            await sessions_call("add_segment", session_id, job_id, history)
+        
+        check_cancelled(job_id)
+        await set_job_status(job_id, 'generating_media')
+        # A missing or unreadable photo fails the job, as it would fail every picture
+        await reference_task
+
+        # Narration is read sentence by sentence in parallel and ends with the choice
+        # clips, which are synthesized once and reused rather than read out twice
+        story_chunks = narration_chunks(story_text)
+        chunk_audio = [prefetch("audio", chunk) for chunk in story_chunks]
+        choice_audio = [prefetch("audio", choice_text) for choice_text in choices_list_text]
+        main_image = prefetch("illustration", story_text)
+        choice_images = choice_icons(choices_list_text)
+        used = {id(task) for task in chunk_audio + choice_audio + choice_images + [main_image]}
+        for task in prefetched.values():
+            if id(task) not in used:
+                task.cancel()
+
+        # The partial segment is filled in asset by asset and served by /generate/result meanwhile
+        job['segment'] = {
             "story_text": story_text,
-            "narration_audio_b64": base64.b64encode(narration_audio_bytes).decode('utf-8'),
-            "main_illustration_b64": base64.b64encode(main_illustration_bytes).decode('utf-8'),
-            "choices": choices_with_media,
-            "conversation_history": history
+            "narration_audio_url": None,
+            # The same narration as a playlist: these clips, then each choice's audio_url
+            "narration_chunks": [None] * len(story_chunks),
+            "main_illustration_url": None,
+            "choices": [{"text": choice_text, "audio_url": None, "image_url": None} for choice_text in choices_list_text]
         }
-        app.state.jobs[job_id]['result'] = final_result
-        app.state.jobs[job_id]['status'] = 'complete'
+        if session_id is not None:
+            job['segment'].update({"session_id": session_id, "segment_id": job_id})
+        job['assets'] = {"narration": "pending", "main_illustration": "pending"}
+        job['media_started_at'] = time.monotonic()
+        media_coroutines = {
+            "narration": store_when_done(job, concat_audio(chunk_audio, choice_audio), "narration", "mp3"),
+            "main_illustration": store_when_done(job, main_image, "main_illustration", "png"),
+        }
+        for i, chunk_task in enumerate(chunk_audio):
+            job['assets'][asset_key("narration_chunk", i)] = "pending"
+            media_coroutines[asset_key("narration_chunk", i)] = store_when_done(job, chunk_task, "narration_chunk", "mp3", i)
+        for i, choice_text in enumerate(choices_list_text):
+            for asset, coro in (("choice_audio", choice_audio[i]), ("choice_image", choice_images[i])):
+                job['assets'][asset_key(asset, i)] = "pending"
+                media_coroutines[asset_key(asset, i)] = store_when_done(job, coro, asset, "mp3" if asset == "choice_audio" else "png", i)
+        tasks = [asyncio.ensure_future(coro) for coro in media_coroutines.values()]
+        deadlines = asset_deadlines(job_started_at, media_coroutines)
+
+        print(f"Starting {len(tasks)} media generation tasks in parallel for job {job_id}...")
+        # Each asset is published the moment it finishes; a slow one holds back nothing else,
+        # and one past its deadline is given a placeholder so the page is not held back either
+        with timed_stage(job, "media"):
+            late = await wait_for_media(job_id, job, dict(zip(tasks, media_coroutines)), deadlines, theme_colour(app_config))
+        final_result = {**job['segment'], "assets": dict(job['assets'])}
+        if session_id is None:
+            final_result["conversation_history"] = history
+        check_cancelled(job_id)
+        if late:
+            job['backfilling'] = True
+            print(f"Job {job_id} hit its deadline; {len(late)} late assets will be back-filled.")
+        else:
+            print(f"All media generation tasks finished for job {job_id}.")
+        await set_job_status(job_id, 'complete', final_result)
+        app.state.singleflight.completed(fingerprint, job_id)
 
+        if late:
+            # Already paid for, so the late assets are kept and swapped into the stored result
+            with timed_stage(job, "backfill"):
+                for finished in asyncio.as_completed(list(late)):
+                    try:
+                        await finished
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        print(f"ERROR: Late media task failed for job {job_id}: {e}")
+            job.pop('backfilling', None)
+            app.state.jobs.update_result(job_id, job['result'])
+            await events.publish("backfilled", {"assets": dict(job['assets'])})
+            print(f"Back-filled {len(late)} late assets for job {job_id}.")
+
+    except asyncio.CancelledError:
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if job.pop('backfilling', None):
+            # The page was delivered at its deadline; only its late assets are given up
+            print(f"Job {job_id} stopped; {len(unfinished)} late assets keep their placeholders.")
+            cancellation_stats["backfills"] += 1
+            cancellation_stats["media_tasks"] += len(unfinished)
+            # Ends the back-fill for followers too, so a worker's queue row is finished
+            await events.publish("backfilled", {"assets": dict(job['assets'])})
+            raise
+        cancellation_stats["jobs"] += 1
+        cancellation_stats["during_media" if tasks else "during_text"] += 1
+        cancellation_stats["media_tasks"] += len(unfinished)
+        print(f"Job {job_id} cancelled; skipped {len(unfinished)} unfinished media tasks.")
+        await set_job_status(job_id, 'cancelled')
+        raise
     except Exception as e:
         print(f"FATAL ERROR in background task for job {job_id}: {e}")
-        app.state.jobs[job_id]['status'] = 'failed'
+        await set_job_status(job_id, 'failed')
+    finally:
+        # Prefetched media is not wanted once the job has stopped, however it stopped
+        for task in synth_tasks + [reference_task]:
+            if task is not None and not task.done():
+                task.cancel()
+        total = time.monotonic() - job_started_at
+        job['timings']["total"] = round(total, 3)
+        metrics.story_stage_seconds.observe(total, stage="total")
+        metrics.story_jobs_total.inc(status=app.state.jobs.status(job_id) or "expired")
+        await events.close()
+
+def sibling_group(history: list | None, scope: str | None = None) -> str | None:
+    """
+    Jobs that continue the same page with different choices share a group.
+    Within a session, so identical pages in two children's stories never cancel each other.
+    """
+    if not history:
+        return None
+    return hashlib.sha256(json.dumps({"history": history, "scope": scope}, sort_keys=True).encode()).hexdigest()
+
+def forget_task(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is not None:
+        job.pop('task', None)
+
+@app.post("/sessions", response_model=SessionResponse)
+async def create_session(request: SessionRequest):
+    """Starts a story session; later requests only send its id, a segment id and the choice."""
+    config, profile_id = request.config, None
+    if config is None:
+        profile_id = request.profile_id or DEFAULT_PROFILE
+        profile = app.state.profiles.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        config = profile.config
+    return {"session_id": await sessions_call("create", config, profile_id)}
+
+def opening_prompt(app_config: dict, profile_id: str | None) -> str:
+    """
+    The system prompt for a story's first page. A session made from a profile uses
+    the prompt memoized on the profile, unless the profile was edited since.
+    """
+    profile = app.state.profiles.get(profile_id) if profile_id else None
+    if profile is not None and profile.config == app_config:
+        return profile.system_prompt
+    return get_story_prompt(app_config)
+
+async def resolve_request(request: GenerationRequest) -> tuple[dict, list | None, str | None]:
+    """Returns the config, parent history and the child profile, if any, for a request, from its session or its body."""
+    if request.session_id is None:
+        if request.config is None:
+            raise HTTPException(status_code=422, detail="Either session_id or config is required")
+        return request.config, request.conversation_history if request.choice else None, None
+    session = await sessions_call("get", request.session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not request.choice:
+        return session.config, None, session.profile_id
+    parent_history = await sessions_call("history_for", request.session_id, request.segment_id)
+    if parent_history is None:
+        raise HTTPException(status_code=404, detail="Segment not found in session")
+    return session.config, parent_history, session.profile_id
+
+PACK_JOB_PREFIX = "pack-"
+
+async def start_replay(request: GenerationRequest) -> dict:
+    """
+    Replay mode: the page is looked up in the story pack by the page the choice
+    was made on, and its job is finished at once without any provider call.
+    """
+    pack = app.state.pack
+    if not request.choice:
+        node_id = pack.root
+    elif request.segment_id and request.segment_id.startswith(PACK_JOB_PREFIX):
+        node_id = pack.child(request.segment_id[len(PACK_JOB_PREFIX):], request.choice)
+    else:
+        node_id = None
+    if node_id is None:
+        raise HTTPException(status_code=404, detail="This page is not in the story pack")
+    job_id = PACK_JOB_PREFIX + node_id
+    result = pack.segment(node_id)
+    if request.session_id is not None:
+        result.update({"session_id": request.session_id, "segment_id": job_id})
+    events = JobEvents()
+    app.state.jobs.create(job_id, {"status": "pending", "events": events, "refs": 1})
+    await set_job_status(job_id, 'complete', result)
+    await events.close()
+    return {"job_id": job_id}
 
 @app.post("/generate/start", response_model=JobResponse)
-async def start_generation(request: GenerationRequest, background_tasks: BackgroundTasks):
+async def start_generation(request: GenerationRequest):
+    if app.state.pack is not None:
+        return await start_replay(request)
+    app_config, parent_history, profile_id = await resolve_request(request)
+    fingerprint = request_fingerprint(parent_history, request.choice, app_config, scope=request.session_id)
+    existing = app.state.singleflight.lookup(fingerprint, app.state.jobs.status)
+    if existing is not None:
+        job_id, how = existing
+        job = app.state.jobs.get(job_id)
+        if job is not None:
+            job['refs'] = job.get('refs', 1) + 1
+        print(f"Request {how} onto job {job_id}.")
+        return {"job_id": job_id, "reused": True}
+
     job_id = str(uuid.uuid4())
-    app.state.jobs[job_id] = {"status": "pending"}
+    group = sibling_group(parent_history, request.session_id)
 
-    if request.conversation_history and request.choice:
-        history = request.conversation_history
+    if parent_history and request.choice:
+        history = list(parent_history)
         history.append({"role": "user", "content": request.choice})
     else:
-        system_prompt = get_story_prompt(request.config)
+        system_prompt = opening_prompt(app_config, profile_id)
         history = [{"role": "system", "content": system_prompt}, {"role": "user", "content": "Let's begin."}]
 
-    background_tasks.add_task(process_story_in_background, job_id, history, request.config)
+    speculative = request.priority == "speculative" or (request.priority is None and request.choice)
+    priority = PriorityRef(SPECULATIVE if speculative else INTERACTIVE)
+    record = {
+        "status": "pending", "events": JobEvents(), "group": group,
+        "fingerprint": fingerprint, "refs": 1, "priority": priority
+    }
+    if app.state.queue is not None:
+        payload = {"history": history, "app_config": app_config, "session_id": request.session_id}
+        await asyncio.to_thread(app.state.queue.enqueue, job_id, payload, priority.value, group)
+        app.state.jobs.create(job_id, record)
+        follow_queued_job(job_id, record)
+    else:
+        task = asyncio.create_task(process_story_in_background(job_id, history, app_config, request.session_id))
+        app.state.jobs.create(job_id, {**record, "task": task})
+        task.add_done_callback(lambda _: forget_task(job_id))
+    app.state.singleflight.register(fingerprint, job_id)
     return {"job_id": job_id}
 
+# --- Shared Job Queue ---
+
+def apply_queue_row(job_id: str, job: dict, row: dict):
+    """Copies a queued job's status and progress, as a worker last wrote them, into its local record."""
+    if row['status'] in FINISHED_STATUSES:
+        # A page completed at its deadline stays in memory while its worker back-fills it
+        job['backfilling'] = row['state'] == "running"
+    if job['status'] in FINISHED_STATUSES:
+        # Late assets back-filled into the result after the page completed at its deadline
+        if row['result'] is not None and row['result'] != job.get('result'):
+            job['assets'] = row['assets']
+            app.state.jobs.update_result(job_id, row['result'])
+        return
+    for key in ('segment', 'assets', 'timings'):
+        if row[key] is not None:
+            job[key] = row[key]
+    if row['status'] in FINISHED_STATUSES:
+        job.pop('segment', None)
+        app.state.jobs.finish(job_id, row['status'], row['result'])
+    else:
+        job['status'] = row['status']
+
+async def mirror_queued_job(job_id: str, job: dict):
+    """
+    Follows a job that runs in a worker process: replays its events from the
+    queue into the local event log, so long-polls, WebSockets and SSE streams
+    work the same as for a job running in this process.
+    """
+    queue = app.state.queue
+    seq = 0
+    try:
+        while True:
+            row = await asyncio.to_thread(queue.get, job_id)
+            if row is None:
+                return
+            events = await asyncio.to_thread(queue.events_after, job_id, seq)
+            apply_queue_row(job_id, job, row)
+            for event_seq, event, data in events:
+                await job['events'].publish(event, data)
+                seq = event_seq + 1
+            if row['state'] == "finished" and seq >= row['next_seq']:
+                return
+            if not events:
+                await asyncio.sleep(gen_config.queue.poll_interval_seconds)
+    finally:
+        await job['events'].close()
+
+def follow_queued_job(job_id: str, job: dict):
+    job['follower'] = asyncio.create_task(mirror_queued_job(job_id, job))
+
+async def lookup_job(job_id: str) -> dict | None:
+    """
+    Returns the local record of a job. With the queue on, a job started
+    through another API process is picked up from the queue and followed here.
+    """
+    job = app.state.jobs.get(job_id)
+    if job is not None or app.state.queue is None:
+        return job
+    row = await asyncio.to_thread(app.state.queue.get, job_id)
+    if row is None:
+        return None
+    # Another request may have picked the job up while the queue was read
+    job = app.state.jobs.get(job_id)
+    if job is not None:
+        return job
+    job = {"status": "pending", "events": JobEvents(), "group": row['group_id'], "refs": 1,
+           "priority": PriorityRef(row['priority'])}
+    app.state.jobs.create(job_id, job)
+    apply_queue_row(job_id, job, row)
+    follow_queued_job(job_id, job)
+    return job
+
+async def cancel_job(job_id: str) -> bool:
+    """
+    Requests cancellation of a running job. A job shared by coalesced requests
+    is only cancelled once every requester has let go of it.
+    Returns False if there was nothing to cancel.
+    """
+    job = await lookup_job(job_id)
+    if job is None or job.get('cancel_requested'):
+        return False
+    # A page that completed at its deadline can still be stopped from back-filling its late assets
+    if job['status'] in FINISHED_STATUSES and not job.get('backfilling'):
+        return False
+    job['refs'] = job.get('refs', 1) - 1
+    if job['refs'] > 0:
+        return False
+    job['cancel_requested'] = True
+    task = job.get('task')
+    if task is not None:
+        task.cancel()
+    elif app.state.queue is not None:
+        # Its worker stops it at the next heartbeat
+        await asyncio.to_thread(app.state.queue.request_cancel, job_id)
+    return True
+
+@app.delete("/generate/{job_id}")
+async def cancel_generation(job_id: str):
+    """Cancels a job's in-flight work; media that has not started is never requested."""
+    cancelled = await cancel_job(job_id)
+    return {"job_id": job_id, "cancelled": cancelled, "status": app.state.jobs.status(job_id) or "not_found"}
+
+@app.post("/generate/{job_id}/keep")
+async def keep_only(job_id: str):
+    """
+    Called once the child picks a choice: promotes this job to interactive
+    priority and cancels every speculative sibling job (the other choices
+    for the same page), including the back-fill of a sibling page that
+    completed at its deadline.
+    """
+    job = await lookup_job(job_id)
+    if job is not None and 'priority' in job:
+        job['priority'].value = INTERACTIVE
+        if app.state.queue is not None:
+            await asyncio.to_thread(app.state.queue.set_priority, job_id, INTERACTIVE)
+    if job is None or job.get('group') is None:
+        return {"job_id": job_id, "cancelled": []}
+    siblings = [other_id for other_id, other in app.state.jobs.items()
+                if other_id != job_id and other.get('group') == job['group']]
+    if app.state.queue is not None:
+        queued = await asyncio.to_thread(app.state.queue.siblings, job['group'], job_id)
+        siblings += [other_id for other_id in queued if other_id not in siblings]
+    return {"job_id": job_id, "cancelled": [other_id for other_id in siblings if await cancel_job(other_id)]}
+
+FINAL_STATUSES = FINISHED_STATUSES + ('not_found',)
+MAX_LONG_POLL_SECONDS = 60
+
+def settled_assets(job: dict) -> int:
+    # A placeholder is still on its way, so it does not count as settled
+    return sum(1 for state in (job.get('assets') or {}).values() if state not in ("pending", "placeholder"))
+
+async def status_snapshot(job_id: str) -> dict:
+    job = await lookup_job(job_id)
+    status = app.state.jobs.status(job_id) or "not_found"
+    return {
+        "job_id": job_id,
+        "status": status,
+        "readable": status == "complete" or (job is not None and is_readable(job)),
+        "assets": dict(job['assets']) if job is not None and 'assets' in job else None,
+        "timings": {
+            stage: dict(value) if isinstance(value, dict) else value for stage, value in job['timings'].items()
+        } if job is not None and 'timings' in job else None
+    }
+
 @app.get("/generate/status/{job_id}", response_model=StatusResponse)
-async def get_status(job_id: str):
-    job = app.state.jobs.get(job_id, {})
-    return {"job_id": job_id, "status": job.get("status", "not_found")}
+async def get_status(job_id: str, wait: float = 0, known: str | None = None, settled: int | None = None):
+    """
+    Returns a job's status and per-asset progress. With `wait`, this is a long-poll:
+    the request is held until the status differs from `known` (or, if `settled` is
+    given, until more assets than that have finished), so clients learn about
+    changes the moment they happen instead of polling on a timer.
+    """
+    job = await lookup_job(job_id)
+    if job is not None and wait > 0:
+        await job['events'].wait_for(
+            lambda: job['status'] != known or (settled is not None and settled_assets(job) != settled),
+            min(wait, MAX_LONG_POLL_SECONDS)
+        )
+    return await status_snapshot(job_id)
+
+@app.post("/generate/status")
+async def get_statuses(request: BatchStatusRequest):
+    """Returns the status of several jobs in one call, e.g. every pre-generated choice of a page."""
+    return {"statuses": {job_id: await status_snapshot(job_id) for job_id in request.job_ids}}
+
+@app.websocket("/generate/ws/{job_id}")
+async def job_status_socket(websocket: WebSocket, job_id: str):
+    """Pushes every status change and finished asset of a job over a WebSocket until it finishes."""
+    await websocket.accept()
+    try:
+        job = await lookup_job(job_id)
+        # Follow only events published after the status snapshot we send first
+        start = len(job['events']) if job is not None else 0
+        snapshot = await status_snapshot(job_id)
+        status = snapshot["status"]
+        await websocket.send_json(snapshot)
+        if job is not None and status not in FINAL_STATUSES:
+            async for _, event, data in job['events'].subscribe(start):
+                if event == "media" or (event == "status" and data["status"] != status):
+                    snapshot = await status_snapshot(job_id)
+                    status = snapshot["status"]
+                    await websocket.send_json(snapshot)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+def media_as_base64(url: str | None) -> str:
+    """Inlines a /media URL as base64 for clients that predate the media endpoint."""
+    data = load_media(url.rsplit("/", 1)[-1]) if url else None
+    return base64.b64encode(data).decode('utf-8') if data else ""
+
+def to_legacy_result(result: dict) -> dict:
+    """Converts a URL-based result into the old base64 format."""
+    legacy = {key: value for key, value in result.items() if not key.endswith("_url") and key != "choices"}
+    legacy["narration_audio_b64"] = media_as_base64(result.get("narration_audio_url"))
+    legacy["main_illustration_b64"] = media_as_base64(result.get("main_illustration_url"))
+    legacy["choices"] = [
+        {
+            "text": choice["text"],
+            "audio_b64": media_as_base64(choice.get("audio_url")),
+            "image_b64": media_as_base64(choice.get("image_url"))
+        }
+        for choice in result.get("choices", [])
+    ]
+    return legacy
 
 @app.get("/generate/result/{job_id}")
-async def get_result(job_id: str):
-    job = app.state.jobs.get(job_id, {})
-    return job.get("result", {})
\ No newline at end of file
+async def get_result(job_id: str, media: str = "url"):
+    """
+    Returns the story segment. While media is still being generated this is a
+    partial segment (`"partial": true`) whose pending assets have no URL yet.
+    Media is referenced by /media URLs; pass `?media=base64` to get the old
+    inline base64 fields instead.
+    """
+    job = await lookup_job(job_id)
+    result = app.state.jobs.result(job_id) or {}
+    if not result and job is not None and job.get('segment') is not None:
+        result = {**job['segment'], "choices": [dict(choice) for choice in job['segment']["choices"]],
+                  "assets": dict(job['assets']), "partial": True}
+    if result and media == "base64":
+        return await asyncio.to_thread(to_legacy_result, result)
+    return result
+
+@app.get("/generate/stream/{job_id}")
+async def stream_generation(job_id: str, request: Request):
+    """
+    Streams a job's progress as Server-Sent Events: narrative tokens as the model
+    emits them, then the parsed choices, media-ready events and the final status.
+    Reconnecting clients can resume with the standard Last-Event-ID header.
+    """
+    job = await lookup_job(job_id)
+    if job is None:
+        status = app.state.jobs.status(job_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        # The job already finished and was spilled to disk; only its final status is left
+        job = {"events": JobEvents()}
+        await job['events'].publish("status", {"status": status})
+        await job['events'].close()
+
+    last_event_id = request.headers.get("last-event-id")
+    start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+
+    async def event_source():
+        async for index, event, data in job['events'].subscribe(start):
+            yield format_sse(index, event, data)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import argparse
+
+import yaml
+from dotenv import load_dotenv
+import google.generativeai as genai
+
+from generation.config import config as gen_config
+from generation.generators import (
+    get_story_prompt,
+    generate_story_text,
+    generate_audio_bytes,
+    generate_image_bytes,
+    parse_story_and_choices
+)
+from generation.clients import create_openai_client
+from generation.reference import load_reference_image
+from generation.tts import concat_mp3
+from generation.scheduler import SPECULATIVE, PriorityRef, current_priority
+from jobs.media import MediaStore
+from jobs.packs import PackWriter
+
+CHECKPOINT_FILE = "tree.json"
+CHECKPOINT_VERSION = 1
+
+class BudgetExhausted(Exception):
+    """Raised when a run has used up its provider-call budget."""
+
+class PrerenderBudget:
+    """Caps the story nodes and provider calls of a run, including what earlier runs already spent."""
+    def __init__(self, max_nodes: int, max_provider_calls: int, provider_calls: int = 0):
+        self.max_nodes = max_nodes
+        self.max_provider_calls = max_provider_calls
+        self.provider_calls = provider_calls
+        self.planned_nodes = 0
+
+    def plan_node(self) -> bool:
+        if self.planned_nodes >= self.max_nodes:
+            return False
+        self.planned_nodes += 1
+        return True
+
+    def spend(self):
+        if self.provider_calls >= self.max_provider_calls:
+            raise BudgetExhausted(f"Provider call budget of {self.max_provider_calls} used up")
+        self.provider_calls += 1
+
+def work_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def node_id(parent_id: str | None, index: int) -> str:
+    return "root" if parent_id is None else f"{parent_id}.{index}"
+
+class StoryTree:
+    """
+    The rendered story tree and its checkpoint. Nodes are keyed by their path
+    from the opening ("root", "root.0", "root.0.1", ...). Finished text and
+    media are recorded by the prompt that produced them, so identical prompts
+    in different branches, or in an earlier interrupted run, are reused.
+    """
+    def __init__(self, directory: str, app_config: dict):
+        self.directory = directory
+        self.path = os.path.join(directory, CHECKPOINT_FILE)
+        self.media = MediaStore(os.path.join(directory, "media"))
+        self.data = {"version": CHECKPOINT_VERSION, "config": app_config, "nodes": {}, "texts": {}, "assets": {}, "provider_calls": 0}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                saved = json.load(file)
+            if saved.get("config") != app_config:
+                raise ValueError(f"{self.path} was rendered from a different config; use another output directory")
+            self.data = saved
+
+    @property
+    def nodes(self) -> dict:
+        return self.data["nodes"]
+
+    def history_for(self, parent_id: str | None, choice: str | None) -> list:
+        """Rebuilds the conversation that leads to a node from the responses along its path."""
+        history = [{"role": "system", "content": get_story_prompt(self.data["config"])}, {"role": "user", "content": "Let's begin."}]
+        chain = []
+        while parent_id is not None:
+            chain.insert(0, parent_id)
+            parent_id = self.nodes[parent_id]["parent"]
+        picked = [self.nodes[key]["choice"] for key in chain[1:]] + [choice]
+        for key, next_choice in zip(chain, picked):
+            history.append({"role": "assistant", "content": self.nodes[key]["response"]})
+            history.append({"role": "user", "content": next_choice})
+        return history
+
+    def save(self, provider_calls: int):
+        """Writes the checkpoint atomically, so an interrupted run never leaves it half written."""
+        self.data["provider_calls"] = provider_calls
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.data, file)
+        os.replace(temp_path, self.path)
+
+class Prerenderer:
+    """
+    Expands a story breadth-first from the opening, rendering each node's text,
+    narration, illustration and choice clips and icons like a live job would.
+    """
+    def __init__(self, client, tree: StoryTree, reference_image, voice: str, budget: PrerenderBudget):
+        self.client = client
+        self.tree = tree
+        self.reference_image = reference_image
+        self.voice = voice
+        self.budget = budget
+        self.in_flight = {}
+        self.stats = {"rendered": 0, "failed": 0, "reused": 0}
+
+    async def shared(self, table: str, key: str, make):
+        """
+        Runs `make` once per key: concurrent branches wait for the same call and
+        finished results come from the checkpoint. Failures are not remembered.
+        """
+        if key in self.tree.data[table]:
+            self.stats["reused"] += 1
+            return self.tree.data[table][key]
+        if key in self.in_flight:
+            self.stats["reused"] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        async def run():
+            try:
+                self.budget.spend()
+                value = await make()
+                self.tree.data[table][key] = value
+                return value
+            finally:
+                self.in_flight.pop(key, None)
+
+        self.in_flight[key] = asyncio.ensure_future(run())
+        return await asyncio.shield(self.in_flight[key])
+
+    async def text(self, history: list) -> str:
+        return await self.shared("texts", work_key("text", history), lambda: generate_story_text(self.client, history))
+
+    async def audio(self, text: str) -> str:
+        async def make():
+            return self.tree.media.put(await generate_audio_bytes(self.client, text, self.voice), "mp3")
+        return await self.shared("assets", work_key("audio", self.voice, text), make)
+
+    async def image(self, prompt: str, high_quality: bool = False) -> str:
+        async def make():
+            return self.tree.media.put(await generate_image_bytes(prompt, self.reference_image, high_quality=high_quality), "png")
+        return await self.shared("assets", work_key("image", high_quality, prompt), make)
+
+    async def narration(self, story_text: str, choices: list[str]) -> str:
+        """The story clip followed by the choice clips, which are reused from the choices themselves."""
+        key = work_key("narration", self.voice, story_text, choices)
+        if key not in self.tree.data["assets"]:
+            media_ids = await asyncio.gather(self.audio(story_text), *(self.audio(choice) for choice in choices))
+            # Joining clips is local work, not a provider call
+            clips = [self.tree.media.get(media_id) for media_id in media_ids]
+            self.tree.data["assets"][key] = self.tree.media.put(concat_mp3(clips), "mp3")
+        return self.tree.data["assets"][key]
+
+    async def render(self, parent_id: str | None, choice: str | None, depth: int) -> dict:
+        history = self.tree.history_for(parent_id, choice)
+        response = await self.text(history)
+        story_text, choices = parse_story_and_choices(response)
+        narration, illustration, choice_audio, choice_images = await asyncio.gather(
+            self.narration(story_text, choices),
+            self.image(story_text, high_quality=True),
+            asyncio.gather(*(self.audio(choice_text) for choice_text in choices)),
+            asyncio.gather(*(self.image(choice_text) for choice_text in choices)),
+        )
+        return {
+            "parent": parent_id,
+            "choice": choice,
+            "depth": depth,
+            "response": response,
+            "story_text": story_text,
+            "narration": narration,
+            "main_illustration": illustration,
+            "choices": [
+                {"text": text, "audio": audio, "image": image}
+                for text, audio, image in zip(choices, choice_audio, choice_images)
+            ],
+        }
+
+    def frontier(self, max_depth: int) -> list[tuple]:
+        """The nodes still to render, in breadth-first order, skipping everything the checkpoint holds."""
+        pending, queue = [], [("root", None, None, 0)]
+        while queue:
+            key, parent_id, choice, depth = queue.pop(0)
+            node = self.tree.nodes.get(key)
+            if node is None:
+                pending.append((key, parent_id, choice, depth))
+                continue
+            self.budget.plan_node()
+            if depth < max_depth:
+                queue += [(node_id(key, i), key, option["text"], depth + 1) for i, option in enumerate(node["choices"])]
+        return [entry for entry in pending if self.budget.plan_node()]
+
+    async def run(self, max_depth: int, concurrency: int):
+        queue = asyncio.Queue()
+        for entry in self.frontier(max_depth):
+            queue.put_nowait(entry)
+
+        async def worker():
+            while True:
+                key, parent_id, choice, depth = await queue.get()
+                try:
+                    node = await self.render(parent_id, choice, depth)
+                    self.tree.nodes[key] = node
+                    self.tree.save(self.budget.provider_calls)
+                    self.stats["rendered"] += 1
+                    print(f"Rendered {key} ({len(self.tree.nodes)} nodes, {self.budget.provider_calls} provider calls).")
+                    if depth < max_depth:
+                        for i, option in enumerate(node["choices"]):
+                            if self.budget.plan_node():
+                                queue.put_nowait((node_id(key, i), key, option["text"], depth + 1))
+                except BudgetExhausted as e:
+                    print(f"Stopping at {key}: {e}")
+                except Exception as e:
+                    # Left out of the checkpoint, so the next run tries this branch again
+                    self.stats["failed"] += 1
+                    print(f"ERROR: Could not render {key}: {e}")
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+        self.tree.save(self.budget.provider_calls)
+        return self.stats
+
+def export_pack(tree: StoryTree, path: str) -> int:
+    """
+    Writes the rendered pages to a story pack for replay mode, opening page
+    first. A choice past the rendered depth has no `next` page. Returns the page count.
+    """
+    with PackWriter(path) as writer:
+        queue = ["root"] if "root" in tree.nodes else []
+        while queue:
+            key = queue.pop(0)
+            node = tree.nodes[key]
+            media_ids = [node["narration"], node["main_illustration"]]
+            choices = []
+            for i, option in enumerate(node["choices"]):
+                child = node_id(key, i)
+                choices.append({**option, "next": child if child in tree.nodes else None})
+                media_ids += [option["audio"], option["image"]]
+                if child in tree.nodes:
+                    queue.append(child)
+            for media_id in media_ids:
+                if media_id is not None:
+                    writer.add_media(media_id, tree.media.get(media_id))
+            writer.add_node(key, {"story_text": node["story_text"], "narration": node["narration"],
+                                  "main_illustration": node["main_illustration"], "choices": choices})
+        return len(writer)
+
+async def prerender(client, app_config: dict, directory: str, depth: int, max_nodes: int,
+                    max_provider_calls: int, concurrency: int) -> dict:
+    """
+    Renders a story tree into `directory`, resuming from its checkpoint if one
+    exists. Returns counts of rendered, failed and reused work.
+    """
+    # Offline rendering never holds up a child waiting for a live page
+    current_priority.set(PriorityRef(SPECULATIVE))
+    tree = StoryTree(directory, app_config)
+    budget = PrerenderBudget(max_nodes, max_provider_calls, tree.data["provider_calls"])
+    reference_image = await asyncio.to_thread(load_reference_image, os.path.join("../frontend", app_config["child_photo_path"]))
+    renderer = Prerenderer(client, tree, reference_image, app_config.get("voice", "alloy"), budget)
+    started = time.monotonic()
+    stats = await renderer.run(depth, concurrency)
+    return {**stats, "nodes": len(tree.nodes), "provider_calls": budget.provider_calls, "seconds": round(time.monotonic() - started, 1)}
+
+def main(args):
+    print("--- Pre-rendering a Story Tree ---")
+    load_dotenv("../.env")
+    with open(args.config, "r") as file:
+        app_config = yaml.safe_load(file)
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    client = create_openai_client(os.getenv("OPENAI_API_KEY"))
+    result = asyncio.run(prerender(client, app_config, args.out, args.depth, args.max_nodes, args.max_provider_calls, args.concurrency))
+    print(f"Done: {result}")
+    if args.pack:
+        pages = export_pack(StoryTree(args.out, app_config), args.pack)
+        print(f"Wrote {pages} pages to {args.pack}")
+
+if __name__ == "__main__":
+    settings = gen_config.prerender
+    parser = argparse.ArgumentParser(description="Render a branching story ahead of time, breadth-first, resuming from a checkpoint.")
+    parser.add_argument("--config", default="../frontend/config.yaml", help="the child's config.yaml")
+    parser.add_argument("--out", default=settings.output_directory)
+    parser.add_argument("--depth", type=int, default=settings.depth, help="choices deep below the opening page")
+    parser.add_argument("--max-nodes", type=int, default=settings.max_nodes)
+    parser.add_argument("--max-provider-calls", type=int, default=settings.max_provider_calls)
+    parser.add_argument("--concurrency", type=int, default=settings.concurrency, help="pages rendered at once")
+    parser.add_argument("--pack", help="also write the tree to this story pack file for replay mode")
+    main(parser.parse_args())
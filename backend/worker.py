@@ -0,0 +1,159 @@
+import os
+import uuid
+import socket
+import asyncio
+import argparse
+
+import main
+from main import app, gen_config, process_story_in_background
+from generation.cache import media_cache
+from generation.resilience import resilience_stats
+from generation.scheduler import PriorityRef, scheduler_stats, share_limits
+from jobs.events import JobEvents
+from jobs.store import FINISHED_STATUSES
+
+class QueueEvents(JobEvents):
+    """
+    A job's event log that is also written to the shared queue, together with
+    the job's status and progress, so the API processes can follow the job.
+    """
+    def __init__(self, queue, job_id: str, worker_id: str, job: dict, resumed: bool = False):
+        super().__init__()
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.job = job
+        # A job taken over from a dead worker is re-run from the start; its tokens were already streamed
+        self.resumed = resumed
+        self._tokens = []
+        self._flusher = None
+        self._write_lock = asyncio.Lock()
+
+    def progress(self) -> dict:
+        progress = {key: self.job.get(key) for key in ('status', 'segment', 'assets', 'timings')}
+        if self.job['status'] in FINISHED_STATUSES:
+            progress['result'] = self.job.get('result')
+            progress['backfilling'] = bool(self.job.get('backfilling'))
+        return progress
+
+    async def publish(self, event: str, data: dict | None = None):
+        await super().publish(event, data)
+        if event == "token" and self.resumed:
+            # Followers would see the narrative twice; the re-run's story event carries its final text
+            return
+        if event == "token":
+            # Tokens change nothing but the stream: they skip the progress columns and are
+            # written in batches, not one write transaction per token
+            self._tokens.append((event, data or {}))
+            if self._flusher is None:
+                self._flusher = asyncio.create_task(self._flush_later())
+            return
+        await self._write([*self._take_tokens(), (event, data or {})], self.progress())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self._write(self._take_tokens())
+        await super().close()
+
+    def _take_tokens(self) -> list:
+        tokens, self._tokens = self._tokens, []
+        return tokens
+
+    async def _flush_later(self):
+        await asyncio.sleep(gen_config.queue.token_flush_seconds)
+        self._flusher = None
+        await self._write(self._take_tokens())
+
+    async def _write(self, events: list, progress: dict | None = None):
+        if not events:
+            return
+        # Batches are written in the order they were taken
+        async with self._write_lock:
+            await asyncio.to_thread(self.queue.publish_many, self.job_id, self.worker_id, events, progress)
+
+async def run_job(queue, worker_id: str, claimed: dict):
+    """
+    Runs one claimed job, renewing its lease on every heartbeat. The job is
+    cancelled when an API process asks for it or the lease is lost.
+    """
+    job_id, payload = claimed['job_id'], claimed['payload']
+    job = {"status": "pending", "refs": 1, "priority": PriorityRef(claimed['priority'])}
+    resumed = claimed['attempts'] > 1 and await asyncio.to_thread(queue.has_streamed, job_id)
+    job['events'] = QueueEvents(queue, job_id, worker_id, job, resumed)
+    app.state.jobs.create(job_id, job)
+    print(f"Worker {worker_id} claimed job {job_id} (attempt {claimed['attempts']}).")
+    task = asyncio.create_task(process_story_in_background(job_id, payload['history'], payload['app_config'], payload['session_id']))
+    while not task.done():
+        await asyncio.wait([task], timeout=gen_config.queue.heartbeat_seconds)
+        if task.done():
+            break
+        lease = await asyncio.to_thread(queue.heartbeat, job_id, worker_id)
+        if lease is None:
+            print(f"Worker {worker_id} lost the lease on job {job_id}; stopping it.")
+        elif not lease['cancel_requested']:
+            # A job promoted by /keep on any API process jumps ahead of speculative work here too
+            job['priority'].value = lease['priority']
+            continue
+        job['cancel_requested'] = True
+        task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+def current_stats(jobs: int) -> dict:
+    return {"scheduler": scheduler_stats(), "resilience": resilience_stats(), "cache": media_cache.stats(), "jobs": jobs}
+
+async def report_stats(queue, worker_id: str, running: set):
+    """
+    Writes this worker's scheduler, resilience and cache stats to the shared
+    file, since the API processes that serve the stats endpoints make no provider calls.
+    """
+    while True:
+        await asyncio.to_thread(queue.report_worker, worker_id, current_stats(len(running)))
+        await asyncio.sleep(gen_config.queue.heartbeat_seconds)
+
+async def run_worker(worker_id: str, concurrency: int, stop=None):
+    """Claims and runs up to `concurrency` jobs at a time until `stop` (a threading.Event) is set."""
+    queue = app.state.queue
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    reporter = asyncio.create_task(report_stats(queue, worker_id, running))
+
+    def finished(task):
+        running.discard(task)
+        slots.release()
+
+    while stop is None or not stop.is_set():
+        await slots.acquire()
+        claimed = await asyncio.to_thread(queue.claim, worker_id)
+        if claimed is None:
+            slots.release()
+            await asyncio.sleep(gen_config.queue.poll_interval_seconds)
+            continue
+        task = asyncio.create_task(run_job(queue, worker_id, claimed))
+        running.add(task)
+        task.add_done_callback(finished)
+    reporter.cancel()
+    for task in list(running):
+        task.cancel()
+    await asyncio.gather(reporter, *running, return_exceptions=True)
+    # A last report, so the figures of a stopped worker include its final jobs
+    await asyncio.to_thread(queue.report_worker, worker_id, current_stats(0))
+
+async def serve(worker_id: str, concurrency: int):
+    # The same thread pool, image model and client setup as the API process
+    async with main.lifespan(app):
+        await run_worker(worker_id, concurrency)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run story jobs from the shared queue. Start as many as there are cores.")
+    parser.add_argument("--concurrency", type=int, default=gen_config.queue.worker_concurrency, help="jobs run at once")
+    parser.add_argument("--workers", type=int, default=gen_config.queue.workers,
+                        help="worker processes sharing the providers; this one takes an equal share of each provider limit")
+    args = parser.parse_args()
+    if app.state.queue is None:
+        raise SystemExit("The job queue is off; set queue.enabled in generator_config.yaml for the API and the workers.")
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    print(f"--- Story Worker {worker_id} ---")
+    share_limits(args.workers)
+    asyncio.run(serve(worker_id, args.concurrency))
@@ -1,13 +1,14 @@
+import os
 import streamlit as st
+import streamlit.components.v1 as components
 import yaml
 import requests
-import base64
-import time
-from io import BytesIO
-from PIL import Image
 
 # --- Configuration ---
 BACKEND_URL = "http://127.0.0.1:8000"
+LONG_POLL_SECONDS = 25
+# Shorter waits while filling in a shown page, so button clicks are not held up
+REFRESH_POLL_SECONDS = 5
 try:
     with open("config.yaml", 'r') as file:
         config = yaml.safe_load(file)
@@ -27,65 +28,178 @@ if 'audio_to_play' not in st.session_state:
     st.session_state.audio_to_play = None
 if 'pregen_jobs' not in st.session_state:
     st.session_state.pregen_jobs = {}
+if 'story_session' not in st.session_state:
+    st.session_state.story_session = None
+
+def still_filling_in(segment):
+    """A partial page, or one that completed at its deadline and still has placeholders to replace."""
+    return segment.get('partial') or 'placeholder' in (segment.get('assets') or {}).values()
+
+# Plays a page's narration clips one after another: the sentence clips, then each
+# choice's clip. The player fetches each next clip itself, so reruns that fill in
+# pictures do not restart it.
+NARRATION_CLIPS_PLAYER = """
+<audio id="player" controls autoplay style="width: 100%%"></audio>
+<script>
+const BACKEND_URL = "%(backend_url)s", JOB_ID = "%(job_id)s";
+const player = document.getElementById('player');
+let next = 0;
+async function playNext() {
+    while (true) {
+        const segment = await (await fetch(`${BACKEND_URL}/generate/result/${JOB_ID}`)).json();
+        const assets = segment.assets || {};
+        const clips = [
+            ...(segment.narration_chunks || []).map((url, i) => [url, `narration_chunk:${i}`]),
+            ...(segment.choices || []).map((choice, i) => [choice.audio_url, `choice_audio:${i}`]),
+        ];
+        while (next < clips.length && assets[clips[next][1]] === 'failed') next++;
+        if (next >= clips.length) return;
+        if (clips[next][0]) {
+            player.src = BACKEND_URL + clips[next++][0];
+            return player.play().catch(e => console.warn("Audio autoplay prevented by browser."));
+        }
+        const settled = Object.values(assets).filter(state => !['pending', 'placeholder'].includes(state)).length;
+        const known = segment.partial ? 'generating_media' : 'complete';
+        await fetch(`${BACKEND_URL}/generate/status/${JOB_ID}?wait=25&known=${known}&settled=${settled}`);
+    }
+}
+player.addEventListener('ended', playNext);
+playNext();
+</script>
+"""
+
+def narration_for(segment, job_id):
+    """
+    The joined narration once it is ready; until then the page's clips, played
+    as they arrive. None while neither has started.
+    """
+    if segment.get('narration_audio_url'):
+        return media_url(segment['narration_audio_url'])
+    if (segment.get('narration_chunks') or [None])[0]:
+        return {"clips": job_id}
+    return None
 
 # --- UI Elements ---
 audio_placeholder = st.empty()
-if st.session_state.audio_to_play:
+if isinstance(st.session_state.audio_to_play, dict):
+    with audio_placeholder:
+        components.html(NARRATION_CLIPS_PLAYER % {"backend_url": BACKEND_URL, "job_id": st.session_state.audio_to_play['clips']}, height=60)
+elif st.session_state.audio_to_play:
     audio_placeholder.audio(st.session_state.audio_to_play, format='audio/mp3', autoplay=True)
-    st.session_state.audio_to_play = None
+if st.session_state.audio_to_play:
+    # Keep the narration element in place while a page reruns to fill in pictures
+    if not (st.session_state.history and still_filling_in(st.session_state.history[-1])):
+        st.session_state.audio_to_play = None
 
 # --- API Call Functions ---
-def trigger_generation(history=None, choice=None):
-    payload = {"config": config}
-    if history and choice:
-        payload["conversation_history"] = history
+def start_session():
+    """Hands the config to the backend once; the story history is kept there."""
+    response = requests.post(f"{BACKEND_URL}/sessions", json={"config": config})
+    response.raise_for_status()
+    return response.json()['session_id']
+
+def trigger_generation(segment_id=None, choice=None):
+    payload = {"session_id": st.session_state.story_session}
+    if segment_id and choice:
+        payload["segment_id"] = segment_id
         payload["choice"] = choice
     response = requests.post(f"{BACKEND_URL}/generate/start", json=payload)
     response.raise_for_status()
     return response.json()['job_id']
 
-def get_status(job_id):
-    if not job_id: return "not_found"
-    response = requests.get(f"{BACKEND_URL}/generate/status/{job_id}")
+def media_url(path):
+    """Turns a /media path from a result into an absolute backend URL."""
+    return f"{BACKEND_URL}{path}" if path else None
+
+def get_status(job_id, known=None, wait=0, settled=None):
+    """
+    Returns a job's status and asset progress. With `wait`, the backend holds the
+    request until the status changes from `known` (or more than `settled` assets
+    have finished), so waiting for a job costs one request per change.
+    """
+    if not job_id: return {"status": "not_found", "readable": False, "assets": None}
+    params = {"wait": wait, "known": known, "settled": settled} if wait else None
+    response = requests.get(f"{BACKEND_URL}/generate/status/{job_id}", params=params, timeout=wait + 10)
+    response.raise_for_status()
+    return response.json()
+
+def get_statuses(job_ids):
+    """Fetches the status of several jobs in a single request."""
+    job_ids = [job_id for job_id in job_ids if job_id]
+    if not job_ids: return {}
+    response = requests.post(f"{BACKEND_URL}/generate/status", json={"job_ids": job_ids}, timeout=10)
     response.raise_for_status()
-    return response.json()['status']
+    return response.json()['statuses']
+
+def settled_count(segment):
+    # Placeholders are still on their way; the backend does not count them as settled either
+    return sum(1 for state in (segment.get('assets') or {}).values() if state not in ('pending', 'placeholder'))
+
+def get_result(job_id):
+    response = requests.get(f"{BACKEND_URL}/generate/result/{job_id}")
+    response.raise_for_status()
+    return response.json()
+
+def keep_only(job_id):
+    """Tells the backend the child picked this job, so the other branches are cancelled."""
+    if not job_id: return
+    try:
+        requests.post(f"{BACKEND_URL}/generate/{job_id}/keep", timeout=5)
+    except requests.RequestException as e:
+        print(f"Could not cancel sibling jobs: {e}")
 
 def poll_for_result(job_id):
+    """
+    Waits until the page can be shown (text and the first narration clip ready)
+    and returns it. Images and clips that are still being made arrive later; see
+    `refresh_partial_segment`.
+    """
     if not job_id:
         st.error("Something went wrong, no job to poll.")
         return None
+    status, settled = None, None
     while True:
-        status = get_status(job_id)
-        if status == 'complete':
+        # Readiness can change with any settled asset, not only with the status
+        progress = get_status(job_id, known=status, wait=LONG_POLL_SECONDS, settled=settled)
+        status = progress['status']
+        settled = settled_count(progress)
+        if progress['readable']:
             break
-        elif status == 'failed':
+        elif status in ('failed', 'cancelled', 'not_found'):
             st.error("Story generation failed. Please try again.")
             return None
-        time.sleep(1)
-    response = requests.get(f"{BACKEND_URL}/generate/result/{job_id}")
-    response.raise_for_status()
-    return response.json()
+    return get_result(job_id)
+
+def refresh_partial_segment(segment):
+    """
+    Waits for the next asset of a partially generated page, or of a page that
+    completed at its deadline with placeholders, and returns the updated page.
+    """
+    job_id = segment['job_id']
+    known = 'generating_media' if segment.get('partial') else 'complete'
+    get_status(job_id, known=known, wait=REFRESH_POLL_SECONDS, settled=settled_count(segment))
+    return {**get_result(job_id), "job_id": job_id}
 
 # --- UI Views ---
 if st.session_state.view == 'intro':
     if not st.session_state.pregen_jobs.get('intro_job'):
+        st.session_state.story_session = start_session()
         st.session_state.pregen_jobs['intro_job'] = trigger_generation()
     vid_col, _ = st.columns([2, 1]) 
     with vid_col:
-        try:
-            with open(config['intro_video_path'], 'rb') as video_file:
-                video_bytes = video_file.read()
-                st.video(video_bytes)
-        except FileNotFoundError:
+        # The browser streams the video from the backend instead of this script reading it on every rerun
+        if os.path.isfile(config['intro_video_path']):
+            st.video(f"{BACKEND_URL}/intro/video")
+        else:
             st.warning(f"Intro video not found at: {config['intro_video_path']}")
     if st.button("Let's start the adventure!"):
         with st.spinner("The first page of our story is being drawn..."):
             job_id = st.session_state.pregen_jobs.get('intro_job')
             story_data = poll_for_result(job_id)
             if story_data:
-                st.session_state.history = [story_data]
+                st.session_state.history = [{**story_data, "job_id": job_id}]
                 st.session_state.view = 'story'
-                st.session_state.audio_to_play = base64.b64decode(story_data['narration_audio_b64'])
+                st.session_state.audio_to_play = narration_for(story_data, job_id)
                 st.session_state.pregen_jobs = {}
                 st.rerun()
 
@@ -94,13 +208,10 @@ elif st.session_state.view == 'story':
     main_col, options_col = st.columns([0.6, 0.4])
 
     with main_col:
-        if current_segment.get('main_illustration_b64'):
+        if current_segment.get('main_illustration_url'):
             try:
-                image_data = base64.b64decode(current_segment['main_illustration_b64'])
-                img = Image.open(BytesIO(image_data))
-                img.thumbnail((700, 700))
-                # --- FIX: Display the image at its actual resized dimensions ---
-                st.image(img) 
+                # The browser fetches (and caches) the image straight from the backend
+                st.image(media_url(current_segment['main_illustration_url']), width=700)
             except Exception as e:
                 st.error("Could not display the main illustration.")
                 print(e)
@@ -113,7 +224,7 @@ elif st.session_state.view == 'story':
         if not st.session_state.pregen_jobs and current_segment['choices']:
             for choice in current_segment['choices']:
                 st.session_state.pregen_jobs[choice['text']] = trigger_generation(
-                    current_segment['conversation_history'], choice['text']
+                    current_segment['segment_id'], choice['text']
                 )
         if not current_segment['choices']:
             st.balloons()
@@ -125,16 +236,14 @@ elif st.session_state.view == 'story':
                 st.session_state.pregen_jobs = {}
                 st.rerun()
         else:
+            # One status request per rerun for all choices
+            statuses = get_statuses(st.session_state.pregen_jobs.values())
             for choice in current_segment['choices']:
                 job_id = st.session_state.pregen_jobs.get(choice['text'])
-                status = get_status(job_id)
-                if choice.get('image_b64'):
+                status = statuses.get(job_id, {}).get('status', 'not_found')
+                if choice.get('image_url'):
                     try:
-                        choice_img_data = base64.b64decode(choice['image_b64'])
-                        choice_img = Image.open(BytesIO(choice_img_data))
-                        choice_img.thumbnail((250, 250))
-                        # --- FIX: Display the image at its actual resized dimensions ---
-                        st.image(choice_img)
+                        st.image(media_url(choice['image_url']), width=250)
                     except Exception as e:
                          st.write(f"*{choice['text']}*")
                          print(f"Error displaying choice image: {e}")
@@ -142,12 +251,22 @@ elif st.session_state.view == 'story':
                 # --- FIX: Address deprecation warning for button ---
                 if st.button(choice['text'], key=f"choice_{choice['text']}", use_container_width=True):
                     with st.spinner("Turning the page..."):
+                        keep_only(job_id)
                         next_segment = poll_for_result(job_id)
                         if next_segment:
-                            st.session_state.history.append(next_segment)
-                            st.session_state.audio_to_play = base64.b64decode(next_segment['narration_audio_b64'])
+                            st.session_state.history.append({**next_segment, "job_id": job_id})
+                            st.session_state.audio_to_play = narration_for(next_segment, job_id)
                             st.session_state.pregen_jobs = {}
                             st.rerun()
                 if status != 'complete':
                      st.spinner("")
-                st.markdown("---")
\ No newline at end of file
+                st.markdown("---")
+
+    # Pictures that were still being drawn when the page turned are filled in as they arrive
+    if still_filling_in(current_segment):
+        refreshed = refresh_partial_segment(current_segment)
+        if not st.session_state.audio_to_play:
+            # Narration that missed its deadline starts once it arrives
+            st.session_state.audio_to_play = narration_for(refreshed, current_segment['job_id'])
+        st.session_state.history[-1] = refreshed
+        st.rerun()
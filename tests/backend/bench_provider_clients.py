@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import resource
+import threading
+import time
+
+from openai import OpenAI
+
+from backend.generation import generators
+from backend.generation.cache import MediaCache
+from backend.generation.clients import create_openai_client
+from backend.generation.config import ProviderLimitConfig
+from backend.generation.scheduler import ProviderScheduler, schedulers
+from tests.backend.fake_providers import FakeProviderServer, create_fake_provider_app
+
+async def fan_out(client, calls: int) -> dict:
+    """Runs `calls` TTS requests at once and samples the thread count while they run."""
+    peak_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.create_task(sample_threads())
+    start = time.monotonic()
+    await asyncio.gather(*(generators.generate_audio_bytes(client, f"Page {i}", "onyx") for i in range(calls)))
+    elapsed = time.monotonic() - start
+    done.set()
+    await sampler
+    return {"seconds": elapsed, "calls_per_second": calls / elapsed, "peak_threads": peak_threads}
+
+async def main(calls: int, latency: float):
+    print("--- Benchmarking Provider Clients Against a Local Fake Server ---")
+    print(f"{calls} concurrent TTS calls, {latency * 1000:.0f} ms server latency\n")
+
+    # Measure the client layer only: no cache hits and no scheduler cap
+    generators.media_cache = MediaCache(None, 0, 0)
+    schedulers["openai_tts"] = ProviderScheduler("openai_tts", ProviderLimitConfig(max_concurrency=calls))
+
+    with FakeProviderServer(create_fake_provider_app(latency)) as server:
+        threaded = await fan_out(OpenAI(api_key="fake", base_url=server.base_url), calls)
+        pooled_client = create_openai_client("fake", base_url=server.base_url)
+        await fan_out(pooled_client, 10)  # warm up the connection pool
+        pooled = await fan_out(pooled_client, calls)
+        await pooled_client.close()
+
+    for name, result in (("sync client + to_thread", threaded), ("AsyncOpenAI + shared pool", pooled)):
+        print(f"{name:28s} {result['seconds']:6.2f} s  {result['calls_per_second']:7.1f} calls/s  "
+              f"peak threads {result['peak_threads']}")
+    print(f"\nPeak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare threaded vs native async provider clients.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.latency))
@@ -0,0 +1,178 @@
+import asyncio
+import base64
+import json
+import random
+import socket
+import threading
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from PIL import Image
+
+from tests.backend.fakes import STORY_RESPONSE
+
+class ProviderProfile:
+    """
+    How a simulated provider behaves: a latency distribution around `latency`
+    seconds ("fixed", "uniform" or "lognormal", with `jitter` as the spread),
+    the share of calls that fail with a 429 or 500, and the response size.
+    """
+    def __init__(self, latency: float = 0.2, distribution: str = "fixed", jitter: float = 0.5,
+                 error_rate: float = 0.0, payload_kb: int = 32):
+        self.latency = latency
+        self.distribution = distribution
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_kb = payload_kb
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.distribution == "uniform":
+            return rng.uniform(self.latency * (1 - self.jitter), self.latency * (1 + self.jitter))
+        if self.distribution == "lognormal":
+            # `latency` is the median; a long right tail like real provider latencies
+            return self.latency * rng.lognormvariate(0, self.jitter)
+        return self.latency
+
+    def sample_error(self, rng: random.Random) -> int | None:
+        if rng.random() >= self.error_rate:
+            return None
+        return 429 if rng.random() < 0.5 else 500
+
+def noise_png(payload_kb: int, seed: int = 0) -> bytes:
+    """A real PNG of random pixels, which barely compresses, so its size tracks `payload_kb`."""
+    side = max(8, int((payload_kb * 1024 / 3) ** 0.5))
+    rng = random.Random(seed)
+    image = Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+def _error_response(status: int) -> JSONResponse:
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    return JSONResponse({"error": {"message": f"Simulated {kind}", "type": kind, "code": kind}}, status_code=status)
+
+def create_fake_provider_app(latency: float = 0.2, text: ProviderProfile | None = None,
+                             tts: ProviderProfile | None = None, image: ProviderProfile | None = None,
+                             seed: int | None = None) -> FastAPI:
+    """
+    An HTTP server that simulates the providers: OpenAI-compatible chat
+    completions (streaming too) and speech, plus a Gemini-style generateContent
+    endpoint for images. Each provider follows its own profile; without one it
+    answers after a fixed `latency`.
+    """
+    text = text or ProviderProfile(latency)
+    tts = tts or ProviderProfile(latency)
+    image = image or ProviderProfile(latency, payload_kb=256)
+    rng = random.Random(seed)
+    image_payload = noise_png(image.payload_kb)
+    app = FastAPI()
+    app.state.calls = {"chat": 0, "tts": 0, "image": 0, "errors": 0}
+
+    async def simulate(profile: ProviderProfile, kind: str) -> JSONResponse | None:
+        app.state.calls[kind] += 1
+        await asyncio.sleep(profile.sample_latency(rng))
+        status = profile.sample_error(rng)
+        if status is not None:
+            app.state.calls["errors"] += 1
+            return _error_response(status)
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = await simulate(text, "chat")
+        if error is not None:
+            return error
+        if body.get("stream"):
+            async def chunks():
+                for word in STORY_RESPONSE.split(" "):
+                    delta = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                    yield f"data: {json.dumps({'id': 'fake', 'object': 'chat.completion.chunk', 'created': 0, 'model': body['model'], **delta})}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+        return {
+            "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": STORY_RESPONSE}}],
+        }
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        error = await simulate(tts, "tts")
+        if error is not None:
+            return error
+        # Scale the clip with the text, like real speech
+        size = max(1, tts.payload_kb * 1024 * len(body["input"]) // 200)
+        return Response(b"ID3" + (body["input"].encode() * (size // max(1, len(body["input"])) + 1))[:size], media_type="audio/mpeg")
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str, request: Request):
+        await request.body()
+        error = await simulate(image, "image")
+        if error is not None:
+            return error
+        return {"candidates": [{"content": {"parts": [
+            {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(image_payload).decode()}}
+        ]}}]}
+
+    return app
+
+class SimulatedProviderError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+class FakeImageModel:
+    """
+    Stands in for `genai.GenerativeModel` and calls the fake server's
+    generateContent endpoint, returning a response shaped like the SDK's.
+    """
+    def __init__(self, root_url: str, model_name: str, http: httpx.AsyncClient):
+        self.url = f"{root_url}/v1beta/models/{model_name}:generateContent"
+        self.http = http
+
+    async def generate_content_async(self, contents):
+        prompt = next((part for part in contents if isinstance(part, str)), "")
+        response = await self.http.post(self.url, json={"contents": [{"parts": [{"text": prompt}]}]})
+        if response.status_code >= 400:
+            raise SimulatedProviderError(response.status_code, response.text)
+        parts = [
+            SimpleNamespace(inline_data=SimpleNamespace(mime_type=part["inlineData"]["mimeType"], data=base64.b64decode(part["inlineData"]["data"])))
+            for candidate in response.json()["candidates"] for part in candidate["content"]["parts"]
+        ]
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class FakeProviderServer:
+    """Runs an app (a fake provider or the backend itself) with uvicorn in a background thread."""
+    def __init__(self, app: FastAPI):
+        self.port = free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def root_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.root_url}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
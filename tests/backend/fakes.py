@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import importlib
+import tempfile
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "backend")
+
+STORY_RESPONSE = (
+    "Marton found a tiny glowing door at the bottom of the garden. "
+    "It creaked open and a friendly hedgehog waved hello. "
+    "Where should they go first? [Follow the hedgehog] or [Climb the big oak tree]"
+)
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class FakeOpenAI:
+    """
+    A local stand-in for the OpenAI client.
+    Chat completions stream the canned story word by word with a small delay,
+    and TTS returns a few bytes derived from the input text.
+    """
+    def __init__(self, response_text: str = STORY_RESPONSE, token_delay: float = 0.01):
+        self.response_text = response_text
+        self.token_delay = token_delay
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.audio = SimpleNamespace(speech=SimpleNamespace(create=self._create_speech))
+
+    def _tokens(self):
+        words = self.response_text.split(" ")
+        return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+    def _create_completion(self, **kwargs):
+        self.calls.append(("chat", kwargs))
+        if not kwargs.get("stream"):
+            message = SimpleNamespace(content=self.response_text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+        def stream():
+            for token in self._tokens():
+                time.sleep(self.token_delay)
+                yield _chunk(token)
+        return stream()
+
+    def _create_speech(self, **kwargs):
+        self.calls.append(("tts", kwargs))
+        return SimpleNamespace(content=f"audio:{kwargs['input']}".encode())
+
+    async def close(self):
+        pass
+
+async def fake_image_bytes(prompt, reference_image, high_quality=False) -> bytes:
+    return f"image:{prompt}:{high_quality}".encode()
+
+def import_backend_module(monkeypatch, module: str):
+    """
+    Imports a top-level backend module the way uvicorn or the CLI does (from
+    inside backend/), with a fresh copy of its packages and an in-memory media cache.
+    """
+    monkeypatch.chdir(BACKEND_DIR)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    for name in list(sys.modules):
+        if name == module or name.split(".")[0] in ("main", "generation", "jobs"):
+            monkeypatch.delitem(sys.modules, name)
+    imported = importlib.import_module(module)
+    from generation.cache import MediaCache
+    monkeypatch.setattr(sys.modules["generation.generators"], "media_cache", MediaCache(None, 64 * 1024 * 1024, 0))
+    return imported
+
+def load_backend_app(monkeypatch, fake_client=None):
+    """
+    Imports backend/main.py the way uvicorn does (from inside backend/)
+    and swaps every provider for a local fake.
+    """
+    return install_fakes(monkeypatch, import_backend_module(monkeypatch, "main"), fake_client)
+
+def install_fakes(monkeypatch, main, fake_client=None):
+    """Swaps the providers and storage of an imported backend/main.py for local fakes."""
+    main.client = fake_client or FakeOpenAI()
+    main.media_store = main.MediaStore(tempfile.mkdtemp(prefix="story-media-"))
+    main.app.state.jobs = main.JobStore(tempfile.mkdtemp(prefix="story-jobs-"), 64 * 1024 * 1024, 1024 * 1024, 900, 3600)
+    monkeypatch.setattr(main, "generate_image_bytes", fake_image_bytes)
+    # One fake image call per icon; icon sheets have their own tests
+    monkeypatch.setattr(main.gen_config.icons, "sheet", False)
+    monkeypatch.setattr(main, "load_reference_image", lambda path: object())
+    return main
+
+def wait_for_job(http, job_id: str) -> str:
+    """Long-polls a job through the API until it reaches a final status."""
+    status = None
+    while status not in ("complete", "failed", "cancelled", "not_found"):
+        status = http.get(f"/generate/status/{job_id}", params={"wait": 5, "known": status}).json()["status"]
+    return status
@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import httpx
+from PIL import Image
+
+from tests.backend.fake_providers import FakeImageModel, FakeProviderServer, ProviderProfile, create_fake_provider_app
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "backend")
+CONFIG = {
+    "child_photo_path": "data/child.png",
+    "voice": "onyx",
+    "child_info": {"name": "Marton", "age": 5},
+    "personalization": {"favourite_animal": "rabbit"},
+}
+
+def load_backend(provider_url: str, root_url: str, unthrottled: bool, resilience: bool = True):
+    """
+    Imports backend/main.py the way uvicorn does and points every provider at
+    the simulators. The media cache is disabled so every call reaches a provider.
+    """
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    import main
+    from generation import generators
+    from generation.cache import MediaCache
+    from generation.clients import create_openai_client
+    from generation.config import ProviderLimitConfig, config as gen_config
+    from generation.reference import ReferenceImage
+    from generation.scheduler import ProviderScheduler, schedulers
+
+    generators.media_cache = MediaCache(None, 0, 0)
+    # Set before the client is built, which takes its SDK retry count from it
+    gen_config.resilience.enabled = resilience
+    main.client = create_openai_client("fake", base_url=provider_url)
+    image_http = httpx.AsyncClient(timeout=120)
+    generators.get_image_model = lambda model_name: FakeImageModel(root_url, model_name, image_http)
+
+    photo = BytesIO()
+    Image.new("RGB", (64, 64), (200, 160, 120)).save(photo, format="JPEG")
+    reference = ReferenceImage("child.jpg", photo.getvalue(), "image/jpeg", (64, 64))
+    main.load_reference_image = lambda path: reference
+
+    main.media_store = main.MediaStore(tempfile.mkdtemp(prefix="load-media-"))
+    main.app.state.jobs = main.JobStore(tempfile.mkdtemp(prefix="load-jobs-"), 256 * 1024 * 1024, 1024 * 1024, 900, 3600)
+    if unthrottled:
+        for name in list(schedulers):
+            schedulers[name] = ProviderScheduler(name, ProviderLimitConfig(max_concurrency=1000))
+    return main
+
+async def wait_until_complete(http: httpx.AsyncClient, job_id: str) -> str:
+    status = None
+    while status not in ("complete", "failed", "cancelled", "not_found"):
+        response = await http.get(f"/generate/status/{job_id}", params={"wait": 25, "known": status})
+        status = response.json()["status"]
+    return status
+
+async def start_job(http: httpx.AsyncClient, payload: dict) -> tuple[str, float]:
+    started = time.monotonic()
+    return (await http.post("/generate/start", json=payload)).json()["job_id"], started
+
+async def finish_job(http: httpx.AsyncClient, job_id: str, started: float, samples: dict) -> str:
+    """Waits for a job and records its time-to-complete under its final status."""
+    status = await wait_until_complete(http, job_id)
+    samples[status].append(time.monotonic() - started)
+    return status
+
+async def run_session(http: httpx.AsyncClient, depth: int, branches: int, rng: random.Random, samples: dict):
+    """
+    Replays one child's story: start, pre-generate `branches` choices for each
+    page, pick one of them (which cancels the rest) and continue for `depth` pages.
+    """
+    session_id = (await http.post("/sessions", json={"config": CONFIG})).json()["session_id"]
+    job_id, started = await start_job(http, {"session_id": session_id, "priority": "interactive"})
+    if await finish_job(http, job_id, started, samples) != "complete":
+        return
+    for _ in range(depth):
+        page = (await http.get(f"/generate/result/{job_id}")).json()
+        choices = [choice["text"] for choice in page["choices"]][:branches]
+        if not choices:
+            return
+        branch_jobs = [
+            await start_job(http, {"session_id": session_id, "segment_id": job_id, "choice": choice})
+            for choice in choices
+        ]
+        # The child listens to the page for a moment, then picks
+        await asyncio.sleep(rng.uniform(0.0, 0.5))
+        picked = rng.randrange(len(branch_jobs))
+        await http.post(f"/generate/{branch_jobs[picked][0]}/keep")
+        statuses = await asyncio.gather(*(finish_job(http, branch_id, started, samples) for branch_id, started in branch_jobs))
+        if statuses[picked] != "complete":
+            return
+        job_id = branch_jobs[picked][0]
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+async def drive(backend_url: str, sessions: int, concurrency: int, depth: int, branches: int, seed: int) -> dict:
+    samples = {"complete": [], "failed": [], "cancelled": [], "not_found": []}
+    limit = asyncio.Semaphore(concurrency)
+    rng = random.Random(seed)
+
+    async def one_session():
+        async with limit:
+            await run_session(http, depth, branches, random.Random(rng.random()), samples)
+
+    async with httpx.AsyncClient(base_url=backend_url, timeout=120) as http:
+        start = time.monotonic()
+        await asyncio.gather(*(one_session() for _ in range(sessions)))
+        elapsed = time.monotonic() - start
+        stats = (await http.get("/jobs/stats")).json()
+        resilience = (await http.get("/resilience/stats")).json()
+    return {"samples": samples, "seconds": elapsed, "job_stats": stats, "resilience": resilience}
+
+def report(result: dict, provider_calls: dict):
+    completed = result["samples"]["complete"]
+    print(f"Completed jobs: {len(completed)}   failed: {len(result['samples']['failed'])}   "
+          f"cancelled: {len(result['samples']['cancelled'])}")
+    print(f"Time to complete: p50 {percentile(completed, 50):.2f} s   p95 {percentile(completed, 95):.2f} s   "
+          f"p99 {percentile(completed, 99):.2f} s")
+    print(f"Throughput: {len(completed) / result['seconds']:.2f} jobs/s over {result['seconds']:.1f} s")
+    print(f"Provider calls: {provider_calls}")
+    print(f"Cancelled work: {result['job_stats']['cancelled']}")
+    for name, stats in result["resilience"]["providers"].items():
+        print(f"{name}: hedge rate {stats['hedge_rate']:.1%} ({stats['hedge_wins']} won), retry rate {stats['retry_rate']:.1%}, "
+              f"breaker {stats['breaker']}")
+    # Includes the simulators and the driver, which run in the same process
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+def main(args):
+    print("--- Load Testing the Backend Against Simulated Providers ---")
+    profile = dict(distribution=args.distribution, jitter=args.jitter, error_rate=args.error_rate)
+    provider_app = create_fake_provider_app(
+        text=ProviderProfile(args.text_latency, **profile),
+        tts=ProviderProfile(args.tts_latency, payload_kb=args.audio_kb, **profile),
+        image=ProviderProfile(args.image_latency, payload_kb=args.image_kb, **profile),
+        seed=args.seed,
+    )
+    with FakeProviderServer(provider_app) as providers:
+        backend = load_backend(providers.base_url, providers.root_url, args.unthrottled, not args.no_resilience)
+        with FakeProviderServer(backend.app) as server:
+            print(f"{args.sessions} sessions ({args.concurrency} at a time), {args.depth} pages each, "
+                  f"{args.branches} pre-generated branches per page\n")
+            result = asyncio.run(drive(server.root_url, args.sessions, args.concurrency, args.depth, args.branches, args.seed))
+    report(result, provider_app.state.calls)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay story sessions against the backend with simulated providers.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3, help="pages after the first one")
+    parser.add_argument("--branches", type=int, default=2, help="choices pre-generated per page")
+    parser.add_argument("--text-latency", type=float, default=1.0)
+    parser.add_argument("--tts-latency", type=float, default=0.5)
+    parser.add_argument("--image-latency", type=float, default=2.0)
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--audio-kb", type=int, default=32)
+    parser.add_argument("--image-kb", type=int, default=256)
+    parser.add_argument("--unthrottled", action="store_true", help="lift the per-provider rate limits")
+    parser.add_argument("--no-resilience", action="store_true", help="no hedging, budgeted retries or circuit breakers, for comparison; the OpenAI SDK retries on its own (http.max_retries) as it did before")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
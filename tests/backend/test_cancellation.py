@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+
+from tests.backend.fakes import FakeOpenAI, STORY_RESPONSE, load_backend_app, wait_for_job
+
+HISTORY = [
+    {"role": "system", "content": "You are a storyteller."},
+    {"role": "user", "content": "Let's begin."},
+    {"role": "assistant", "content": STORY_RESPONSE},
+]
+
+def start_choice(http, choice):
+    payload = {"conversation_history": HISTORY, "choice": choice, "config": {"child_photo_path": "x.png"}}
+    return http.post("/generate/start", json=payload).json()["job_id"]
+
+def test_delete_cancels_a_running_job(monkeypatch):
+    main = load_backend_app(monkeypatch, FakeOpenAI(token_delay=0.2))
+    with TestClient(main.app) as http:
+        job_id = start_choice(http, "Follow the hedgehog")
+        response = http.delete(f"/generate/{job_id}").json()
+        assert response["cancelled"] is True
+        assert wait_for_job(http, job_id) == "cancelled"
+        assert http.delete(f"/generate/{job_id}").json()["cancelled"] is False
+        assert http.get("/jobs/stats").json()["cancelled"]["jobs"] == 1
+
+def test_keep_cancels_only_the_siblings(monkeypatch):
+    main = load_backend_app(monkeypatch, FakeOpenAI(token_delay=0.05))
+    with TestClient(main.app) as http:
+        kept = start_choice(http, "Follow the hedgehog")
+        sibling = start_choice(http, "Climb the big oak tree")
+        response = http.post(f"/generate/{kept}/keep").json()
+
+        assert response["cancelled"] == [sibling]
+        assert wait_for_job(http, sibling) == "cancelled"
+        assert wait_for_job(http, kept) == "complete"
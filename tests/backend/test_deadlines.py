@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from tests.backend.fakes import STORY_RESPONSE, fake_image_bytes, load_backend_app, wait_for_job
+
+CONFIG = {"child_photo_path": "x.png", "voice": "onyx", "personalization": {"favourite_colour": "yellow"}}
+
+def test_page_completes_at_its_deadline_and_late_icons_are_backfilled(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    deadlines = type(main.gen_config.deadlines)(seconds={"choice_image": 0.5})
+    monkeypatch.setattr(main.gen_config, "deadlines", deadlines)
+    release = asyncio.Event()
+
+    async def slow_icons(prompt, reference_image, high_quality=False):
+        if not high_quality:
+            await release.wait()
+        return await fake_image_bytes(prompt, reference_image, high_quality)
+
+    monkeypatch.setattr(main, "generate_image_bytes", slow_icons)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": CONFIG}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+
+        page = http.get(f"/generate/result/{job_id}").json()
+        icons = [key for key in page["assets"] if key.startswith("choice_image")]
+        assert icons and all(page["assets"][key] == "placeholder" for key in icons)
+        assert all(state == "ready" for key, state in page["assets"].items() if key not in icons)
+        placeholder = http.get(page["choices"][0]["image_url"])
+        assert placeholder.headers["content-type"] == "image/png"
+        assert main.app.state.jobs.get(job_id)["backfilling"]
+
+        http.portal.call(release.set)
+        # Long-poll on asset changes, the way the page swaps its pictures in
+        status = {"assets": page["assets"]}
+        while "placeholder" in status["assets"].values():
+            settled = sum(1 for state in status["assets"].values() if state not in ("pending", "placeholder"))
+            status = http.get(f"/generate/status/{job_id}", params={"wait": 5, "known": "complete", "settled": settled}).json()
+
+        final = http.get(f"/generate/result/{job_id}").json()
+        assert set(final["assets"].values()) == {"ready"}
+        assert all(choice["image_url"] != placeholder.url.path for choice in final["choices"])
+        assert http.get(final["choices"][0]["image_url"]).content.startswith(b"image:")
+        assert "backfill" in main.app.state.jobs.get(job_id)["timings"]
+
+def test_without_deadlines_the_page_waits_for_every_asset(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    deadlines = type(main.gen_config.deadlines)(enabled=False, seconds={"choice_image": 0.0})
+    monkeypatch.setattr(main.gen_config, "deadlines", deadlines)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": CONFIG}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        assert set(http.get(f"/generate/result/{job_id}").json()["assets"].values()) == {"ready"}
+
+def test_an_asset_that_arrives_while_its_placeholder_is_made_is_kept(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    deadlines = type(main.gen_config.deadlines)(seconds={"choice_image": 0.3})
+    monkeypatch.setattr(main.gen_config, "deadlines", deadlines)
+    render_placeholder = main.render_placeholder
+
+    def slow_placeholder(asset, theme):
+        time.sleep(0.5)
+        return render_placeholder(asset, theme)
+
+    async def late_icons(prompt, reference_image, high_quality=False):
+        if not high_quality:
+            await asyncio.sleep(0.4)
+        return await fake_image_bytes(prompt, reference_image, high_quality)
+
+    monkeypatch.setattr(main, "render_placeholder", slow_placeholder)
+    monkeypatch.setattr(main, "generate_image_bytes", late_icons)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": CONFIG}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        page = http.get(f"/generate/result/{job_id}").json()
+        assert set(page["assets"].values()) == {"ready"}
+        assert all(http.get(choice["image_url"]).content.startswith(b"image:") for choice in page["choices"])
+
+def test_keep_stops_the_backfill_of_a_sibling_page(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    deadlines = type(main.gen_config.deadlines)(seconds={"choice_image": 0.3})
+    monkeypatch.setattr(main.gen_config, "deadlines", deadlines)
+    release = asyncio.Event()
+    drawn = []
+
+    async def slow_icons(prompt, reference_image, high_quality=False):
+        if not high_quality:
+            await release.wait()
+            drawn.append(prompt)
+        return await fake_image_bytes(prompt, reference_image, high_quality)
+
+    monkeypatch.setattr(main, "generate_image_bytes", slow_icons)
+    history = [{"role": "system", "content": "You are a storyteller."}, {"role": "user", "content": "Let's begin."},
+               {"role": "assistant", "content": STORY_RESPONSE}]
+    with TestClient(main.app) as http:
+        kept, sibling = [http.post("/generate/start", json={"conversation_history": history, "choice": choice, "config": CONFIG}).json()["job_id"]
+                         for choice in ("Follow the hedgehog", "Climb the big oak tree")]
+        assert wait_for_job(http, kept) == "complete" and wait_for_job(http, sibling) == "complete"
+        assert main.app.state.jobs.get(sibling)["backfilling"]
+
+        # The sibling page was finished at its deadline, but its late icons are still being drawn
+        assert http.post(f"/generate/{kept}/keep").json()["cancelled"] == [sibling]
+        while main.app.state.jobs.get(sibling).get("task") is not None:
+            time.sleep(0.01)
+        http.portal.call(release.set)
+        while main.app.state.jobs.get(kept).get("backfilling"):
+            time.sleep(0.01)
+
+        assert "placeholder" in http.get(f"/generate/result/{sibling}").json()["assets"].values()
+        assert set(http.get(f"/generate/result/{kept}").json()["assets"].values()) == {"ready"}
+        assert len(drawn) == 2
+        assert http.get("/jobs/stats").json()["cancelled"]["backfills"] == 1
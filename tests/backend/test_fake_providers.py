@@ -0,0 +1,30 @@
+import asyncio
+import random
+import statistics
+
+import httpx
+
+from tests.backend.fake_providers import FakeImageModel, FakeProviderServer, ProviderProfile, create_fake_provider_app
+
+def test_profiles_sample_latency_and_errors():
+    rng = random.Random(1)
+    profile = ProviderProfile(0.5, distribution="lognormal", jitter=0.5, error_rate=0.2)
+    latencies = [profile.sample_latency(rng) for _ in range(2000)]
+    assert abs(statistics.median(latencies) - 0.5) < 0.05
+    assert max(latencies) > 1.0
+    errors = [profile.sample_error(rng) for _ in range(2000)]
+    assert 300 < sum(1 for error in errors if error) < 500
+    assert set(errors) == {None, 429, 500}
+
+def test_image_simulator_serves_sized_pngs():
+    app = create_fake_provider_app(image=ProviderProfile(0.0, payload_kb=64))
+
+    async def generate(root_url):
+        async with httpx.AsyncClient() as http:
+            response = await FakeImageModel(root_url, "fake-image", http).generate_content_async(["A hedgehog", {}])
+        return response.candidates[0].content.parts[0].inline_data.data
+
+    with FakeProviderServer(app) as server:
+        image = asyncio.run(generate(server.root_url))
+    assert image.startswith(b"\x89PNG")
+    assert 48 * 1024 < len(image) < 80 * 1024
@@ -0,0 +1,84 @@
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+
+from backend.generation.icons import MalformedSheet, icon_sheet_prompt, slice_icon_sheet
+from tests.backend.fakes import load_backend_app, wait_for_job
+
+CONFIG = {"child_photo_path": "x.png", "voice": "onyx"}
+
+def draw_sheet(shapes, size: int = 512) -> bytes:
+    """A white sheet with a filled box per (left, top, right, bottom) fraction, like a model's icon grid."""
+    image = Image.new("RGB", (size, size), "white")
+    draw = ImageDraw.Draw(image)
+    for left, top, right, bottom in shapes:
+        draw.rectangle([left * size, top * size, right * size, bottom * size], fill=(200, 60, 40))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+# Three icons in a 2x2 grid, off-centre in their panels, and an empty fourth cell
+THREE_ICONS = [(0.1, 0.1, 0.4, 0.35), (0.6, 0.12, 0.85, 0.42), (0.05, 0.58, 0.38, 0.9)]
+
+def test_a_sheet_is_sliced_into_one_icon_per_choice():
+    icons = slice_icon_sheet(draw_sheet(THREE_ICONS), 3)
+    assert len(icons) == 3
+    for data in icons:
+        with Image.open(BytesIO(data)) as icon:
+            assert icon.format == "PNG" and 200 <= icon.width <= 280 and 200 <= icon.height <= 280
+    assert "2 by 2 grid" in icon_sheet_prompt(["a", "b", "c"]) and "Leave the last 1 panel" in icon_sheet_prompt(["a", "b", "c"])
+
+@pytest.mark.parametrize("data, reason", [
+    (draw_sheet([(0.1, 0.1, 0.9, 0.4), (0.05, 0.58, 0.38, 0.9)]), "no gutter"),
+    (draw_sheet(THREE_ICONS[:2]), "blank"),
+    (draw_sheet(THREE_ICONS + [(0.6, 0.6, 0.9, 0.9)]), "more icons"),
+    (b"not an image", "not an image"),
+])
+def test_a_malformed_sheet_is_rejected(data, reason):
+    with pytest.raises(MalformedSheet, match=reason):
+        slice_icon_sheet(data, 3)
+
+def run_page(monkeypatch, sheet_bytes: bytes) -> tuple[dict, list, dict]:
+    main = load_backend_app(monkeypatch)
+    monkeypatch.setattr(main.gen_config.icons, "sheet", True)
+    sheet_prompts, image_prompts = [], []
+
+    async def fake_request_image(full_prompt, reference_image, key_parts):
+        sheet_prompts.append(full_prompt)
+        return sheet_bytes
+
+    async def fake_image_bytes(prompt, reference_image, high_quality=False):
+        image_prompts.append((prompt, high_quality))
+        return f"image:{prompt}".encode()
+
+    import generation.icons
+    monkeypatch.setattr(generation.icons, "request_image", fake_request_image)
+    monkeypatch.setattr(main, "generate_image_bytes", fake_image_bytes)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": CONFIG}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        page = http.get(f"/generate/result/{job_id}").json()
+        icons = [http.get(choice["image_url"]).content for choice in page["choices"]]
+    return page, sheet_prompts, {"calls": image_prompts, "icons": icons}
+
+def test_a_page_draws_its_choice_icons_in_one_call(monkeypatch):
+    sheet = draw_sheet([(0.1, 0.1, 0.4, 0.4), (0.6, 0.1, 0.9, 0.4)])
+    page, sheet_prompts, images = run_page(monkeypatch, sheet)
+    assert len(sheet_prompts) == 1 and "Follow the hedgehog" in sheet_prompts[0]
+    # Only the main illustration is drawn on its own
+    assert [high_quality for _, high_quality in images["calls"]] == [True]
+    assert set(page["assets"].values()) == {"ready"}
+    for icon in images["icons"]:
+        with Image.open(BytesIO(icon)) as image:
+            assert image.width < 512
+
+def test_a_malformed_sheet_falls_back_to_one_call_per_icon(monkeypatch):
+    page, sheet_prompts, images = run_page(monkeypatch, b"not an image")
+    assert len(sheet_prompts) == 1
+    assert sorted(prompt for prompt, high_quality in images["calls"] if not high_quality) == sorted(
+        choice["text"] for choice in page["choices"]
+    )
+    assert set(page["assets"].values()) == {"ready"}
+    assert [icon.decode() for icon in images["icons"]] == [f"image:{choice['text']}" for choice in page["choices"]]
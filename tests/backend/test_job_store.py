@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from backend.jobs.events import JobEvents
+from backend.jobs.store import JobStore
+
+def result_of_size(size: int) -> dict:
+    return {"story_text": "x" * size, "choices": []}
+
+def test_memory_cap_spills_least_recently_used_results(tmp_path):
+    store = JobStore(str(tmp_path), max_memory_bytes=7000, spill_threshold_bytes=10_000, pending_ttl=60, finished_ttl=60)
+    for job_id in ("a", "b", "c"):
+        store.create(job_id, {"status": "pending"})
+        store.finish(job_id, "complete", result_of_size(1000))
+    store.get("a")
+    store.create("d", {"status": "pending"})
+    store.finish("d", "complete", result_of_size(1000))
+
+    assert "b" not in store
+    assert "a" in store
+    assert store.status("b") == "complete"
+    assert store.result("b") == result_of_size(1000)
+    stats = store.stats()
+    assert stats["evictions"]["spilled"] == 1
+    assert stats["jobs_on_disk"] == 1
+    assert stats["memory_bytes"] <= 7000
+
+def test_large_results_spill_immediately_and_running_jobs_stay(tmp_path):
+    store = JobStore(str(tmp_path), max_memory_bytes=10_000, spill_threshold_bytes=2000, pending_ttl=60, finished_ttl=60)
+    store.create("running", {"status": "generating_media"})
+    store.create("big", {"status": "pending"})
+    store.finish("big", "complete", result_of_size(5000))
+
+    assert "big" not in store
+    assert store.result("big")["story_text"] == "x" * 5000
+    assert store["running"]["status"] == "generating_media"
+
+def test_ttl_expires_pending_and_finished_jobs(tmp_path):
+    store = JobStore(str(tmp_path), max_memory_bytes=10_000, spill_threshold_bytes=100, pending_ttl=60, finished_ttl=60)
+    store.create("stuck", {"status": "pending", "created_at": time.time() - 120})
+    store.create("spilled", {"status": "pending"})
+    store.finish("spilled", "complete", result_of_size(500))
+    store._db.execute("UPDATE jobs SET finished_at = ?", (time.time() - 120,))
+
+    store.prune()
+
+    assert store.status("stuck") is None
+    assert store.status("spilled") is None
+    assert store.stats()["evictions"]["expired"] == 2
+
+def test_a_backfilling_job_stays_in_memory_until_its_result_is_final(tmp_path):
+    store = JobStore(str(tmp_path), max_memory_bytes=10_000, spill_threshold_bytes=2000, pending_ttl=60, finished_ttl=60)
+    store.create("late", {"status": "generating_media", "backfilling": True})
+    store.finish("late", "complete", result_of_size(5000))
+    assert "late" in store
+
+    store["late"].pop("backfilling")
+    assert store.update_result("late", {**result_of_size(5000), "assets": {"main_illustration": "ready"}})
+    assert "late" not in store
+    assert store.result("late")["assets"] == {"main_illustration": "ready"}
+    assert not store.update_result("missing", {})
+
+def test_the_event_log_counts_against_the_memory_cap(tmp_path):
+    store = JobStore(str(tmp_path), max_memory_bytes=100_000, spill_threshold_bytes=10_000, pending_ttl=60, finished_ttl=60)
+    events = JobEvents()
+    store.create("chatty", {"status": "pending", "events": events})
+
+    async def stream_tokens():
+        for i in range(300):
+            await events.publish("token", {"text": f" word{i}"})
+
+    asyncio.run(stream_tokens())
+    store.finish("chatty", "complete", result_of_size(100))
+    # A small result with a long token log is spilled like a large result
+    assert "chatty" not in store and store.result("chatty") == result_of_size(100)
+
+def test_an_expired_pending_job_has_its_work_cancelled(tmp_path):
+    store = JobStore(str(tmp_path), max_memory_bytes=10_000, spill_threshold_bytes=10_000, pending_ttl=60, finished_ttl=60)
+
+    async def run():
+        task = asyncio.create_task(asyncio.sleep(60))
+        job = {"status": "generating_media", "created_at": time.time() - 120, "task": task}
+        store.create("stuck", job)
+        await asyncio.sleep(0)
+        store.prune()
+        await asyncio.gather(task, return_exceptions=True)
+        return task, job
+
+    task, job = asyncio.run(run())
+    assert task.cancelled() and job["cancel_requested"]
+    assert store.status("stuck") is None
@@ -0,0 +1,75 @@
+import asyncio
+
+from backend.generation import generators
+from backend.generation.cache import MediaCache, cache_key
+from tests.backend.fakes import FakeOpenAI
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = MediaCache(None, memory_max_bytes=10, disk_max_bytes=0)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+    cache.put("c", b"12345")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    stats = cache.stats()
+    assert stats["evictions"]["memory"] == 1
+    assert stats["hits"]["memory"] == 2
+    assert stats["misses"] == 1
+
+def test_disk_tier_survives_restart_and_is_size_bounded(tmp_path):
+    cache = MediaCache(str(tmp_path), memory_max_bytes=0, disk_max_bytes=10)
+    cache.put("a" * 64, b"12345")
+    cache.put("b" * 64, b"12345")
+    cache.put("c" * 64, b"12345")
+    assert cache.stats()["evictions"]["disk"] == 1
+
+    reopened = MediaCache(str(tmp_path), memory_max_bytes=1024, disk_max_bytes=10)
+    assert reopened.get("a" * 64) is None
+    assert reopened.get("c" * 64) == b"12345"
+    assert reopened.stats()["hits"]["disk"] == 1
+
+def test_a_blob_cached_by_another_process_is_a_hit(tmp_path):
+    worker_a = MediaCache(str(tmp_path), memory_max_bytes=0, disk_max_bytes=1024)
+    worker_b = MediaCache(str(tmp_path), memory_max_bytes=0, disk_max_bytes=1024)
+    worker_a.put("a" * 64, b"12345")
+    assert worker_b.get("a" * 64) == b"12345"
+    assert worker_b.stats()["hits"]["disk"] == 1 and worker_b.stats()["disk_bytes"] == 5
+    assert worker_b.get("b" * 64) is None
+
+def test_disk_tier_is_read_and_written_off_the_event_loop(tmp_path, monkeypatch):
+    cache = MediaCache(str(tmp_path), memory_max_bytes=0, disk_max_bytes=1024)
+    threads = []
+    real_to_thread = asyncio.to_thread
+
+    async def to_thread(function, *args):
+        threads.append(function.__name__)
+        return await real_to_thread(function, *args)
+
+    monkeypatch.setattr(asyncio, "to_thread", to_thread)
+
+    async def run():
+        await cache.aput("a" * 64, b"12345")
+        return await cache.aget("a" * 64), await cache.aget("b" * 64)
+
+    assert asyncio.run(run()) == (b"12345", None)
+    assert threads == ["put", "get", "get"]
+    assert cache.stats()["hits"]["disk"] == 1 and cache.stats()["misses"] == 1
+
+def test_cache_key_depends_on_every_part():
+    assert cache_key("tts", "tts-1", "onyx", "Hello") != cache_key("tts", "tts-1", "alloy", "Hello")
+    assert cache_key("tts", "tts-1", "onyx", "Hello") == cache_key("tts", "tts-1", "onyx", "Hello")
+
+def test_repeated_audio_costs_no_provider_call(monkeypatch):
+    monkeypatch.setattr(generators, "media_cache", MediaCache(None, 1024 * 1024, 0))
+    client = FakeOpenAI()
+
+    async def run():
+        first = await generators.generate_audio_bytes(client, "Follow the hedgehog", "onyx")
+        second = await generators.generate_audio_bytes(client, "Follow the hedgehog", "onyx")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert [kind for kind, _ in client.calls] == ["tts"]
@@ -0,0 +1,66 @@
+import base64
+
+from fastapi.testclient import TestClient
+
+from tests.backend.fakes import load_backend_app, wait_for_job
+
+def run_job(http):
+    job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png", "voice": "onyx"}}).json()["job_id"]
+    assert wait_for_job(http, job_id) == "complete"
+    return job_id
+
+def test_result_references_media_by_url(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    with TestClient(main.app) as http:
+        result = http.get(f"/generate/result/{run_job(http)}").json()
+
+        assert "narration_audio_b64" not in result
+        audio = http.get(result["narration_audio_url"])
+        assert audio.status_code == 200
+        assert audio.headers["content-type"] == "audio/mpeg"
+        assert audio.content.startswith(b"audio:")
+        assert http.get(result["choices"][0]["image_url"]).content.startswith(b"image:")
+
+def test_media_supports_etag_and_range(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    with TestClient(main.app) as http:
+        url = http.get(f"/generate/result/{run_job(http)}").json()["narration_audio_url"]
+        full = http.get(url)
+
+        cached = http.get(url, headers={"If-None-Match": full.headers["etag"]})
+        assert cached.status_code == 304
+
+        partial = http.get(url, headers={"Range": "bytes=0-4"})
+        assert partial.status_code == 206
+        assert partial.content == full.content[:5]
+        assert partial.headers["content-range"] == f"bytes 0-4/{len(full.content)}"
+
+        suffix = http.get(url, headers={"Range": "bytes=-3"})
+        assert suffix.content == full.content[-3:]
+
+        assert http.get(url, headers={"Range": f"bytes={len(full.content)}-"}).status_code == 416
+        assert http.get("/media/../../etc/passwd").status_code == 404
+
+def test_base64_results_remain_available_on_request(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    with TestClient(main.app) as http:
+        job_id = run_job(http)
+        current = http.get(f"/generate/result/{job_id}").json()
+        legacy = http.get(f"/generate/result/{job_id}", params={"media": "base64"}).json()
+
+    assert base64.b64decode(legacy["narration_audio_b64"]).startswith(b"audio:")
+    assert legacy["choices"][0]["text"] == current["choices"][0]["text"]
+    assert base64.b64decode(legacy["choices"][0]["image_b64"]).startswith(b"image:")
+    assert legacy["conversation_history"] == current["conversation_history"]
+
+def test_intro_video_is_streamed_with_range(monkeypatch, tmp_path):
+    main = load_backend_app(monkeypatch)
+    video = tmp_path / "intro.mp4"
+    video.write_bytes(b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 40)
+    monkeypatch.setattr(main, "intro_video_path", lambda: str(video))
+    with TestClient(main.app) as http:
+        partial = http.get("/intro/video", headers={"Range": "bytes=0-99"})
+        assert partial.status_code == 206
+        assert partial.content == video.read_bytes()[:100]
+        monkeypatch.setattr(main, "intro_video_path", lambda: None)
+        assert http.get("/intro/video").status_code == 404
@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+
+from backend.generation.metrics import Counter, Histogram
+from tests.backend.fakes import load_backend_app, wait_for_job
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("call_seconds", "Call latency.", ("provider",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, provider="tts")
+    counter = Counter("calls_total", "Calls.", ("provider",))
+    counter.inc(provider='say "hi"')
+    assert histogram.render()[2:] == [
+        'call_seconds_bucket{provider="tts",le="0.1"} 1',
+        'call_seconds_bucket{provider="tts",le="1"} 3',
+        'call_seconds_bucket{provider="tts",le="+Inf"} 4',
+        'call_seconds_sum{provider="tts"} 4.25',
+        'call_seconds_count{provider="tts"} 4',
+    ]
+    assert counter.render()[-1] == 'calls_total{provider="say \\"hi\\""} 1'
+
+def test_jobs_report_stage_timings_and_metrics(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png"}}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        timings = http.get(f"/generate/status/{job_id}").json()["timings"]
+        exposition = http.get("/metrics").text
+
+    assert {"compaction", "text", "first_token", "reference_image", "media", "total"} <= set(timings)
+    assert timings["first_token"] <= timings["text"] <= timings["total"]
+    assert "narration" in timings["assets"] and "choice_image:1" in timings["assets"]
+    assert 'story_stage_seconds_count{stage="text"}' in exposition
+    assert 'provider_calls_total{provider="openai_tts",outcome="ok"}' in exposition
+    assert 'story_jobs_total{status="complete"}' in exposition
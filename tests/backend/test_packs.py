@@ -0,0 +1,95 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.jobs.packs import HEADER, PackWriter, StoryPack
+from tests.backend.fakes import FakeOpenAI, load_backend_app, wait_for_job
+
+AUDIO = b"ID3" + bytes(range(256)) * 4
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"\x00\xff" * 300
+ICON = b"\x89PNG\r\n\x1a\n" + b"icon"
+
+def write_pack(path) -> str:
+    with PackWriter(str(path)) as writer:
+        for media_id, data in (("a" * 32 + ".mp3", AUDIO), ("b" * 32 + ".png", IMAGE), ("c" * 32 + ".png", ICON)):
+            writer.add_media(media_id, data)
+        writer.add_node("root", {
+            "story_text": "Marton found a tiny glowing door.",
+            "narration": "a" * 32 + ".mp3", "main_illustration": "b" * 32 + ".png",
+            "choices": [
+                {"text": "Open the door", "audio": "a" * 32 + ".mp3", "image": "c" * 32 + ".png", "next": "root.0"},
+                {"text": "Go back to bed", "audio": "a" * 32 + ".mp3", "image": "c" * 32 + ".png", "next": None},
+            ],
+        })
+        writer.add_node("root.0", {
+            "story_text": "Behind the door was a garden of stars.",
+            "narration": "a" * 32 + ".mp3", "main_illustration": "b" * 32 + ".png", "choices": [],
+        })
+    return str(path)
+
+def test_pack_round_trip(tmp_path):
+    pack = StoryPack(write_pack(tmp_path / "story.pack"))
+    try:
+        assert len(pack) == 2 and pack.root == "root" and "root.0" in pack
+        assert pack.node("root")["choices"][0]["next"] == "root.0"
+        assert pack.child("root", "Open the door") == "root.0"
+        assert pack.child("root", "Go back to bed") is None
+        assert pack.child("root", "Fly away") is None
+        assert pack.node("missing") is None and pack.media("missing.png") is None
+        # Media is a view into the mapping, not a copy
+        view = pack.media("b" * 32 + ".png")
+        assert isinstance(view, memoryview) and view.readonly
+        assert view == IMAGE and pack.media("a" * 32 + ".mp3") == AUDIO
+        view.release()
+
+        segment = pack.segment("root")
+        assert segment["story_text"] == "Marton found a tiny glowing door."
+        assert segment["main_illustration_url"] == "/media/" + "b" * 32 + ".png"
+        assert [choice["image_url"] for choice in segment["choices"]] == ["/media/" + "c" * 32 + ".png"] * 2
+        assert set(segment["assets"].values()) == {"ready"}
+    finally:
+        pack.close()
+
+def test_a_pack_closes_while_media_is_still_being_sent(tmp_path):
+    pack = StoryPack(write_pack(tmp_path / "story.pack"))
+    view = pack.media("b" * 32 + ".png")
+    pack.close()
+    # The response still holding the view can finish sending it
+    assert view == IMAGE
+    view.release()
+
+def test_rejects_files_that_are_not_packs(tmp_path):
+    (tmp_path / "empty.pack").write_bytes(b"")
+    (tmp_path / "other.pack").write_bytes(b"not a story pack at all, just some text")
+    truncated = tmp_path / "truncated.pack"
+    with open(write_pack(tmp_path / "story.pack"), "rb") as file:
+        truncated.write_bytes(file.read()[:HEADER.size + 10])
+    for name in ("empty.pack", "other.pack", "truncated.pack"):
+        with pytest.raises(ValueError):
+            StoryPack(str(tmp_path / name))
+
+def test_replay_mode_serves_pages_and_media_without_providers(monkeypatch, tmp_path):
+    client = FakeOpenAI()
+    main = load_backend_app(monkeypatch, client)
+    main.app.state.pack = StoryPack(write_pack(tmp_path / "story.pack"))
+    with TestClient(main.app) as http:
+        session_id = http.post("/sessions", json={"config": {"child_photo_path": "x.png"}}).json()["session_id"]
+        first_id = http.post("/generate/start", json={"session_id": session_id}).json()["job_id"]
+        assert wait_for_job(http, first_id) == "complete"
+        first = http.get(f"/generate/result/{first_id}").json()
+        assert first["story_text"] == "Marton found a tiny glowing door."
+        assert first["segment_id"] == first_id
+
+        narration = http.get(first["narration_audio_url"])
+        assert narration.content == AUDIO and narration.headers["content-type"] == "audio/mpeg"
+        partial = http.get(first["main_illustration_url"], headers={"Range": "bytes=0-7"})
+        assert partial.status_code == 206 and partial.content == IMAGE[:8]
+
+        next_id = http.post("/generate/start", json={
+            "session_id": session_id, "segment_id": first_id, "choice": "Open the door"
+        }).json()["job_id"]
+        assert http.get(f"/generate/status/{next_id}").json()["status"] == "complete"
+        assert http.get(f"/generate/result/{next_id}").json()["story_text"] == "Behind the door was a garden of stars."
+
+        missing = http.post("/generate/start", json={"session_id": session_id, "segment_id": first_id, "choice": "Go back to bed"})
+        assert missing.status_code == 404
+    assert client.calls == []
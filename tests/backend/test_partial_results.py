@@ -0,0 +1,68 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from tests.backend.fakes import fake_image_bytes, load_backend_app, wait_for_job
+
+CONFIG = {"child_photo_path": "x.png", "voice": "onyx"}
+
+def test_result_is_served_partially_while_images_are_pending(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    release = asyncio.Event()
+
+    async def slow_main_illustration(prompt, reference_image, high_quality=False):
+        if high_quality:
+            await release.wait()
+        return await fake_image_bytes(prompt, reference_image, high_quality)
+
+    monkeypatch.setattr(main, "generate_image_bytes", slow_main_illustration)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": CONFIG}).json()["job_id"]
+        # Long-poll on status and asset changes until the page can be shown
+        status = {"status": None, "readable": False, "assets": None}
+        while not status["readable"]:
+            settled = sum(1 for state in (status["assets"] or {}).values() if state != "pending")
+            status = http.get(f"/generate/status/{job_id}", params={"wait": 5, "known": status["status"], "settled": settled}).json()
+
+        partial = http.get(f"/generate/result/{job_id}").json()
+        assert partial["partial"] is True
+        assert partial["story_text"]
+        assert partial["narration_chunks"][0].startswith("/media/")
+        assert partial["main_illustration_url"] is None
+        assert partial["assets"]["main_illustration"] == "pending"
+        assert http.get(partial["narration_chunks"][0]).status_code == 200
+
+        http.portal.call(release.set)
+        assert wait_for_job(http, job_id) == "complete"
+        final = http.get(f"/generate/result/{job_id}").json()
+        assert "partial" not in final
+        assert final["main_illustration_url"].startswith("/media/")
+        assert set(final["assets"].values()) == {"ready"}
+
+def test_a_page_is_readable_once_its_first_narration_clip_is_stored(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    release = asyncio.Event()
+    generate_audio_bytes = main.generate_audio_bytes
+
+    async def slow_choice_clip(client, text, voice):
+        # The joined narration ends with the choice clips, so it waits for this one too
+        if text == "Climb the big oak tree":
+            await release.wait()
+        return await generate_audio_bytes(client, text, voice)
+
+    monkeypatch.setattr(main, "generate_audio_bytes", slow_choice_clip)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": CONFIG}).json()["job_id"]
+        status = {"status": None, "readable": False, "assets": None}
+        while not status["readable"]:
+            settled = sum(1 for state in (status["assets"] or {}).values() if state != "pending")
+            status = http.get(f"/generate/status/{job_id}", params={"wait": 5, "known": status["status"], "settled": settled}).json()
+
+        partial = http.get(f"/generate/result/{job_id}").json()
+        assert partial["assets"]["narration"] == "pending" and partial["narration_audio_url"] is None
+        assert partial["narration_chunks"][0].startswith("/media/")
+
+        http.portal.call(release.set)
+        assert wait_for_job(http, job_id) == "complete"
+        final = http.get(f"/generate/result/{job_id}").json()
+        assert final["narration_audio_url"].startswith("/media/") and all(final["narration_chunks"])
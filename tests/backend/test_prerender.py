@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+
+from tests.backend.fakes import FakeOpenAI, fake_image_bytes, import_backend_module
+
+CONFIG = {"child_photo_path": "x.png", "voice": "onyx", "child_info": {"name": "Marton", "age": 5}}
+
+def load_prerender(monkeypatch):
+    prerender = import_backend_module(monkeypatch, "prerender")
+    monkeypatch.setattr(prerender, "load_reference_image", lambda path: object())
+    image_calls = []
+
+    async def counting_image_bytes(prompt, reference_image, high_quality=False):
+        image_calls.append(prompt)
+        return await fake_image_bytes(prompt, reference_image, high_quality)
+
+    monkeypatch.setattr(prerender, "generate_image_bytes", counting_image_bytes)
+    return prerender, image_calls
+
+def run(prerender, client, directory, **limits):
+    settings = {"depth": 2, "max_nodes": 50, "max_provider_calls": 100, "concurrency": 3, **limits}
+    return asyncio.run(prerender.prerender(client, CONFIG, str(directory), **settings))
+
+def calls(client, kind: str) -> int:
+    return sum(1 for call_kind, _ in client.calls if call_kind == kind)
+
+def test_tree_is_expanded_breadth_first_and_reuses_identical_prompts(monkeypatch, tmp_path):
+    prerender, image_calls = load_prerender(monkeypatch)
+    client = FakeOpenAI()
+    result = run(prerender, client, tmp_path)
+
+    tree = json.loads((tmp_path / "tree.json").read_text())
+    assert sorted(tree["nodes"]) == ["root", "root.0", "root.0.0", "root.0.1", "root.1", "root.1.0", "root.1.1"]
+    assert tree["nodes"]["root.1.0"]["choice"] == "Follow the hedgehog"
+    assert result["nodes"] == 7
+    # Every page has its own history, but the fake tells the same page every time:
+    # one narration clip, one illustration and one clip and icon per choice serve all of them
+    assert calls(client, "chat") == 7
+    assert calls(client, "tts") == 3
+    assert len(image_calls) == 3
+    assert result["provider_calls"] == 13
+    node = tree["nodes"]["root.0.1"]
+    for media_id in [node["narration"], node["main_illustration"]] + [choice["image"] for choice in node["choices"]]:
+        assert os.path.exists(tmp_path / "media" / media_id[:2] / media_id)
+
+def test_interrupted_run_resumes_from_checkpoint(monkeypatch, tmp_path):
+    prerender, image_calls = load_prerender(monkeypatch)
+    first = FakeOpenAI()
+    assert run(prerender, first, tmp_path, max_nodes=3)["nodes"] == 3
+
+    second = FakeOpenAI()
+    result = run(prerender, second, tmp_path)
+    assert result["nodes"] == 7
+    # Only the four grandchildren are new; their media was already rendered
+    assert calls(second, "chat") == 4
+    assert calls(second, "tts") == 0
+    assert len(image_calls) == 3
+    assert result["provider_calls"] == 13
+
+def test_provider_call_budget_stops_the_run_and_keeps_finished_work(monkeypatch, tmp_path):
+    prerender, _ = load_prerender(monkeypatch)
+    first = FakeOpenAI()
+    result = run(prerender, first, tmp_path, max_provider_calls=1)
+    assert result["nodes"] == 0
+    assert result["provider_calls"] == 1
+
+    second = FakeOpenAI()
+    assert run(prerender, second, tmp_path, depth=0)["nodes"] == 1
+    # The opening text from the stopped run is reused
+    assert calls(second, "chat") == 0
+
+def test_rendered_tree_exports_to_a_story_pack(monkeypatch, tmp_path):
+    prerender, _ = load_prerender(monkeypatch)
+    run(prerender, FakeOpenAI(), tmp_path / "tree", depth=1)
+    tree = prerender.StoryTree(str(tmp_path / "tree"), CONFIG)
+    assert prerender.export_pack(tree, str(tmp_path / "story.pack")) == 3
+
+    from jobs.packs import StoryPack
+    pack = StoryPack(str(tmp_path / "story.pack"))
+    try:
+        first_choice = pack.node("root")["choices"][0]
+        assert pack.child("root", first_choice["text"]) == "root.0"
+        # Past the rendered depth a choice leads nowhere
+        assert all(choice["next"] is None for choice in pack.node("root.0")["choices"])
+        assert pack.media(first_choice["image"]) == tree.media.get(first_choice["image"])
+    finally:
+        pack.close()
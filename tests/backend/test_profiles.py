@@ -0,0 +1,92 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from backend.generation import config as config_module
+from backend.generation.config import BACKEND_DIR, GenerationConfig, config_path, refresh_config
+from backend.generation.profiles import ProfileRegistry
+from tests.backend.fakes import load_backend_app
+
+MARTON = "child_info:\n  name: Marton\n  age: 5\npersonalization:\n  favourite_animal: pig\n"
+ANNA = "child_info:\n  name: Anna\n  age: 7\n"
+
+def touch(path, text: str):
+    """Writes a file and moves its mtime on, so the change is seen even within one clock tick."""
+    previous = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    path.write_text(text)
+    os.utime(path, ns=(previous + 10**9, previous + 10**9))
+
+def make_registry(tmp_path) -> ProfileRegistry:
+    touch(tmp_path / "config.yaml", MARTON)
+    (tmp_path / "profiles").mkdir()
+    touch(tmp_path / "profiles" / "anna.yaml", ANNA)
+    return ProfileRegistry(str(tmp_path / "config.yaml"), str(tmp_path / "profiles"))
+
+def test_profiles_are_parsed_once_and_reloaded_on_change(tmp_path):
+    registry = make_registry(tmp_path)
+    default, anna = registry.get(), registry.get("anna")
+    assert default.config["child_info"]["name"] == "Marton" and anna.config["child_info"]["age"] == 7
+    assert "Marton" in default.system_prompt and "Anna" in anna.system_prompt
+    assert default.system_prompt is default.system_prompt
+    assert registry.refresh() == []
+
+    touch(tmp_path / "profiles" / "anna.yaml", ANNA.replace("7", "8"))
+    etag = anna.etag
+    assert registry.refresh() == ["anna"]
+    assert registry.get("anna").etag != etag and registry.get() is default
+
+    # A half-written file keeps the last good version; a deleted one is dropped
+    touch(tmp_path / "config.yaml", "child_info: [unclosed")
+    assert registry.refresh() == [] and registry.get() is default and "default" in registry.errors
+    os.remove(tmp_path / "profiles" / "anna.yaml")
+    assert registry.refresh() == ["anna"] and registry.get("anna") is None
+
+def test_prompt_follows_a_reloaded_template(monkeypatch, tmp_path):
+    shared = config_module.config
+    for name in GenerationConfig.model_fields:
+        monkeypatch.setattr(shared, name, getattr(shared, name))
+    source = tmp_path / "generator_config.yaml"
+    with open(config_path()) as file:
+        text = file.read()
+    touch(source, text)
+    monkeypatch.setitem(config_module._loaded, "path", str(source))
+    monkeypatch.setitem(config_module._loaded, "version", None)
+    assert refresh_config()
+
+    profile = make_registry(tmp_path).get()
+    before = profile.system_prompt
+    touch(source, text + "\nstory_prompt: \"A short tale for {name}, age {age}. {details}\"\n")
+    assert refresh_config() and not refresh_config()
+    assert shared.story_prompt.startswith("A short tale")
+    assert profile.system_prompt == "A short tale for Marton, age 5. favourite animal is pig" != before
+
+    # A broken edit leaves the running config alone
+    touch(source, "providers: [")
+    assert not refresh_config()
+    assert shared.story_prompt.startswith("A short tale")
+
+def test_config_path_falls_back_to_the_backend_folder(monkeypatch, tmp_path):
+    monkeypatch.delenv("STORY_GENERATOR_CONFIG", raising=False)
+    monkeypatch.chdir(tmp_path)
+    assert config_path() == os.path.join(BACKEND_DIR, "generator_config.yaml")
+    monkeypatch.setenv("STORY_GENERATOR_CONFIG", "/etc/story.yaml")
+    assert config_path() == "/etc/story.yaml"
+
+def test_config_endpoints_use_etags_and_sessions_take_a_profile(monkeypatch, tmp_path):
+    main = load_backend_app(monkeypatch)
+    main.app.state.profiles = make_registry(tmp_path)
+    with TestClient(main.app) as http:
+        response = http.get("/config")
+        assert response.json()["child_info"]["name"] == "Marton"
+        assert http.get("/config", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+        assert set(http.get("/profiles").json()["profiles"]) == {"default", "anna"}
+        assert http.get("/profiles/missing").status_code == 404
+
+        session_id = http.post("/sessions", json={"profile_id": "anna"}).json()["session_id"]
+        assert main.app.state.sessions.get(session_id).config["child_info"]["name"] == "Anna"
+        assert http.post("/sessions", json={"profile_id": "missing"}).status_code == 404
+
+        # The first page of a profile's session uses the prompt memoized on the profile
+        session = main.app.state.sessions.get(session_id)
+        assert session.profile_id == "anna"
+        assert main.opening_prompt(session.config, "anna") is main.app.state.profiles.get("anna").system_prompt
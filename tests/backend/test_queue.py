@@ -0,0 +1,141 @@
+import asyncio
+import tempfile
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.jobs.queue import JobQueue
+from tests.backend.fakes import FakeOpenAI, import_backend_module, install_fakes, load_backend_app, wait_for_job
+
+CONFIG = {"child_photo_path": "x.png", "voice": "onyx", "child_info": {"name": "Marton", "age": 5}}
+
+def test_claims_follow_priority_and_expired_leases_move_on(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=0.2, max_attempts=2)
+    queue.enqueue("speculative", {"n": 1}, priority=1)
+    queue.enqueue("interactive", {"n": 2}, priority=0)
+
+    claimed = queue.claim("worker-a")
+    assert claimed["job_id"] == "interactive" and claimed["payload"] == {"n": 2}
+    assert queue.heartbeat("interactive", "worker-a") == {"cancel_requested": False, "priority": 0}
+    assert queue.claim("worker-a")["job_id"] == "speculative"
+    assert queue.claim("worker-b") is None
+
+    # worker-a dies: once its lease runs out, worker-b takes the job over and worker-a may no longer write
+    time.sleep(0.3)
+    taken = queue.claim("worker-b")["job_id"]
+    assert queue.get(taken)["attempts"] == 2
+    assert queue.heartbeat(taken, "worker-a") is None
+    assert queue.publish(taken, "worker-a", "status", {"status": "complete"}, {"status": "complete"}) is False
+    assert queue.publish(taken, "worker-b", "status", {"status": "complete"}, {"status": "complete", "result": {"ok": 1}})
+    assert queue.get(taken)["state"] == "finished" and queue.get(taken)["result"] == {"ok": 1}
+
+    # The other job's workers keep dying; after max_attempts it fails instead of being retried again
+    other = "speculative" if taken == "interactive" else "interactive"
+    time.sleep(0.3)
+    assert queue.claim("worker-c")["job_id"] == other
+    time.sleep(0.3)
+    assert queue.claim("worker-d") is None
+    assert queue.get(other)["status"] == "failed"
+    assert [event for _, event, _ in queue.events_after(other, 0)] == ["status"]
+
+def test_cancelling_queued_and_running_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.sqlite3"))
+    queue.enqueue("waiting", {}, priority=1, group="page")
+    queue.enqueue("running", {}, priority=0, group="page")
+    assert queue.claim("worker")["job_id"] == "running"
+    assert queue.siblings("page", "running") == ["waiting"]
+
+    assert queue.request_cancel("waiting")
+    assert queue.get("waiting")["status"] == "cancelled"
+    assert queue.request_cancel("running")
+    assert queue.heartbeat("running", "worker")["cancel_requested"] is True
+    assert queue.stats()["queued"] == 0 and queue.stats()["running"] == 1
+
+def use_queue(main, path: str, media_directory: str):
+    main.app.state.queue = main.JobQueue(path)
+    main.app.state.sessions = main.SharedSessionStore(path, 3600)
+    main.media_store = main.MediaStore(media_directory)
+
+def test_jobs_run_in_a_worker_and_any_api_process_answers(monkeypatch, tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    media_directory = tempfile.mkdtemp(prefix="story-media-")
+    api = load_backend_app(monkeypatch)
+    use_queue(api, path, media_directory)
+    worker = import_backend_module(monkeypatch, "worker")
+    install_fakes(monkeypatch, worker.main, FakeOpenAI())
+    use_queue(worker.main, path, media_directory)
+    other_api = load_backend_app(monkeypatch)
+    use_queue(other_api, path, media_directory)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(worker.run_worker("test-worker", 4, stop),))
+    thread.start()
+    try:
+        with TestClient(api.app) as http, TestClient(other_api.app) as other_http:
+            session_id = http.post("/sessions", json={"config": CONFIG}).json()["session_id"]
+            first_id = http.post("/generate/start", json={"session_id": session_id}).json()["job_id"]
+            # Status, result and the event stream work through an API process that never saw the job
+            assert wait_for_job(other_http, first_id) == "complete"
+            first = other_http.get(f"/generate/result/{first_id}").json()
+            assert first["segment_id"] == first_id and len(first["choices"]) == 2
+            assert other_http.get(first["narration_audio_url"]).status_code == 200
+            stream = other_http.get(f"/generate/stream/{first_id}").text
+            assert "event: token" in stream and "event: media" in stream
+
+            # The session lives in the shared store, so the next page can be asked for anywhere
+            next_id = other_http.post("/generate/start", json={
+                "session_id": session_id, "segment_id": first_id, "choice": first["choices"][0]["text"]
+            }).json()["job_id"]
+            assert wait_for_job(http, next_id) == "complete"
+            assert http.get("/jobs/stats").json()["queue"]["finished"] == 2
+            # The provider figures come from the worker, which made the calls
+            assert "openai_text" in other_http.get("/scheduler/stats").json()["workers"]["test-worker"]
+    finally:
+        stop.set()
+        thread.join()
+    # Reports are written every heartbeat; the one written on stopping covers both pages
+    assert api.app.state.queue.worker_stats(60)["test-worker"]["scheduler"]["openai_text"]["calls"] >= 2
+    assert api.client.calls == [] and other_api.client.calls == []
+
+def test_a_worker_writes_streamed_tokens_in_batches(monkeypatch, tmp_path):
+    worker = import_backend_module(monkeypatch, "worker")
+    queue = JobQueue(str(tmp_path / "queue.sqlite3"))
+    queue.enqueue("job", {}, 0)
+    queue.claim("worker-a")
+    writes = []
+    publish_many = queue.publish_many
+    monkeypatch.setattr(queue, "publish_many", lambda *args: writes.append(len(args[2])) or publish_many(*args))
+
+    async def run():
+        job = {"status": "generating_text"}
+        events = worker.QueueEvents(queue, "job", "worker-a", job)
+        for i in range(20):
+            await events.publish("token", {"text": str(i)})
+        await events.publish("status", {"status": "generating_text"})
+        await events.publish("token", {"text": "last"})
+        await events.close()
+
+    asyncio.run(run())
+    assert writes == [21, 1]
+    written = queue.events_after("job", 0)
+    assert [data.get("text") for _, _, data in written] == [str(i) for i in range(20)] + [None, "last"]
+
+def test_a_job_taken_over_does_not_stream_its_narrative_twice(monkeypatch, tmp_path):
+    worker = import_backend_module(monkeypatch, "worker")
+    queue = JobQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=0.1)
+    queue.enqueue("job", {}, 0)
+    queue.claim("worker-a")
+    queue.publish_many("job", "worker-a", [("token", {"text": "Once"}), ("token", {"text": " upon"})])
+    time.sleep(0.2)
+    claimed = queue.claim("worker-b")
+    assert claimed["attempts"] == 2 and queue.has_streamed("job")
+
+    async def rerun():
+        events = worker.QueueEvents(queue, "job", "worker-b", {"status": "generating_text"}, resumed=True)
+        await events.publish("token", {"text": "Once"})
+        await events.publish("story", {"story_text": "Once upon a time."})
+        await events.close()
+
+    asyncio.run(rerun())
+    assert [event for _, event, _ in queue.events_after("job", 0)] == ["token", "token", "story"]
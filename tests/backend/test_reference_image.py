@@ -0,0 +1,49 @@
+import os
+
+from PIL import Image
+
+from backend.generation import reference
+from backend.generation.config import ReferenceImageConfig
+
+def write_photo(path, size=(2000, 1500), color=(200, 120, 80)):
+    Image.new("RGB", size, color).save(path)
+
+def test_photo_is_decoded_once_and_prepared_for_upload(tmp_path, monkeypatch):
+    photo = tmp_path / "child.png"
+    write_photo(photo)
+    decoded = []
+    original_prepare = reference.prepare_reference_image
+    monkeypatch.setattr(reference, "prepare_reference_image",
+                        lambda path, settings: decoded.append(path) or original_prepare(path, settings))
+    settings = ReferenceImageConfig(size=512)
+
+    first = reference.load_reference_image(str(photo), settings)
+    second = reference.load_reference_image(str(photo), settings)
+
+    assert first is second
+    assert len(decoded) == 1
+    assert first.size == (512, 512)
+    assert first.mime_type == "image/jpeg"
+    assert first.as_part()["data"] == first.data
+    assert len(first.data) < os.path.getsize(photo)
+
+def test_changed_photo_is_prepared_again(tmp_path):
+    photo = tmp_path / "child.png"
+    write_photo(photo)
+    settings = ReferenceImageConfig(size=256)
+    before = reference.load_reference_image(str(photo), settings)
+
+    write_photo(photo, color=(10, 20, 30))
+    stat = os.stat(photo)
+    os.utime(photo, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    after = reference.load_reference_image(str(photo), settings)
+
+    assert after is not before
+    assert after.digest != before.digest
+
+def test_small_photos_are_cropped_but_not_upscaled(tmp_path):
+    photo = tmp_path / "small.png"
+    write_photo(photo, size=(300, 200))
+    prepared = reference.load_reference_image(str(photo), ReferenceImageConfig(size=768, format="PNG"))
+    assert prepared.size == (200, 200)
+    assert prepared.mime_type == "image/png"
@@ -0,0 +1,40 @@
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend.generation.renditions import make_rendition
+from tests.backend.fakes import load_backend_app, wait_for_job
+
+def png_bytes(size=(1400, 1000)) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, (40, 90, 160)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def test_make_rendition_fits_size_and_reencodes():
+    rendition = make_rendition(png_bytes(), 700, "WEBP", 80)
+    with Image.open(BytesIO(rendition)) as image:
+        assert image.format == "WEBP"
+        assert image.size == (700, 500)
+
+def test_results_link_display_renditions(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    original = png_bytes()
+
+    async def real_image_bytes(prompt, reference_image, high_quality=False):
+        return original
+
+    monkeypatch.setattr(main, "generate_image_bytes", real_image_bytes)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png"}}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        result = http.get(f"/generate/result/{job_id}").json()
+        main_image = http.get(result["main_illustration_url"])
+        choice_image = http.get(result["choices"][0]["image_url"])
+
+    assert main_image.headers["content-type"] == "image/webp"
+    assert len(main_image.content) < len(original)
+    with Image.open(BytesIO(main_image.content)) as image:
+        assert max(image.size) == 700
+    with Image.open(BytesIO(choice_image.content)) as image:
+        assert max(image.size) == 250
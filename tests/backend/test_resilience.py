@@ -0,0 +1,148 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.generation import config as config_module
+from backend.generation import generators
+from backend.generation.cache import MediaCache
+from backend.generation.clients import create_openai_client
+from backend.generation.config import ProviderLimitConfig, ResilienceConfig
+from backend.generation.resilience import CircuitOpenError, ResilientCaller, RetryBudget
+from backend.generation.scheduler import ProviderScheduler, schedulers
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def make_caller(monkeypatch, budget: RetryBudget | None = None, **settings) -> ResilientCaller:
+    defaults = dict(backoff_base_seconds=0.01, hedge_min_samples=5)
+    monkeypatch.setattr(config_module.config, "resilience", ResilienceConfig(**{**defaults, **settings}))
+    monkeypatch.setitem(schedulers, "test", ProviderScheduler("test", ProviderLimitConfig(max_concurrency=10, latency_target_seconds=60)))
+    return ResilientCaller("test", budget or RetryBudget(0.1, 10))
+
+def scripted(*outcomes):
+    """A provider call that plays back one outcome per call: (delay, value or exception)."""
+    calls = []
+
+    async def make():
+        delay, outcome = outcomes[min(len(calls), len(outcomes) - 1)]
+        calls.append(outcome)
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return make, calls
+
+def test_a_call_past_the_p95_is_hedged_and_the_copy_wins(monkeypatch):
+    caller = make_caller(monkeypatch)
+    for _ in range(10):
+        caller.latencies.add(0.02)
+    make, calls = scripted((5.0, "slow"), (0.01, "fast"))
+
+    started = time.monotonic()
+    assert asyncio.run(caller.call(make)) == "fast"
+    assert time.monotonic() - started < 1.0
+    assert len(calls) == 2 and caller.stats["hedges"] == caller.stats["hedge_wins"] == 1
+    # Fast calls are not hedged
+    make, calls = scripted((0.0, "quick"))
+    assert asyncio.run(caller.call(make)) == "quick" and len(calls) == 1 and caller.stats["hedges"] == 1
+
+def test_transient_errors_are_retried_within_the_budget(monkeypatch):
+    caller = make_caller(monkeypatch, hedge=False)
+    make, calls = scripted((0, ProviderError(503)), (0, ProviderError(503)), (0, "ok"))
+    assert asyncio.run(caller.call(make)) == "ok" and len(calls) == 3 and caller.stats["retries"] == 2
+
+    make, calls = scripted((0, ProviderError(400)))
+    with pytest.raises(ProviderError):
+        asyncio.run(caller.call(make))
+    assert len(calls) == 1
+
+    # With the budget spent, a failing provider sees one retry, not max_attempts per call
+    stingy = make_caller(monkeypatch, RetryBudget(0.0, 1.0), hedge=False)
+    for expected_calls in (2, 1):
+        make, calls = scripted((0, ProviderError(500)))
+        with pytest.raises(ProviderError):
+            asyncio.run(stingy.call(make))
+        assert len(calls) == expected_calls
+    assert stingy.stats["budget_denied"] == 2
+
+def test_breaker_opens_on_sustained_failures_and_closes_after_a_good_probe(monkeypatch):
+    caller = make_caller(monkeypatch, max_attempts=1, breaker_failure_threshold=2, breaker_open_seconds=0.05)
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            asyncio.run(caller.call(scripted((0, ProviderError(502)))[0]))
+    assert caller.breaker.state == "open"
+
+    make, calls = scripted((0, "ok"))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call(make))
+    assert calls == [] and caller.stats["short_circuited"] == 1
+
+    time.sleep(0.06)
+    assert asyncio.run(caller.call(make)) == "ok" and caller.breaker.state == "closed"
+
+def test_a_stream_is_retried_only_before_its_first_item(monkeypatch):
+    caller = make_caller(monkeypatch)
+    opened = []
+
+    def open_stream(fail_after: int):
+        async def items():
+            opened.append(fail_after)
+            for i in range(3):
+                if i == fail_after:
+                    raise ProviderError(503)
+                yield i
+        return items()
+
+    async def collect(fail_first_at: int):
+        attempts = iter([fail_first_at, 3])
+        return [item async for item in caller.stream(lambda: open_stream(next(attempts)))]
+
+    assert asyncio.run(collect(0)) == [0, 1, 2] and opened == [0, 3]
+    opened.clear()
+    with pytest.raises(ProviderError):
+        asyncio.run(collect(1))
+    assert opened == [1]
+
+def test_an_empty_image_response_is_retried(monkeypatch):
+    make_caller(monkeypatch, hedge=False)
+    monkeypatch.setitem(schedulers, "gemini_image", schedulers["test"])
+    monkeypatch.setitem(generators.callers, "gemini_image", ResilientCaller("gemini_image", RetryBudget(0.1, 10)))
+    monkeypatch.setattr(generators, "media_cache", MediaCache(None, 0, 0))
+    responses = [[], [SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(inline_data=SimpleNamespace(data=b"png"))]))]]
+
+    class FlakyImageModel:
+        async def generate_content_async(self, contents):
+            return SimpleNamespace(candidates=responses.pop(0))
+
+    monkeypatch.setattr(generators, "get_image_model", lambda model_name: FlakyImageModel())
+    assert asyncio.run(generators.generate_image_bytes("a fox", None)) == b"png"
+    assert responses == []
+
+def test_the_openai_sdk_does_not_retry_underneath_the_resilience_layer(monkeypatch):
+    make_caller(monkeypatch)
+    assert create_openai_client("fake").max_retries == 0
+    monkeypatch.setattr(config_module.config.resilience, "enabled", False)
+    assert create_openai_client("fake").max_retries == config_module.config.http.max_retries
+
+def test_only_hedge_losers_count_as_slow_calls(monkeypatch):
+    caller = make_caller(monkeypatch)
+    for _ in range(10):
+        caller.latencies.add(0.02)
+
+    async def cancelled_job():
+        make, _ = scripted((5.0, "never"))
+        task = asyncio.ensure_future(caller.call(make))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    # A call cut off because its job was cancelled adds no sample
+    asyncio.run(cancelled_job())
+    assert len(caller.latencies.samples) == 10
+    # The primary that lost to its hedge does, with the time it ran
+    asyncio.run(caller.call(scripted((5.0, "slow"), (0.01, "fast"))[0]))
+    assert len(caller.latencies.samples) == 12 and max(caller.latencies.samples) >= 0.02
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from backend.generation.config import ProviderLimitConfig, config as gen_config
+from backend.generation.scheduler import (
+    INTERACTIVE, SPECULATIVE, PriorityRef, ProviderScheduler, TokenBucket, current_priority, schedulers, share_limits
+)
+
+class RateLimitError(Exception):
+    status_code = 429
+
+def test_concurrency_cap_and_priority_order():
+    scheduler = ProviderScheduler("test", ProviderLimitConfig(max_concurrency=1, latency_target_seconds=60))
+    order = []
+
+    async def call(name, priority):
+        current_priority.set(PriorityRef(priority))
+        async with scheduler.slot():
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        first = asyncio.create_task(call("first", SPECULATIVE))
+        await asyncio.sleep(0)
+        speculative = asyncio.create_task(call("speculative", SPECULATIVE))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call("interactive", INTERACTIVE))
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["queued"] == 2
+        await asyncio.gather(first, speculative, interactive)
+
+    asyncio.run(run())
+    assert order == ["first", "interactive", "speculative"]
+    assert scheduler.in_flight == 0
+
+def test_promoting_a_queued_call_moves_it_ahead():
+    scheduler = ProviderScheduler("test", ProviderLimitConfig(max_concurrency=1, latency_target_seconds=60))
+    order = []
+
+    async def call(name, ref):
+        current_priority.set(ref)
+        async with scheduler.slot():
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        promoted = PriorityRef(SPECULATIVE)
+        tasks = [asyncio.create_task(call("blocker", PriorityRef(INTERACTIVE)))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("other", PriorityRef(SPECULATIVE))))
+        tasks.append(asyncio.create_task(call("promoted", promoted)))
+        await asyncio.sleep(0)
+        promoted.value = INTERACTIVE
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["blocker", "promoted", "other"]
+
+def test_aimd_backs_off_on_429_and_recovers():
+    scheduler = ProviderScheduler("test", ProviderLimitConfig(max_concurrency=8, latency_target_seconds=60))
+
+    async def throttled_call():
+        async with scheduler.slot():
+            raise RateLimitError()
+
+    async def ok_call():
+        async with scheduler.slot():
+            pass
+
+    async def run():
+        try:
+            await throttled_call()
+        except RateLimitError:
+            pass
+        after_throttle = scheduler.limit
+        for _ in range(20):
+            await ok_call()
+        return after_throttle
+
+    after_throttle = asyncio.run(run())
+    assert after_throttle == 4
+    assert 4 < scheduler.limit <= 8
+    assert scheduler.stats["throttled"] == 1
+
+def test_token_bucket_delays_once_exhausted():
+    bucket = TokenBucket(per_minute=600)
+
+    async def run():
+        await bucket.acquire(600)
+        start = time.monotonic()
+        await bucket.acquire(2)
+        return time.monotonic() - start
+
+    assert 0.1 < asyncio.run(run()) < 1
+
+def test_interactive_calls_get_rate_limit_tokens_first():
+    scheduler = ProviderScheduler("test", ProviderLimitConfig(max_concurrency=4, requests_per_minute=600, latency_target_seconds=60))
+    scheduler.requests.take(600)
+    order = []
+
+    async def call(name, priority):
+        current_priority.set(PriorityRef(priority))
+        async with scheduler.slot():
+            order.append(name)
+
+    async def run():
+        tasks = [asyncio.create_task(call(f"spec{i}", SPECULATIVE)) for i in range(4)]
+        await asyncio.sleep(0)
+        # Calls waiting for tokens do not sit on the slots
+        assert scheduler.in_flight == 0 and scheduler.snapshot()["queued"] == 4
+        tasks.append(asyncio.create_task(call("interactive", INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive", "spec0", "spec1", "spec2", "spec3"]
+    assert scheduler.in_flight == 0
+
+def test_worker_processes_share_the_provider_limits(monkeypatch):
+    limits = ProviderLimitConfig(max_concurrency=8, requests_per_minute=500, tokens_per_minute=30000)
+    for name in schedulers:
+        monkeypatch.setattr(gen_config.limits, name, limits)
+        monkeypatch.setitem(schedulers, name, ProviderScheduler(name, limits))
+    share_limits(4)
+    scheduler = schedulers["openai_text"]
+    assert scheduler.limits.max_concurrency == 2 and scheduler.limit == 2
+    assert scheduler.requests.capacity == 125 and scheduler.tokens.capacity == 7500
@@ -0,0 +1,78 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from backend.generation import compaction
+from backend.generation.compaction import SUMMARY_PREFIX, compact_history
+from tests.backend.fakes import FakeOpenAI, load_backend_app, wait_for_job
+
+CONFIG = {"child_photo_path": "x.png", "voice": "onyx", "child_info": {"name": "Marton", "age": 5}}
+
+def long_history(pages: int) -> list:
+    history = [{"role": "system", "content": "You are a storyteller."}, {"role": "user", "content": "Let's begin."}]
+    for page in range(pages):
+        history.append({"role": "assistant", "content": f"Page {page}. " + "The hedgehog walked on. " * 80})
+        history.append({"role": "user", "content": f"Choice {page}"})
+    return history
+
+def test_compaction_keeps_system_prompt_and_recent_turns(monkeypatch):
+    monkeypatch.setattr(compaction.gen_config.compaction, "threshold_tokens", 1000)
+    client = FakeOpenAI(response_text="Marton met a hedgehog.")
+    history = long_history(10)
+
+    compacted = asyncio.run(compact_history(client, history))
+
+    assert compacted[0] == history[0]
+    assert compacted[1] == {"role": "system", "content": SUMMARY_PREFIX + "Marton met a hedgehog."}
+    # The cut moves back so a page is never kept without the choice that led to it
+    assert compacted[2:] == history[-5:]
+    # Short histories are left alone and cost no summary call
+    assert asyncio.run(compact_history(client, history[:4])) == history[:4]
+    assert sum(1 for kind, _ in client.calls if kind == "chat") == 1
+
+    # With no recent turns kept, everything after the system prompt is summarized
+    monkeypatch.setattr(compaction.gen_config.compaction, "keep_recent_messages", 0)
+    assert asyncio.run(compact_history(client, history))[1:] == [compacted[1]]
+
+def test_session_requests_send_only_ids(monkeypatch):
+    client = FakeOpenAI()
+    main = load_backend_app(monkeypatch, client)
+    with TestClient(main.app) as http:
+        session_id = http.post("/sessions", json={"config": CONFIG}).json()["session_id"]
+        first_id = http.post("/generate/start", json={"session_id": session_id}).json()["job_id"]
+        assert wait_for_job(http, first_id) == "complete"
+        first = http.get(f"/generate/result/{first_id}").json()
+        assert "conversation_history" not in first
+        assert first["segment_id"] == first_id
+
+        choice = first["choices"][0]["text"]
+        second_id = http.post("/generate/start", json={
+            "session_id": session_id, "segment_id": first["segment_id"], "choice": choice
+        }).json()["job_id"]
+        assert wait_for_job(http, second_id) == "complete"
+
+        missing = http.post("/generate/start", json={"session_id": session_id, "segment_id": "nope", "choice": choice})
+        assert missing.status_code == 404
+
+    prompts = [kwargs["messages"] for kind, kwargs in client.calls if kind == "chat"]
+    # The second prompt continues the first page from the history stored in the session
+    assert prompts[1][2]["role"] == "assistant"
+    assert prompts[1][3] == {"role": "user", "content": choice}
+
+def test_keep_only_cancels_siblings_in_the_same_session(monkeypatch):
+    main = load_backend_app(monkeypatch, FakeOpenAI(token_delay=0.05))
+    with TestClient(main.app) as http:
+        pages = []
+        for _ in range(2):
+            session_id = http.post("/sessions", json={"config": CONFIG}).json()["session_id"]
+            first_id = http.post("/generate/start", json={"session_id": session_id}).json()["job_id"]
+            assert wait_for_job(http, first_id) == "complete"
+            pages.append((session_id, first_id))
+        choice = http.get(f"/generate/result/{pages[0][1]}").json()["choices"][0]["text"]
+        # Both children see the same page; each pre-generates the same choice
+        branches = [
+            http.post("/generate/start", json={"session_id": session_id, "segment_id": segment_id, "choice": choice}).json()["job_id"]
+            for session_id, segment_id in pages
+        ]
+        assert http.post(f"/generate/{branches[0]}/keep").json()["cancelled"] == []
+        assert wait_for_job(http, branches[1]) == "complete"
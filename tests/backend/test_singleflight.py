@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+
+from backend.jobs.singleflight import SingleFlight, request_fingerprint
+from tests.backend.fakes import FakeOpenAI, load_backend_app, wait_for_job
+
+CONFIG = {"child_photo_path": "x.png", "voice": "onyx", "child_info": {"name": "Marton", "age": 5}}
+
+def test_fingerprint_ignores_irrelevant_config_and_key_order():
+    history = [{"role": "user", "content": "Let's begin.", "name": "a"}]
+    reordered = [{"name": "a", "content": "Let's begin.", "role": "user"}]
+    assert request_fingerprint(history, "Go left", CONFIG) == request_fingerprint(
+        reordered, "Go left", {**CONFIG, "intro_video_path": "data/other.mp4"}
+    )
+    assert request_fingerprint(history, "Go left", CONFIG) != request_fingerprint(history, "Go right", CONFIG)
+    assert request_fingerprint(history, "Go left", CONFIG) != request_fingerprint(history, "Go left", {**CONFIG, "voice": "nova"})
+
+def test_failed_jobs_are_not_reused():
+    flight = SingleFlight(reuse_window=60)
+    flight.register("fp", "job-1")
+    assert flight.lookup("fp", lambda job_id: "generating_text") == ("job-1", "coalesced")
+    assert flight.lookup("fp", lambda job_id: "failed") is None
+    assert flight.lookup("fp", lambda job_id: "complete") is None
+
+def test_duplicate_requests_share_one_job(monkeypatch):
+    client = FakeOpenAI(token_delay=0.05)
+    main = load_backend_app(monkeypatch, client)
+    with TestClient(main.app) as http:
+        first = http.post("/generate/start", json={"config": CONFIG}).json()
+        duplicate = http.post("/generate/start", json={"config": CONFIG}).json()
+        assert duplicate == {"job_id": first["job_id"], "reused": True}
+
+        # One requester letting go must not cancel the job for the other one
+        assert http.delete(f"/generate/{first['job_id']}").json()["cancelled"] is False
+        assert wait_for_job(http, first["job_id"]) == "complete"
+
+        replay = http.post("/generate/start", json={"config": CONFIG}).json()
+        assert replay["job_id"] == first["job_id"]
+        stats = http.get("/jobs/stats").json()["singleflight"]
+
+    assert sum(1 for kind, _ in client.calls if kind == "chat") == 1
+    assert stats == {"started": 1, "coalesced": 1, "reused": 1}
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.jobs.events import JobEvents
+from tests.backend.fakes import load_backend_app, wait_for_job
+
+def test_long_poll_returns_as_soon_as_status_changes(monkeypatch):
+    main = load_backend_app(monkeypatch)
+
+    async def run():
+        main.app.state.jobs.create("job", {"status": "pending", "events": JobEvents()})
+        waiter = asyncio.create_task(main.get_status("job", wait=10, known="pending"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        start = time.monotonic()
+        await main.set_job_status("job", "generating_text")
+        response = await waiter
+        return response, time.monotonic() - start
+
+    response, latency = asyncio.run(run())
+    assert response == {"job_id": "job", "status": "generating_text", "readable": False, "assets": None, "timings": None}
+    assert latency < 0.5
+
+def test_long_poll_times_out_with_unchanged_status(monkeypatch):
+    main = load_backend_app(monkeypatch)
+
+    async def run():
+        main.app.state.jobs.create("job", {"status": "pending", "events": JobEvents()})
+        return await main.get_status("job", wait=0.1, known="pending")
+
+    assert asyncio.run(run())["status"] == "pending"
+
+def test_websocket_pushes_each_status_until_complete(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png"}}).json()["job_id"]
+        with http.websocket_connect(f"/generate/ws/{job_id}") as socket:
+            messages = [socket.receive_json()]
+            while messages[-1]["status"] != "complete":
+                messages.append(socket.receive_json())
+        # Finished assets are pushed too, but each status change only once
+        statuses = [message["status"] for i, message in enumerate(messages)
+                    if i == 0 or message["status"] != messages[i - 1]["status"]]
+        assert len(statuses) == len(set(statuses))
+        assert any(message["readable"] for message in messages[:-1])
+        with http.websocket_connect("/generate/ws/unknown") as socket:
+            assert socket.receive_json()["status"] == "not_found"
+
+def test_batch_status_reports_every_job(monkeypatch):
+    main = load_backend_app(monkeypatch)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png"}}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        statuses = http.post("/generate/status", json={"job_ids": [job_id, "unknown"]}).json()["statuses"]
+    assert statuses[job_id]["status"] == "complete"
+    assert statuses[job_id]["readable"] is True
+    assert statuses["unknown"]["status"] == "not_found"
@@ -0,0 +1,104 @@
+import random
+
+from fastapi.testclient import TestClient
+
+from backend.generation.generators import StoryStreamParser, parse_story_and_choices
+from tests.backend.fakes import STORY_RESPONSE, FakeOpenAI, fake_image_bytes, load_backend_app, wait_for_job
+
+NUMBERED_RESPONSE = (
+    "Marton and the hedgehog reached a river.\n"
+    "The water sparkled in the moonlight.\n"
+    "What should they do?\n"
+    "1. Build a little raft\n"
+    "2) Ask the friendly frog for help\n"
+    "3. Walk along the bank"
+)
+
+def chunkings(text: str):
+    """Every split into two chunks, single characters, and a few random splits."""
+    for cut in range(len(text) + 1):
+        yield [text[:cut], text[cut:]]
+    yield list(text)
+    rng = random.Random(7)
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(1, len(text)), 6))
+        yield [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+def run_parser(chunks):
+    parser = StoryStreamParser()
+    events = []
+    for chunk in chunks:
+        events += [(len(parser.text), event) for event in parser.feed(chunk)]
+    narrative, choices, final_events = parser.finish()
+    return narrative, choices, events, final_events
+
+def test_bracketed_choices_are_emitted_as_each_bracket_closes():
+    expected_story, expected_choices = parse_story_and_choices(STORY_RESPONSE)
+    for chunks in chunkings(STORY_RESPONSE):
+        narrative, choices, events, final_events = run_parser(chunks)
+        assert (narrative, choices) == (expected_story, expected_choices)
+        assert final_events == []
+        assert [event for _, event in events] == [("narrative", expected_story)] + [
+            ("choice", i, choice) for i, choice in enumerate(expected_choices)
+        ]
+        # Nothing is emitted before the text that determines it has arrived
+        seen, _ = events[1]
+        assert seen >= STORY_RESPONSE.index("]") + 1
+
+def test_numbered_choices_are_emitted_per_finished_line():
+    expected_story, expected_choices = parse_story_and_choices(NUMBERED_RESPONSE)
+    for chunks in chunkings(NUMBERED_RESPONSE):
+        narrative, choices, events, final_events = run_parser(chunks)
+        assert (narrative, choices) == (expected_story, expected_choices)
+        emitted = [event for _, event in events] + final_events
+        assert emitted[0] == ("narrative", expected_story)
+        assert [event for event in emitted if event[0] == "choice"] == [
+            ("choice", i, choice) for i, choice in enumerate(expected_choices)
+        ]
+        # The first two choices are known before the stream ends; the last line only at the end
+        assert [event for _, event in events if event[0] == "choice"] == [
+            ("choice", 0, expected_choices[0]), ("choice", 1, expected_choices[1])
+        ]
+
+def test_finish_corrects_early_numbered_guess_when_brackets_follow():
+    text = "A story.\n1. Not a choice after all\nPick one: [Left] or [Right]"
+    cut = text.index("Pick")
+    narrative, choices, events, final_events = run_parser([text[:cut], text[cut:]])
+    assert (narrative, choices) == parse_story_and_choices(text)
+    assert (cut, ("choice", 0, "Not a choice after all")) in events
+    emitted = [event for _, event in events] + final_events
+    assert emitted[-3:] == [("narrative", narrative), ("choice", 0, "Left"), ("choice", 1, "Right")]
+
+class CountingOpenAI(FakeOpenAI):
+    """Counts the tokens handed out so far, to see what starts before the text is done."""
+    def __init__(self):
+        super().__init__(token_delay=0.03)
+        self.streamed = 0
+
+    def _tokens(self):
+        for token in super()._tokens():
+            self.streamed += 1
+            yield token
+
+def test_media_starts_while_the_text_is_still_streaming(monkeypatch):
+    fake = CountingOpenAI()
+    main = load_backend_app(monkeypatch, fake)
+    started = {}
+
+    async def recording_image_bytes(prompt, reference_image, high_quality=False):
+        started[prompt] = fake.streamed
+        return await fake_image_bytes(prompt, reference_image, high_quality)
+
+    monkeypatch.setattr(main, "generate_image_bytes", recording_image_bytes)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png"}}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        result = http.get(f"/generate/result/{job_id}").json()
+
+    total = len(STORY_RESPONSE.split(" "))
+    story_text, choices = parse_story_and_choices(STORY_RESPONSE)
+    assert started[story_text] < total
+    assert started[choices[0]] < total
+    # Each image is requested exactly once, and the result links all of them
+    assert len(started) == 3
+    assert all(choice["image_url"] for choice in result["choices"])
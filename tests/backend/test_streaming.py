@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+
+from backend.generation.generators import generate_story_text_stream, parse_story_and_choices
+from backend.jobs.events import JobEvents
+from tests.backend.fakes import FakeOpenAI, STORY_RESPONSE, load_backend_app
+
+def parse_sse(body: str):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_stream_yields_tokens_before_completion():
+    client = FakeOpenAI(token_delay=0.05)
+
+    async def run():
+        start = time.monotonic()
+        first_token_at = None
+        tokens = []
+        async for token in generate_story_text_stream(client, [{"role": "user", "content": "Let's begin."}]):
+            if first_token_at is None:
+                first_token_at = time.monotonic() - start
+            tokens.append(token)
+        return first_token_at, time.monotonic() - start, "".join(tokens)
+
+    first_token_at, total, text = asyncio.run(run())
+    assert text == STORY_RESPONSE
+    assert first_token_at < total / 5
+
+def test_job_events_replay_and_follow():
+    async def run():
+        events = JobEvents()
+        await events.publish("token", {"text": "Once"})
+        received = []
+
+        async def follow():
+            async for index, event, data in events.subscribe():
+                received.append((index, event, data))
+
+        follower = asyncio.create_task(follow())
+        await asyncio.sleep(0)
+        await events.publish("token", {"text": " upon"})
+        await events.close()
+        await follower
+        return received
+
+    received = asyncio.run(run())
+    assert [index for index, _, _ in received] == [0, 1]
+    assert received[1][2] == {"text": " upon"}
+
+def test_sse_endpoint_streams_tokens_choices_and_media(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    main = load_backend_app(monkeypatch)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png"}}).json()["job_id"]
+        body = http.get(f"/generate/stream/{job_id}").text
+
+    events = parse_sse(body)
+    names = [name for name, _ in events]
+    assert "".join(data["text"] for name, data in events if name == "token") == STORY_RESPONSE
+    assert names.index("story") > max(i for i, name in enumerate(names) if name == "token")
+    _, choices = parse_story_and_choices(STORY_RESPONSE)
+    assert [data["text"] for name, data in events if name == "choice"] == choices
+    media = [data["asset"] for name, data in events if name == "media"]
+    assert sum(1 for asset in media if asset != "narration_chunk") == 2 + 2 * len(choices)
+    assert events[-1] == ("status", {"status": "complete"})
@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+
+from backend.generation.generators import parse_story_and_choices
+from backend.generation.tts import concat_mp3, split_sentences, strip_id3
+from tests.backend.fakes import STORY_RESPONSE, FakeOpenAI, load_backend_app, wait_for_job
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417-byte frames
+FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+
+def frame(fill: bytes) -> bytes:
+    return FRAME_HEADER + fill * (417 - 4)
+
+def mp3_clip(fill: bytes) -> bytes:
+    id3 = b"ID3\x04\x00\x00\x00\x00\x00\x0a" + b"\x00" * 10
+    info = FRAME_HEADER + b"\x00" * 32 + b"Info" + b"\x00" * (417 - 40)
+    return id3 + info + frame(fill) + frame(fill)
+
+def test_split_sentences_merges_short_sentences():
+    text = "Hi! Marton found a tiny glowing door at the bottom of the garden. It creaked open. Yes."
+    assert split_sentences(text, min_chars=20) == [
+        "Hi! Marton found a tiny glowing door at the bottom of the garden.",
+        "It creaked open. Yes.",
+    ]
+
+def test_concat_mp3_drops_tags_and_info_frames():
+    joined = concat_mp3([mp3_clip(b"a"), mp3_clip(b"b")])
+    assert joined == frame(b"a") * 2 + frame(b"b") * 2
+    assert strip_id3(b"not audio") == b"not audio"
+
+def test_narration_reuses_choice_clips(monkeypatch):
+    client = FakeOpenAI()
+    main = load_backend_app(monkeypatch, client)
+    with TestClient(main.app) as http:
+        job_id = http.post("/generate/start", json={"config": {"child_photo_path": "x.png"}}).json()["job_id"]
+        assert wait_for_job(http, job_id) == "complete"
+        result = http.get(f"/generate/result/{job_id}").json()
+        narration = http.get(result["narration_audio_url"]).content
+        chunks = [http.get(url).content for url in result["narration_chunks"]]
+        choice_clips = [http.get(choice["audio_url"]).content for choice in result["choices"]]
+
+    story_text, choices = parse_story_and_choices(STORY_RESPONSE)
+    tts_inputs = [kwargs["input"] for kind, kwargs in client.calls if kind == "tts"]
+    # Each sentence chunk and each choice is synthesized exactly once
+    assert sorted(tts_inputs) == sorted(split_sentences(story_text) + choices)
+    assert narration == b"".join(chunks + choice_clips)